@@ -0,0 +1,45 @@
+from .common import ensure_data, datadir
+from AIAmplitudes_common_public.file_readers import convert
+from AIAmplitudes_common_public.commonclasses import Symb, fastRandomSampler
+
+class Sampler:
+    def setup(self):
+        ensure_data()
+        self.symb = convert(f'{datadir}/EZ6_symb_new_norm', 6)
+        self.extra = [(k + 'x', v) for k, v in self.symb.items()]
+
+    def time_init(self):
+        fastRandomSampler(self.symb)
+
+    def peakmem_init(self):
+        fastRandomSampler(self.symb)
+
+    def time_add(self):
+        sampler = fastRandomSampler({})
+        for k, v in self.extra: sampler.add(k, v)
+
+    def time_pop(self):
+        sampler = fastRandomSampler(self.symb)
+        for k in self.symb: sampler.popitem(k)
+
+    def time_pop_random_gen(self):
+        sampler = fastRandomSampler(self.symb)
+        for _ in sampler.pop_random_gen(len(self.symb)): pass
+
+class SymbArithmetic:
+    def setup(self):
+        ensure_data()
+        self.a = Symb(convert(f'{datadir}/EZ6_symb_new_norm', 6))
+        self.b = Symb(convert(f'{datadir}/EE33_6_symb_new_norm', 6))
+
+    def time_add(self):
+        self.a + self.b
+
+    def time_sub(self):
+        self.a - self.b
+
+    def time_mul(self):
+        3 * self.a
+
+    def peakmem_add(self):
+        self.a + self.b
@@ -0,0 +1,24 @@
+from .common import ensure_data, datadir, strike
+from AIAmplitudes_common_public.file_readers import convert
+from AIAmplitudes_common_public.preprocessing import gen_op_args, get_mapdict, opsymb_generator
+
+class Operators:
+    timeout = 300
+
+    def setup(self):
+        ensure_data()
+        self.source = convert(f'{datadir}/EZ_symb_new_norm', 5)
+        self.targets = {4: convert(f'{datadir}/EZ_symb_new_norm', 4)}
+        self.op_args = gen_op_args({"slots": {"loop": 5, "k_total": 3, "k_pairwise": 2, "numslots": 2}})
+        self.keys = list(self.source.keys())[:2000]
+        self.bad = set(list(self.targets[4].keys())[::10])
+
+    def time_get_mapdict(self):
+        for key in self.keys[:200]:
+            get_mapdict(key, self.op_args, strike, self.targets, self.bad)
+
+    def time_opsymb_generator(self):
+        opsymb_generator(self.keys, self.targets, self.bad, strike, self.op_args)
+
+    def peakmem_opsymb_generator(self):
+        opsymb_generator(self.keys, self.targets, self.bad, strike, self.op_args)
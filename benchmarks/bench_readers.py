@@ -0,0 +1,49 @@
+from .common import ensure_data, datadir
+from AIAmplitudes_common_public.file_readers import convert, readFile
+from AIAmplitudes_common_public.fbspaces import get_perm_bspace, get_brels
+
+class Convert:
+    params = ["full", "quad", "oct"]
+    param_names = ["reptype"]
+    files = {"full": ('EZ6_symb_new_norm', 6), "quad": ('EZ_symb_quad_new_norm', 6),
+             "oct": ('EZ_symb_oct_new_norm', 7)}
+
+    def setup(self, reptype):
+        ensure_data()
+        filename, self.loop = self.files[reptype]
+        self.filename = f'{datadir}/{filename}'
+        self.reptype = None if reptype == "full" else reptype
+
+    def time_convert(self, reptype):
+        convert(self.filename, self.loop, self.reptype)
+
+    def peakmem_convert(self, reptype):
+        convert(self.filename, self.loop, self.reptype)
+
+class ReadFile:
+    def setup(self):
+        ensure_data()
+
+    def time_readFile(self):
+        with open(f'{datadir}/EZ6_symb_new_norm', 'rt') as f:
+            readFile(f, 'Esymb[6]')
+
+class PermSpaces:
+    params = [2, 4]
+    param_names = ["w"]
+
+    def setup(self, w):
+        ensure_data()
+
+    def time_get_perm_bspace(self, w):
+        get_perm_bspace(w)
+
+class SpaceRels:
+    params = [2, 4, 8]
+    param_names = ["w"]
+
+    def setup(self, w):
+        ensure_data()
+
+    def time_get_brels(self, w):
+        get_brels(w, datadir)
@@ -0,0 +1,28 @@
+from .common import ensure_data, datadir
+from AIAmplitudes_common_public.file_readers import convert
+from AIAmplitudes_common_public.rels_utils import (is_trivial0, get_dihedral_images, get_rel_terms_in_symb,
+                                                   final_entries_rel_table, first_entry_rel_table)
+
+class WordRels:
+    def setup(self):
+        ensure_data()
+        self.symb = convert(f'{datadir}/EZ_symb_new_norm', 5)
+        self.words = list(self.symb.keys())[:5000]
+
+    def time_is_trivial0(self):
+        for word in self.words: is_trivial0(word)
+
+    def time_get_dihedral_images(self):
+        for word in self.words: get_dihedral_images(word)
+
+class RelTerms:
+    params = ["first", "final"]
+    param_names = ["rel_slot"]
+
+    def setup(self, rel_slot):
+        ensure_data()
+        self.symb = convert(f'{datadir}/EZ_symb_new_norm', 5)
+        self.rel = first_entry_rel_table[0] if rel_slot == "first" else final_entries_rel_table[19]
+
+    def time_get_rel_terms_in_symb(self, rel_slot):
+        get_rel_terms_in_symb(self.symb, 0.5, self.rel, rel_slot=rel_slot)
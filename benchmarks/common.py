@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# Benchmarks always run on generated fixture data, never on the real data.
+# The loaders read the data directory when the package is first imported,
+# so it has to be set here, before any import of AIAmplitudes_common_public.
+datadir = os.environ.get("AIAMPLITUDES_BENCH_DATA", os.path.join(tempfile.gettempdir(), "AIAmplitudes_benchdata"))
+os.environ["AIAMPLITUDES_DATA_DIR"] = datadir
+
+from AIAmplitudes_common_public.synthetic_data import write_synthetic_data
+
+fixture = dict(loops=(1, 2, 3, 4, 5, 6), quad_loops=(3, 4, 5, 6), oct_loops=(5, 6, 7),
+               n_terms=20000, n_sewrels=200, seed=0)
+
+def ensure_data():
+    # (re)generate the fixture once per machine; a stamp records what was generated
+    stamp = os.path.join(datadir, '.fixture')
+    if os.path.isfile(stamp):
+        with open(stamp) as f:
+            if f.read() == repr(fixture): return datadir
+    write_synthetic_data(datadir, **fixture)
+    with open(stamp, 'w') as f: f.write(repr(fixture))
+    return datadir
+
+def strike(key, slots):
+    # the simplest operator: delete the letters at the given slots
+    return ''.join(l for i, l in enumerate(key) if i not in slots)
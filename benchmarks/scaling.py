@@ -0,0 +1,222 @@
+"""
+End-to-end scaling harness: load -> relation generation -> operator generation -> tagging, per loop order.
+
+    python -m benchmarks.scaling --out scaling.json                  # synthetic data, L=1..6, quad 7, oct 8
+    python -m benchmarks.scaling --datadir ~/.local/AIAmplitudesData --no-generate --out real.json
+
+Every loop order runs in a fresh process, so peak RSS is not polluted by the previous one.
+For each stage the report has wall time, peak RSS during the stage (polled from /proc), the tracemalloc peak,
+and the top allocation sites. tracemalloc slows the stages down; use --no-tracemalloc for clean timings.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+default_runs = [("full", L) for L in range(1, 7)] + [("quad", 7), ("oct", 8)]
+
+########################################################################################################################
+# measurement
+########################################################################################################################
+
+def current_rss():
+    # resident set size in bytes; falls back to the process high-water mark where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Stage(object):
+    # context manager timing one stage and tracking its peak memory
+    def __init__(self, name, use_tracemalloc=True, top=10, interval=0.01):
+        self.name, self.use_tracemalloc, self.top, self.interval = name, use_tracemalloc, top, interval
+        self.record = {'stage': name}
+
+    def poll(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.start_rss = self.peak = current_rss()
+        self.done = threading.Event()
+        self.poller = threading.Thread(target=self.poll, daemon=True)
+        self.poller.start()
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.record['wall_s'] = time.perf_counter() - self.start
+        self.done.set()
+        self.poller.join()
+        self.peak = max(self.peak, current_rss())
+        self.record['start_rss_mb'] = self.start_rss / 2 ** 20
+        self.record['peak_rss_mb'] = self.peak / 2 ** 20
+        if self.use_tracemalloc:
+            self.record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            stats = tracemalloc.take_snapshot().statistics('lineno')[:self.top]
+            tracemalloc.stop()
+            self.record['top_allocators'] = [{'where': f'{s.traceback[0].filename}:{s.traceback[0].lineno}',
+                                              'size_mb': s.size / 2 ** 20, 'count': s.count} for s in stats]
+        self.record['failed'] = exc[0] is not None
+        if exc[0] is not None: self.record['error'] = repr(exc[1])
+        return False
+
+########################################################################################################################
+# the pipeline, one loop order per process
+########################################################################################################################
+
+keyre = re.compile(r'^(Br_\d+_\d+)?(.*)$')
+
+def strike(key, slots):
+    # delete the letters at the given slots, leaving a quad/oct prefix alone
+    prefix, word = keyre.match(key).groups()
+    return (prefix or '') + ''.join(l for i, l in enumerate(word) if i not in slots)
+
+def run_loop(args):
+    # records of every stage that ran; a failure ends the loop order but keeps the records so far, the failed
+    # stage recording its own error (Stage.__exit__), or a 'setup' record for a failure between stages
+    reptype, L, opts = args
+    records = []
+    try:
+        run_stages(reptype, L, opts, records)
+    except Exception as e:
+        if not (records and records[-1].get('failed')):
+            records.append({'stage': 'setup', 'format': reptype, 'L': L, 'failed': True, 'error': repr(e)})
+    return records
+
+def run_stages(reptype, L, opts, records):
+    from AIAmplitudes_common_public import Phi2Symb
+    from AIAmplitudes_common_public.rels_utils import read_rel_info, rels_to_generate_compact_default
+    from AIAmplitudes_common_public.preprocessing import (relsymb_generator, gen_op_args, opsymb_generator,
+                                                          tag_opinstance)
+
+    def stage(name):
+        s = Stage(name, opts['tracemalloc'], opts['top'])
+        s.record.update({'format': reptype, 'L': L})
+        records.append(s.record)
+        return s
+
+    with stage('load') as s:
+        symb = Phi2Symb(L, reptype)
+        s.record['n_items'] = len(symb)
+    wordlen = len(keyre.match(next(iter(symb))).group(2))
+
+    if reptype == "oct":
+        # relsymb_generator has no oct format
+        records.append({'stage': 'relgen', 'format': reptype, 'L': L, 'skipped': True})
+    else:
+        with stage('relgen') as s:
+            rels, slots, to_gens, overlaps, relnames = read_rel_info(rels_to_generate_compact_default)
+            relsymbs = [r for r in relsymb_generator(relnames, rels, overlaps, slots, symb, L, reptype)]
+            s.record['n_items'] = sum(len(r) for r in relsymbs)
+        del relsymbs
+
+    if wordlen < 3:
+        records.append({'stage': 'opgen', 'format': reptype, 'L': L, 'skipped': True})
+        records.append({'stage': 'tag', 'format': reptype, 'L': L, 'skipped': True})
+        return records
+
+    op_meta_args = {"slots": {"loop": wordlen // 2, "k_total": 2, "k_pairwise": 1, "numslots": 2}}
+    with stage('opgen') as s:
+        op_args = gen_op_args(op_meta_args)
+        source = list(symb.keys())[:opts['max_source']] if opts['max_source'] else symb
+        opsymb = opsymb_generator(source, {}, set(), strike, op_args)
+        s.record['n_items'] = sum(len(v) for v in opsymb.values())
+
+    with stage('tag') as s:
+        tagged = []
+        for _ in range(min(opts['n_instances'], len(opsymb))):
+            src = opsymb.random_key()
+            tgt = opsymb[src].random_key()
+            argtup = opsymb[src][tgt].random_key()
+            instance = {'source': {src}, 'target': {tgt}}
+            tagged.append(tag_opinstance(instance, op_meta_args, ['STRIKE'], argtup, 'slots', False))
+        s.record['n_items'] = len(tagged)
+    return records
+
+def ensure_data(datadir, n_terms, runs, seed):
+    from AIAmplitudes_common_public.synthetic_data import write_synthetic_data
+    loops = {rt: tuple(L for r, L in runs if r == rt) for rt in ("full", "quad", "oct")}
+    fixture = repr((n_terms, sorted(runs), seed))
+    stamp = os.path.join(datadir, '.fixture')
+    if os.path.isfile(stamp):
+        with open(stamp) as f:
+            if f.read() == fixture: return
+    write_synthetic_data(datadir, loops=loops["full"] or (1,), quad_loops=loops["quad"], oct_loops=loops["oct"],
+                         n_terms=n_terms, seed=seed)
+    with open(stamp, 'w') as f: f.write(fixture)
+
+def scaling_curves(records):
+    # {stage: {format: [[L, wall_s, peak_rss_mb], ...]}}
+    curves = {}
+    for r in records:
+        if r.get('skipped') or r.get('failed'): continue
+        curves.setdefault(r['stage'], {}).setdefault(r['format'], []).append([r['L'], r['wall_s'], r['peak_rss_mb']])
+    return curves
+
+def parse_runs(spec):
+    # "full:1-6,quad:7,oct:8"
+    runs = []
+    for part in spec.split(','):
+        reptype, loops = part.split(':')
+        lo, _, hi = loops.partition('-')
+        runs += [(reptype, L) for L in range(int(lo), int(hi or lo) + 1)]
+    return runs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end scaling benchmark across loop orders")
+    parser.add_argument('--runs', type=parse_runs, default=default_runs, help='e.g. "full:1-6,quad:7,oct:8"')
+    parser.add_argument('--datadir', default=os.path.join(tempfile.gettempdir(), 'AIAmplitudes_scalingdata'))
+    parser.add_argument('--no-generate', action='store_true', help='use the data in --datadir as it is')
+    parser.add_argument('--n-terms', type=int, default=50000, help='terms per synthetic symbol')
+    parser.add_argument('--max-source', type=int, default=20000, help='source keys for opgen (0: all)')
+    parser.add_argument('--n-instances', type=int, default=10000, help='instances to tag')
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--top', type=int, default=10, help='top allocation sites per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='scaling_report.json')
+    args = parser.parse_args(argv)
+
+    # children inherit the data directory; it must be set before the package is imported
+    os.environ["AIAMPLITUDES_DATA_DIR"] = args.datadir
+    if not args.no_generate: ensure_data(args.datadir, args.n_terms, args.runs, args.seed)
+
+    opts = {'tracemalloc': not args.no_tracemalloc, 'top': args.top, 'max_source': args.max_source,
+            'n_instances': args.n_instances}
+    records = []
+    ctx = multiprocessing.get_context('spawn')
+    for reptype, L in args.runs:
+        with ctx.Pool(1) as pool:
+            try:
+                recs = pool.apply(run_loop, ((reptype, L, opts),))
+            except Exception as e:
+                # the worker itself failed (run_loop catches the stage errors)
+                recs = [{'stage': 'worker', 'format': reptype, 'L': L, 'failed': True, 'error': repr(e)}]
+        records += recs
+        for r in recs:
+            if r.get('skipped'): status = 'skipped'
+            elif r.get('failed'): status = 'FAILED ' + r.get('error', '')
+            else: status = f"{r['wall_s']:9.3f}s  peak {r['peak_rss_mb']:9.1f}MB  n={r.get('n_items')}"
+            print(f"{reptype:>5} L={L}  {r['stage']:<7} {status}", flush=True)
+
+    report = {'config': {k: (v if k != 'runs' else [list(r) for r in v]) for k, v in vars(args).items()},
+              'machine': {'platform': platform.platform(), 'python': sys.version.split()[0],
+                          'cpus': os.cpu_count()},
+              'records': records,
+              'scaling': scaling_curves(records)}
+    with open(args.out, 'w') as f: json.dump(report, f, indent=1)
+    print(f"report written to {args.out}")
+
+if __name__ == "__main__":
+    main()
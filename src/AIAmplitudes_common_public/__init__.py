@@ -3,38 +3,44 @@ from AIAmplitudes_common_public.polynomial_utils import polynom_convert, get_run
 from AIAmplitudes_common_public.fbspaces import get_frels,get_brels,get_perm_fspace,get_perm_bspace
 from AIAmplitudes_common_public.fbspaces import get_rest_fspace,get_rest_bspace
 from AIAmplitudes_common_public.rels_utils import alphabet,quad_prefix
+from AIAmplitudes_common_public.rel_matrices import brel_matrix,frel_matrix,relperm_matrix
+from AIAmplitudes_common_public.compact_symb import CompactSymb,convert_compact
 # fixed alphabet
-def Phi2Symb(L, type=None):
+def Phi2File(L, type=None):
+    #the file holding the symbol at loop L in the given representation
     if not type or type == "full":
         if L > 6:
             print("cannot encode uncompressed!")
             raise ValueError
-        if L==6:
-            symb = convert(f'{relpath}/EZ6_symb_new_norm', L)
-        else:
-            symb  = convert(f'{relpath}/EZ_symb_new_norm',L)
-        return symb
+        if L==6: return f'{relpath}/EZ6_symb_new_norm'
+        else: return f'{relpath}/EZ_symb_new_norm'
     elif type == "quad":
         if L < 2:
             print("cannot encode quad!")
             raise ValueError
-        if L < 7:
-            symb = convert(f'{relpath}/EZ_symb_quad_new_norm', L, "quad")
-        elif L == 7: symb = convert(f'{relpath}/EZ7_symb_quad_new_norm', L, "quad")
+        if L < 7: return f'{relpath}/EZ_symb_quad_new_norm'
+        elif L == 7: return f'{relpath}/EZ7_symb_quad_new_norm'
         else: raise ValueError
-        return symb
     elif type == "oct":
         if L < 4:
             print("cannot encode oct!")
             raise ValueError
-        if L < 8:
-            symb = convert(f'{relpath}/EZ_symb_oct_new_norm', L, "oct")
-        elif L==8:
-            symb = convert(f'{relpath}/EZ8_symb_oct_new_norm', L, "oct")
+        if L < 8: return f'{relpath}/EZ_symb_oct_new_norm'
+        elif L==8: return f'{relpath}/EZ8_symb_oct_new_norm'
         else: raise ValueError
-        return symb
     else: return
 
+def Phi2Symb(L, type=None):
+    filename = Phi2File(L, type)
+    if filename is None: return
+    return convert(filename, L, type if type in {"quad", "oct"} else None)
+
+def Phi2CompactSymb(L, type=None):
+    #same as Phi2Symb, as a CompactSymb (basis id + packed word arrays)
+    filename = Phi2File(L, type)
+    if filename is None: return
+    return convert_compact(filename, L, type if type in {"quad", "oct"} else None)
+
 def Phi3Symb(L):
     if L==6:
         symb = convert(f'{relpath}/EE33_6_symb_new_norm', L)
@@ -72,6 +78,24 @@ def bp_1l_rels(w,mydir=relpath):
 def bp_2l_rels(w,mydir=relpath):
     return get_relpermdict(mydir, w, "back", "twoletter")
 
+def br_relmat(w,mydir=relpath):
+    return brel_matrix(w,mydir)
+
+def fr_relmat(w,mydir=relpath):
+    return frel_matrix(w,mydir)
+
+def fp_1l_relmat(w,mydir=relpath):
+    return relperm_matrix(mydir, w, "front", "oneletter")
+
+def fp_2l_relmat(w,mydir=relpath):
+    return relperm_matrix(mydir, w, "front", "twoletter")
+
+def bp_1l_relmat(w,mydir=relpath):
+    return relperm_matrix(mydir, w, "back", "oneletter")
+
+def bp_2l_relmat(w,mydir=relpath):
+    return relperm_matrix(mydir, w, "back", "twoletter")
+
 def fspace(w,rp="p"):
     if rp == "p": return get_perm_fspace(w)[0]
     elif rp == "r": return get_rest_fspace(w)[0]
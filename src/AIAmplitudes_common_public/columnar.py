@@ -0,0 +1,241 @@
+import os
+from fractions import Fraction
+from AIAmplitudes_common_public.file_readers import iter_symb_terms
+from AIAmplitudes_common_public.instrumentation import span, count
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columnar (Parquet) export and import of symbols, F/B spaces, relations and run polynomials.
+# Every kind is a hive-partitioned dataset under one root directory:
+#   <root>/symbols/format=<full|quad|oct>/loop=<L>/     key, basis, word, prefix, coeff
+#   <root>/spaces/space=<F|B>/weight=<w>/              element, element_index, word, coeff   (get_perm_*space)
+#   <root>/relations/source=<...>/weight=<w>/          rel_id, seam, reltype, lhs, term, num, den
+#                                                      (get_brels, get_frels, get_relpermdict; coeff = num / den)
+#   <root>/polynomials/                                key, poly, is_zero, factorable   (get_runpolynomials)
+# Reads go through pyarrow.dataset, so `columns` only reads those columns, and `filters` (a pyarrow expression or
+# [(column, op, value), ...]) skips whole partitions and the row groups whose min/max statistics cannot match.
+# Symbols are written in batches from iter_symb_terms, so exporting L=7 quad / L=8 oct never loads them whole.
+#
+#   export_symb(Phi2File(8, "oct"), "data/parquet", loop=8, reptype="oct")
+#   df = read_table("data/parquet", "symbols", columns=["word", "coeff"],
+#                   filters=[("format", "=", "oct"), ("basis", "=", "Br_8_57")])
+#   symb = read_symb("data/parquet", 8, "oct", filters=[("prefix", "=", "ab")])
+
+kinds = ('symbols', 'spaces', 'relations', 'polynomials')
+
+def _require_pyarrow():
+    if pa is None:
+        msg = "columnar import/export needs pyarrow: pip install 'AIAmplitudes_common_public[columnar]'"
+        print(msg)
+        raise ImportError(msg)
+
+def _schemas():
+    return {
+        'symbols': (pa.schema([('key', pa.string()), ('basis', pa.string()), ('word', pa.string()),
+                               ('prefix', pa.string()), ('coeff', pa.int64())]),
+                    pa.schema([('format', pa.string()), ('loop', pa.int32())])),
+        'spaces': (pa.schema([('element', pa.string()), ('element_index', pa.int32()), ('word', pa.string()),
+                              ('coeff', pa.int64())]),
+                   pa.schema([('space', pa.string()), ('weight', pa.int32())])),
+        'relations': (pa.schema([('rel_id', pa.int64()), ('seam', pa.string()), ('reltype', pa.string()),
+                                 ('lhs', pa.string()), ('term', pa.string()), ('num', pa.int64()),
+                                 ('den', pa.int64())]),
+                      pa.schema([('source', pa.string()), ('weight', pa.int32())])),
+        'polynomials': (pa.schema([('key', pa.string()), ('poly', pa.string()), ('is_zero', pa.bool_()),
+                                   ('factorable', pa.bool_())]), None)}
+
+def _partition_dir(root, kind, parts):
+    return os.path.join(root, kind, *(f'{k}={v}' for k, v in parts))
+
+def _write(root, kind, parts, batches, row_group_size=1 << 17):
+    # (over)write one partition from an iterable of column dicts; returns the number of rows
+    schema = _schemas()[kind][0]
+    outdir = _partition_dir(root, kind, parts)
+    os.makedirs(outdir, exist_ok=True)
+    for name in os.listdir(outdir):
+        if name.endswith('.parquet'): os.remove(os.path.join(outdir, name))
+    n = 0
+    with pq.ParquetWriter(os.path.join(outdir, 'part-00000.parquet'), schema) as writer:
+        for batch in batches:
+            table = pa.Table.from_pydict(batch, schema=schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            n += len(table)
+    count(f"columnar.{kind}_rows", n)
+    return n
+
+def _split_key(key, reptype):
+    # 'Br_8_57abcd' -> ('Br_8_57', 'abcd'); the basis prefix ends in a digit
+    if reptype in {"quad", "oct"}:
+        basis = key.rstrip('abcdef')
+        return basis, key[len(basis):]
+    return '', key
+
+########################################################################################################################
+# export
+########################################################################################################################
+
+def export_symb(source, root, loop, reptype=None, batch_size=1 << 20, prefix_len=2):
+    '''
+    Write a symbol as the symbols/format=<reptype>/loop=<loop> partition.
+    ---------
+    INPUTS:
+    source: str or dict; a symbol file (streamed with iter_symb_terms) or a {key: coeff} symbol.
+    root: str; dataset root.
+    loop: int.
+    reptype: str or None; "quad", "oct" or None / "full".
+    batch_size: int; terms per written batch (bounds the memory use).
+    prefix_len: int; letters of the word part kept in the 'prefix' column, for filtering.
+
+    OUTPUTS:
+    n_rows: int.
+    '''
+    _require_pyarrow()
+    reptype = reptype if reptype in {"quad", "oct"} else "full"
+    items = iter_symb_terms(source, loop, None if reptype == "full" else reptype) if isinstance(source, str) \
+        else iter(source.items())
+
+    def batches():
+        while True:
+            cols = {'key': [], 'basis': [], 'word': [], 'prefix': [], 'coeff': []}
+            for key, coeff in items:
+                basis, word = _split_key(key, reptype)
+                cols['key'].append(key); cols['basis'].append(basis); cols['word'].append(word)
+                cols['prefix'].append(word[:prefix_len]); cols['coeff'].append(coeff)
+                if len(cols['key']) >= batch_size: break
+            if not cols['key']: return
+            yield cols
+
+    with span("export_symb", loop=loop, reptype=reptype):
+        return _write(root, 'symbols', [('format', reptype), ('loop', loop)], batches())
+
+def export_space(root, space, w, basedict=None):
+    # basedict as returned by get_perm_fspace / get_perm_bspace (read from the data if None)
+    _require_pyarrow()
+    if space not in {'F', 'B'}:
+        print("space must be F or B!")
+        raise ValueError
+    if basedict is None:
+        from AIAmplitudes_common_public.fbspaces import get_perm_fspace, get_perm_bspace
+        basedict = (get_perm_fspace if space == 'F' else get_perm_bspace)(w)[0]
+    cols = {'element': [], 'element_index': [], 'word': [], 'coeff': []}
+    for element, terms in basedict.items():
+        for word, coeff in terms.items():
+            cols['element'].append(element); cols['element_index'].append(int(element.rsplit('_', 1)[1]))
+            cols['word'].append(word); cols['coeff'].append(coeff)
+    return _write(root, 'spaces', [('space', space), ('weight', w)], [cols])
+
+def export_rels(root, source, w, rels, seam=None, reltype=None):
+    '''
+    Write relations as the relations/source=<source>/weight=<w> partition.
+    ---------
+    INPUTS:
+    root: str; dataset root.
+    source: str; e.g. "brels", "frels", "relperm_front_oneletter".
+    w: int; weight.
+    rels: dict or list; {lhs: {term: coeff}} (get_brels / get_frels; {None: 0} for a zero rhs)
+          or [{term: coeff}, ...] (get_relpermdict); coeffs are ints or Fractions.
+    seam, reltype: str or None; stored as columns (for get_relpermdict).
+
+    OUTPUTS:
+    n_rows: int.
+    '''
+    _require_pyarrow()
+    pairs = rels.items() if isinstance(rels, dict) else ((None, rel) for rel in rels)
+    cols = {'rel_id': [], 'seam': [], 'reltype': [], 'lhs': [], 'term': [], 'num': [], 'den': []}
+    for i, (lhs, terms) in enumerate(pairs):
+        for term, coeff in terms.items():
+            coeff = Fraction(coeff if coeff is not None else 0)
+            cols['rel_id'].append(i); cols['seam'].append(seam); cols['reltype'].append(reltype)
+            cols['lhs'].append(lhs); cols['term'].append(term)
+            cols['num'].append(coeff.numerator); cols['den'].append(coeff.denominator)
+    return _write(root, 'relations', [('source', source), ('weight', w)], [cols])
+
+def export_polynomials(root, polys=None):
+    # {key: polynomial string}, as get_runpolynomials()['all'] (read from the data if None)
+    _require_pyarrow()
+    if polys is None:
+        from AIAmplitudes_common_public.polynomial_utils import get_runpolynomials
+        polys = get_runpolynomials()['all']
+    cols = {'key': list(polys), 'poly': list(polys.values()), 'is_zero': [p == '0' for p in polys.values()],
+            'factorable': ['(' in p for p in polys.values()]}
+    return _write(root, 'polynomials', [], [cols])
+
+########################################################################################################################
+# import
+########################################################################################################################
+
+def dataset(root, kind):
+    # the pyarrow dataset of one kind, with typed partition columns
+    _require_pyarrow()
+    if kind not in kinds:
+        print(f"unknown kind {kind}, expected one of {kinds}!")
+        raise ValueError
+    schema, part_schema = _schemas()[kind]
+    partitioning = ds.partitioning(part_schema, flavor='hive') if part_schema is not None else None
+    if part_schema is not None: schema = pa.unify_schemas([schema, part_schema])
+    return ds.dataset(os.path.join(root, kind), format='parquet', partitioning=partitioning, schema=schema)
+
+def _expression(filters):
+    if filters is None or isinstance(filters, ds.Expression): return filters
+    return pq.filters_to_expression(filters)
+
+def read_table(root, kind, columns=None, filters=None):
+    '''
+    Read a dataset as a DataFrame, reading only the requested columns and the matching partitions / row groups.
+    ---------
+    INPUTS:
+    root: str; dataset root.
+    kind: str; "symbols", "spaces", "relations" or "polynomials".
+    columns: list or None; columns to read (partition columns included), default all.
+    filters: pyarrow expression, [(column, op, value), ...] (ANDed) or None.
+
+    OUTPUTS:
+    df: pandas.DataFrame.
+    '''
+    return read_arrow(root, kind, columns, filters).to_pandas()
+
+def read_arrow(root, kind, columns=None, filters=None):
+    # as read_table, as a pyarrow Table
+    with span("read_table", kind=kind):
+        table = dataset(root, kind).to_table(columns=columns, filter=_expression(filters))
+        count(f"columnar.{kind}_rows_read", table.num_rows)
+    return table
+
+def _columns(table):
+    return [table.column(name).to_pylist() for name in table.column_names]
+
+def read_symb(root, loop, reptype=None, filters=None):
+    # {key: coeff} of one symbol, optionally restricted (e.g. filters=[("basis", "=", "Br_8_57")])
+    reptype = reptype if reptype in {"quad", "oct"} else "full"
+    expr = (ds.field('format') == reptype) & (ds.field('loop') == loop)
+    if filters is not None: expr = expr & _expression(filters)
+    return dict(zip(*_columns(read_arrow(root, 'symbols', columns=['key', 'coeff'], filters=expr))))
+
+def read_space(root, space, w):
+    # basedict {element: {word: coeff}}, as get_perm_fspace / get_perm_bspace
+    table = read_arrow(root, 'spaces', columns=['element', 'word', 'coeff'],
+                       filters=[('space', '=', space), ('weight', '=', w)])
+    out = {}
+    for element, word, coeff in zip(*_columns(table)):
+        out.setdefault(element, {})[word] = coeff
+    return out
+
+def read_rels(root, source, w):
+    # {lhs: {term: coeff}} if the relations have left-hand sides, else [{term: coeff}, ...]; integral coeffs as int
+    table = read_arrow(root, 'relations', columns=['rel_id', 'lhs', 'term', 'num', 'den'],
+                       filters=[('source', '=', source), ('weight', '=', w)])
+    rels = {}
+    for i, lhs, term, num, den in zip(*_columns(table)):
+        coeff = num if den == 1 else Fraction(num, den)
+        rels.setdefault(i, (lhs, {}))[1][term] = coeff
+    if any(lhs is not None for lhs, _ in rels.values()):
+        return {lhs: terms for lhs, terms in rels.values()}
+    return [terms for _, terms in rels.values()]
+
+def read_polynomials(root, filters=None):
+    return dict(zip(*_columns(read_arrow(root, 'polynomials', columns=['key', 'poly'], filters=filters))))
@@ -1,6 +1,7 @@
 import copy
 import random
 import argparse
+import numpy as np
 
 #some classes to hold the data in different formats.
 #symb is an overload of dict with some elementwise operators on values,
@@ -56,7 +57,90 @@ class Symb(dict):
     def __getitem__(self,key):
         if key in self: return super().__getitem__(key)
         else: return 0
-    
+
+    #the coefficient index is built on first use and dropped whenever the symbol is modified
+    _coeff_index = None
+
+    def coeff_index(self):
+        if self._coeff_index is None: self._coeff_index = CoeffIndex(self)
+        return self._coeff_index
+
+    def __setitem__(self, key, value):
+        self._coeff_index = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._coeff_index = None
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._coeff_index = None
+        super().update(*args, **kwargs)
+
+    def pop(self, *args):
+        self._coeff_index = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._coeff_index = None
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self: self._coeff_index = None
+        return super().setdefault(key, default)
+
+    def clear(self):
+        self._coeff_index = None
+        super().clear()
+
+    def __ior__(self, other):
+        self._coeff_index = None
+        return super().__ior__(other)
+
+class CoeffIndex(object):
+    #inverted index coefficient -> words of a symbol, plus the coefficient histogram.
+    #words are stored once, grouped by coefficient: the words with the i-th distinct coefficient are
+    #words[starts[i]:starts[i+1]]. Build is one sort, O(N log N); queries are O(1) + size of the answer.
+    def __init__(self, symb):
+        keys, values = list(symb.keys()), list(symb.values())
+        coeffs = np.array(values, dtype=object)
+        if all(isinstance(v, (int, np.integer)) for v in values):
+            try: coeffs = np.array(values, dtype=np.int64)
+            except OverflowError: pass
+        self.coeffs, inverse, self.counts = np.unique(coeffs, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        self.words = [keys[i] for i in order]
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)])
+        self.position = {c: i for i, c in enumerate(self.coeffs.tolist())}
+
+    def __len__(self):
+        return len(self.coeffs)
+
+    def words_with(self, coeff):
+        i = self.position.get(coeff)
+        if i is None: return set()
+        return set(self.words[self.starts[i]:self.starts[i + 1]])
+
+    def count(self, coeff):
+        i = self.position.get(coeff)
+        return 0 if i is None else int(self.counts[i])
+
+    def histogram(self):
+        return dict(zip(self.coeffs.tolist(), self.counts.tolist()))
+
+    def most_common(self, k=None):
+        #[(coeff, count)] by decreasing count, ties by increasing coeff
+        if k is None or k >= len(self.counts): top = np.arange(len(self.counts))
+        else: top = np.argpartition(-self.counts, k - 1)[:k]
+        top = sorted(top.tolist(), key=lambda i: (-self.counts[i], i))
+        coeffs = self.coeffs.tolist()
+        return [(coeffs[i], int(self.counts[i])) for i in top]
+
+def coeff_index(symb):
+    #the cached index of a Symb, or a fresh one for any other {word: coeff} dict
+    if isinstance(symb, Symb): return symb.coeff_index()
+    return CoeffIndex(symb)
+
 class sumlist():
     def __init__(self,mylist):
         self.list=mylist
@@ -103,8 +187,12 @@ class fastRandomSampler(object):
     #This maps from the keys to the ints. To sample, draw an integer, pop the key at that spot, then update the list.
     #Then pop that specific k:v pair from the dict (which we can do, since lookup is quick).
     #This wrapper supports both dicts and sets.
+    #Draws come from rng (a random.Random, see random_streams) if one is given to the call or to the sampler,
+    #else from the global random module.
 
-    def __init__(self, init_elem, countdict={}, inplace=False):
+    rng = None
+
+    def __init__(self, init_elem, countdict={}, inplace=False, rng=None):
         # this sampling struct works for dicts and sets, so just flag which it is
         if (not isinstance(init_elem, dict) and not isinstance(init_elem, set)): raise TypeError
         self.is_dict = isinstance(init_elem, dict)
@@ -116,6 +204,7 @@ class fastRandomSampler(object):
 
         # optional counter, if items have multiplicity. Used for scramble
         self.countdict = countdict
+        if rng is not None: self.rng = rng
 
         # Create the key-to-int maps from the dictionary
         if len(self.mystruct) == 0:
@@ -186,19 +275,30 @@ class fastRandomSampler(object):
         self.popitem(key)
         return
 
-    def random_key(self):  # O(1)
+    def _rng(self, rng):
+        if rng is not None: return rng
+        return random if self.rng is None else self.rng
+
+    def random_key(self, rng=None):  # O(1)
     # Select a random key from the dictionary using the int_to_key map
-        return self.keylist[int(len(self.mystruct) * random.random())]
+        return self.keylist[int(len(self.mystruct) * self._rng(rng).random())]
 
-    def remove_random(self):  # O(1)
+    def random_keys(self, n, rng=None):  # O(n)
+        # n keys drawn with replacement; one vectorized draw if rng is an np.random.Generator
+        rng = self._rng(rng)
+        if isinstance(rng, np.random.Generator):
+            return [self.keylist[i] for i in rng.integers(0, len(self.keylist), size=n).tolist()]
+        return [self.keylist[int(len(self.mystruct) * rng.random())] for _ in range(n)]
+
+    def remove_random(self, rng=None):  # O(1)
         # Randomly remove a key from the dictionary via the bidirectional maps
-        key = self.random_key()
+        key = self.random_key(rng)
         self.remove(key)
 
-    def pop_random(self):  # O(1)
+    def pop_random(self, rng=None):  # O(1)
         # Randomly pop a key from the dictionary via the bidirectional maps
         try:
-            key = self.random_key()
+            key = self.random_key(rng)
             if not self.countdict:
                 # if we're not counting, just pop it
                 return self.popitem(key)
@@ -218,17 +318,108 @@ class fastRandomSampler(object):
         except IndexError:
             print("Error, symbol is exhausted!")
 
-    def pop_random_gen(self, num_to_pop):  # O(1)
+    def pop_random_gen(self, num_to_pop, rng=None):  # O(1)
         for i in range(num_to_pop):
-            yield self.pop_random()
+            yield self.pop_random(rng)
 
-    def pop_inst_gen(self, subdict_size, num_to_gen):
+    def pop_inst_gen(self, subdict_size, num_to_gen, rng=None):
         # Randomly pop instances from the symb
         for i in range(num_to_gen):
             if self.is_dict:
-                yield {k: v for k, v in self.pop_random_gen(subdict_size)}
+                yield {k: v for k, v in self.pop_random_gen(subdict_size, rng)}
             else:
-                yield {k for k in self.pop_random_gen(subdict_size)}
+                yield {k for k in self.pop_random_gen(subdict_size, rng)}
+
+########################################################################################################################
+class OpSymb(fastRandomSampler):
+    #An operator symbol {source: {target: {argtups}}} (as built by opsymb_generator), plus the reverse index
+    #{target: {sources}}. Both levels are fastRandomSamplers, so sampling a source, a target, or a source of a given
+    #target is O(1), and removing a target only touches the sources that map to it.
+    #Edit it through its own methods (popitem, remove_target, remove_edge, prune) so that the index stays in sync.
+
+    def __init__(self, init_elem, countdict={}, inplace=False, rng=None):
+        super().__init__(init_elem, countdict, inplace, rng)
+        reverse, self.n_edges = {}, 0
+        for source, targets in self.mystruct.items():
+            self.n_edges += len(targets)
+            for target in targets.keys():
+                reverse.setdefault(target, set()).add(source)
+        self.targets = fastRandomSampler({t: fastRandomSampler(s, inplace=True) for t, s in reverse.items()},
+                                         inplace=True)
+
+    #n_edges: number of (source, target) pairs
+    def n_targets(self):
+        return len(self.targets)
+
+    def sources_of(self, target):
+        srcs = self.targets[target]
+        return set() if srcs is None else set(srcs.keys())
+
+    def random_target(self, rng=None):  # O(1)
+        return self.targets.random_key(self._rng(rng))
+
+    def random_source_of(self, target, rng=None):  # O(1)
+        return self.targets[target].random_key(self._rng(rng))
+
+    def _unindex(self, source, target):
+        srcs = self.targets[target]
+        if srcs is None: return
+        srcs.remove(source)
+        if len(srcs) == 0: self.targets.popitem(target)
+
+    def add(self, key, value=None):
+        if key in self.mystruct: self.popitem(key)
+        super().add(key, value)
+        self.n_edges += len(value)
+        for target in value.keys():
+            if target not in self.targets: self.targets.add(target, fastRandomSampler(set(), inplace=True))
+            if key not in self.targets[target]: self.targets[target].add(key)
+
+    def popitem(self, key):  # O(number of targets of key)
+        for target in self.mystruct[key].keys():
+            self._unindex(key, target)
+        self.n_edges -= len(self.mystruct[key])
+        return super().popitem(key)
+
+    def remove_edge(self, source, target):
+        #drop one target of one source; the source goes too if it has no target left
+        tgts = self.mystruct.get(source)
+        if tgts is None or target not in tgts: return
+        if isinstance(tgts, fastRandomSampler): tgts.popitem(target)
+        else: tgts.pop(target)
+        self._unindex(source, target)
+        self.n_edges -= 1
+        if len(tgts) == 0: super().popitem(source)
+
+    def remove_target(self, target, drop_sources=False):
+        '''
+        Remove a target from every source that maps to it.
+        ---------
+        INPUTS:
+        target: str.
+        drop_sources: bool; drop the whole source instead (as opt='drop_source_if_bad_targets').
+
+        OUTPUTS:
+        n_sources: int; number of sources that were touched.
+        '''
+        srcs = self.sources_of(target)
+        for source in srcs:
+            if drop_sources: self.popitem(source)
+            else: self.remove_edge(source, target)
+        return len(srcs)
+
+    def prune(self, bad_sources=None, bad_targets=None, drop_sources=False):
+        #remove bad sources and bad targets. The bad sets only need `in`, and when they are iterable and smaller
+        #than the symbol, only their own entries are looked up, so repeated prunes with short lists are cheap.
+        def hits(bad, present):
+            if not bad: return []
+            if hasattr(bad, '__iter__') and len(bad) < len(present): return [k for k in bad if k in present]
+            return [k for k in list(present.keys()) if k in bad]
+        for source in hits(bad_sources, self):
+            if source in self.mystruct: self.popitem(source)
+        for target in hits(bad_targets, self.targets):
+            self.remove_target(target, drop_sources)
+        return self
 
 FALSY_STRINGS = {'off', 'false', '0'}
 TRUTHY_STRINGS = {'on', 'true', '1'}
@@ -0,0 +1,173 @@
+import re
+import numpy as np
+from AIAmplitudes_common_public.file_readers import compressed_groups, compressed_prefixes, parse_coef, convert
+from AIAmplitudes_common_public.word_utils import encode_words, decode_words, pow6
+
+# Compact representation of (compressed) symbols as parallel arrays.
+# A key like 'Br_8_57abcdef' is held as a small basis id (57) and the packed code of its word part
+# (see word_utils), instead of one python string per key with the prefix repeated every time.
+# Entries are kept sorted by (basis, word), so all the terms of a basis element are one contiguous slice.
+# Full-format symbols are the special case of a single basis element with an empty prefix.
+# String keys are only built at the edges: from_dict / to_dict, and key lookups.
+
+keyre = re.compile(r'^(Br_\d+)_(\d+)([a-f]*)$')
+
+def match_key(key, reptype, length):
+    # 'Br_8_57abcd' -> (57, 'abcd'), None if the key cannot be in a symbol of this type and word length
+    if reptype == "full":
+        return (0, key) if len(key) == length and not key.strip('abcdef') else None
+    m = keyre.match(key)
+    if m is None or len(m.group(3)) != length or m.group(1) != compressed_prefixes[reptype][0].rsplit('_', 1)[0]:
+        return None
+    b = int(m.group(2))
+    if b >= len(compressed_prefixes[reptype]): return None
+    return b, m.group(3)
+
+def parse_key(key, reptype, length):
+    # 'Br_8_57abcd' -> (57, code of 'abcd'); full-format words -> (0, code)
+    matched = match_key(key, reptype, length)
+    if matched is None: raise KeyError(key)
+    return matched[0], int(encode_words([matched[1]], length)[0])
+
+def encode_keys(keys, reptype, length):
+    # string keys -> int64 sort keys basis * 6**length + word code, -1 for keys that cannot be in such a symbol
+    out = np.full(len(keys), -1, dtype=np.int64)
+    good, basis, words = [], [], []
+    for i, k in enumerate(keys):
+        matched = match_key(k, reptype, length)
+        if matched is None: continue
+        good.append(i); basis.append(matched[0]); words.append(matched[1])
+    if good: out[good] = np.array(basis, dtype=np.int64) * pow6(length) + encode_words(words, length)
+    return out
+
+class CompactSymb(object):
+    def __init__(self, basis, codes, coeffs, length, reptype="full"):
+        # basis: int array of basis ids, codes: int64 word codes, coeffs: int64, length: letters per word
+        if reptype not in {"full", "quad", "oct"}:
+            print("bad representation type!")
+            raise ValueError
+        self.reptype, self.length = reptype, length
+        self.prefixes = compressed_prefixes[reptype] if reptype != "full" else ['']
+        basis, codes = np.asarray(basis, dtype=np.int16), np.asarray(codes, dtype=np.int64)
+        coeffs = np.asarray(coeffs, dtype=np.int64)
+        order = np.lexsort((codes, basis))
+        self.basis, self.codes, self.coeffs = basis[order], codes[order], coeffs[order]
+        # start of every basis element's slice
+        self.starts = np.searchsorted(self.basis, np.arange(len(self.prefixes) + 1))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return f'CompactSymb({self.reptype}, {len(self)} terms, {self.length} letters per word, {self.nbytes()} bytes)'
+
+    def nbytes(self):
+        return self.basis.nbytes + self.codes.nbytes + self.coeffs.nbytes + self.starts.nbytes
+
+    def sortkeys(self):
+        # (basis, word) as one int64, in the order of the entries
+        return self.basis.astype(np.int64) * pow6(self.length) + self.codes
+
+    ####################################################################################################################
+    # lookups
+    ####################################################################################################################
+
+    def parse_key(self, key):
+        return parse_key(key, self.reptype, self.length)
+
+    def find(self, basis, codes):
+        # positions of (basis, code) pairs in the entries, -1 where absent
+        target = np.asarray(basis, dtype=np.int64) * pow6(self.length) + np.asarray(codes, dtype=np.int64)
+        keys = self.sortkeys()
+        pos = np.searchsorted(keys, target)
+        pos[pos == len(keys)] = 0
+        found = keys[pos] == target if len(keys) else np.zeros(len(pos), dtype=bool)
+        return np.where(found, pos, -1)
+
+    def get(self, key, default=None):
+        try:
+            b, code = self.parse_key(key)
+        except (KeyError, ValueError):
+            return default
+        start, end = self.starts[b], self.starts[b + 1]
+        i = start + np.searchsorted(self.codes[start:end], code)
+        if i < end and self.codes[i] == code: return int(self.coeffs[i])
+        return default
+
+    def __getitem__(self, key):
+        v = self.get(key)
+        if v is None: raise KeyError(key)
+        return v
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    ####################################################################################################################
+    # grouping by basis element
+    ####################################################################################################################
+
+    def basis_slice(self, b):
+        # (codes, coeffs) of all the terms of basis element b, as views
+        start, end = self.starts[b], self.starts[b + 1]
+        return self.codes[start:end], self.coeffs[start:end]
+
+    def groups(self):
+        # {basis id: (codes, coeffs)} for the non-empty basis elements
+        return {b: self.basis_slice(b) for b in range(len(self.prefixes)) if self.starts[b + 1] > self.starts[b]}
+
+    def counts(self):
+        return np.diff(self.starts)
+
+    ####################################################################################################################
+    # conversions at the edges
+    ####################################################################################################################
+
+    def keys(self):
+        words = decode_words(self.codes, self.length)
+        if self.reptype == "full": return words
+        return [self.prefixes[b] + w for b, w in zip(self.basis.tolist(), words)]
+
+    def items(self):
+        return zip(self.keys(), self.coeffs.tolist())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, symb, reptype=None):
+        # {'Br_8_57abcd': coeff, ...} or {word: coeff}; the type is guessed from the first key if not given
+        keys = list(symb.keys())
+        if reptype is None:
+            reptype = "full"
+            if keys and keys[0].startswith('Br_4_'): reptype = "quad"
+            elif keys and keys[0].startswith('Br_8_'): reptype = "oct"
+        coeffs = np.fromiter(symb.values(), dtype=np.int64, count=len(keys))
+        if reptype == "full":
+            length = len(keys[0]) if keys else 0
+            return cls(np.zeros(len(keys), dtype=np.int16), encode_words(keys, length), coeffs, length, reptype)
+        words = [k.lstrip('Br_0123456789') for k in keys]
+        basis = [int(k[5:len(k) - len(w)]) for k, w in zip(keys, words)]
+        length = len(words[0]) if words else 0
+        return cls(basis, encode_words(words, length), coeffs, length, reptype)
+
+def convert_compact(filename, loop=None, reptype=None):
+    '''
+    Read a symbol straight into a CompactSymb, without building the prefixed string keys.
+    ---------
+    INPUTS:
+    filename, loop, reptype: as for convert; reptype is "quad", "oct" or None/"full".
+
+    OUTPUTS:
+    symb: CompactSymb.
+    '''
+    if reptype not in {"quad", "oct"}:
+        symb = convert(filename, loop)
+        return CompactSymb.from_dict(symb, "full")
+    basis, words, coeffs = [], [], []
+    for i, ss in enumerate(compressed_groups(filename, loop, reptype)):
+        n = len(ss) // 2
+        basis += [i] * n
+        words += ss[1:2 * n:2]
+        coeffs += [parse_coef(t) for t in ss[0:2 * n:2]]
+    length = len(words[0]) if words else 0
+    return CompactSymb(basis, encode_words(words, length), coeffs, length, reptype)
@@ -3,13 +3,18 @@ import tempfile
 import tarfile
 from bs4 import BeautifulSoup
 import json
+import logging
 import os
 import requests
 from pathlib import Path
+from AIAmplitudes_common_public.instrumentation import span, event
 
 ################### Download tarballs from git ###############################
 public_repo =  "AIAmplitudes/data_public"
 def _cache_path(cache_dir: str | None = None) -> Path:
+    # AIAMPLITUDES_DATA_DIR points every loader at another data directory (e.g. synthetic data)
+    if cache_dir is None:
+        cache_dir = os.environ.get("AIAMPLITUDES_DATA_DIR")
     if cache_dir is None:
         ampdir = Path.home() / ".local" / "AIAmplitudesData"
         ampdir.mkdir(exist_ok=True, parents=True)
@@ -41,15 +46,15 @@ def download_unpack(myfile: str, local_dir: Path):
 def download_all(repo: str = public_repo, cache_dir: str | None = None) -> None:
     local_dir = _cache_path(cache_dir)
     if not len(os.listdir(local_dir))==0:
-        print("Local cache not empty! Terminating")
+        event("local cache not empty, not downloading", level=logging.WARNING, cache_dir=str(local_dir))
         return
-    print(f"downloading files from {repo}, unpacking in {local_dir}")
+    event("downloading", repo=repo, cache_dir=str(local_dir))
     url=f"https://github.com/{repo}"
     for file in get_gitfilenames(url):
         if not ".tar" in file: continue
         myfile = f"https://raw.githubusercontent.com/{repo}/main/{file}"
-        print(f"extracting {myfile}")
-        download_unpack(myfile,local_dir)
+        with span("download_unpack", file=myfile):
+            download_unpack(myfile,local_dir)
 
     #dump all files into the root directory
     for subdir, dirs, files in os.walk(local_dir):
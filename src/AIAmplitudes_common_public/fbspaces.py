@@ -33,10 +33,10 @@ frelnames = {1: 'isinglerels3',
              3: 'itriplerels33'}
 
 
-def get_perm_fspace(w):
+def get_perm_fspace(w, mydir=relpath):
     prefix='frontspace'
-    assert os.path.isfile(f'{relpath}/{prefix}')
-    mystr = ''.join(str.split(readSymb(f'{relpath}/{prefix}','frontspace',w)))
+    assert os.path.isfile(f'{mydir}/{prefix}')
+    mystr = ''.join(str.split(readSymb(f'{mydir}/{prefix}','frontspace',w)))
     newstr = re.split(":=|\[|\]", mystr)[4]
     dev = [elem + ")" if elem[-1] != ")" else elem for elem in newstr.split("),") if elem]
     basedict = {f'Fp_{w}_{i}': SB_to_dict(el) for i, el in enumerate(dev)}
@@ -47,10 +47,10 @@ def get_perm_fspace(w):
             flipdict[term][elem] = basedict[elem][term]
     return basedict, flipdict
 
-def get_perm_bspace(w):
+def get_perm_bspace(w, mydir=relpath):
     prefix = 'backspace'
-    assert os.path.isfile(f'{relpath}/{prefix}')
-    mystr = ''.join(str.split(readSymb(f'{relpath}/{prefix}', 'backspace', w)))
+    assert os.path.isfile(f'{mydir}/{prefix}')
+    mystr = ''.join(str.split(readSymb(f'{mydir}/{prefix}', 'backspace', w)))
     newstr = re.split(":=|\[|\]", mystr)[4]
     dev = [elem + ")" if elem[-1] != ")" else elem for elem in newstr.split("),") if elem]
     basedict = {f'Bp_{w}_{i}': SB_to_dict(el) for i, el in enumerate(dev)}
@@ -66,7 +66,8 @@ def get_rest_bspace(w):
     prefix = 'multifinal_new_norm'
     assert os.path.isfile(f'{relpath}/{prefix}')
     res=readSymb(f'{relpath}/{prefix}',str(bspacenames[w]))
-    myset = {elem for elem in re.split(":=\[|E\(|\)|\]:", re.sub('[, *]', '', res))[1:] if elem}
+    # in the order of the file, so the labels do not depend on the string hash seed
+    myset = list(dict.fromkeys(elem for elem in re.split(":=\[|E\(|\)|\]:", re.sub('[, *]', '', res))[1:] if elem))
     myd = {elem: f'Br_{w}_{i}' for i, elem in enumerate(myset)}
     flip = {f'Br_{w}_{i}': elem for i, elem in enumerate(myset)}
     return flip, myd
@@ -76,7 +77,8 @@ def get_rest_fspace(w):
     prefix='ClipFrontTriple'
     assert os.path.isfile(f'{relpath}/{prefix}')
     res=readSymb(f'{relpath}/{prefix}',str(fspacenames[w]))
-    myset = {elem for elem in re.split(":=\[|SB\(|\)|\]:", re.sub('[, *]', '', res))[1:] if elem}
+    # in the order of the file, so the labels do not depend on the string hash seed
+    myset = list(dict.fromkeys(elem for elem in re.split(":=\[|SB\(|\)|\]:", re.sub('[, *]', '', res))[1:] if elem))
     myd = {elem: f'Fr_{w}_{i}' for i, elem in enumerate(myset)}
     flip = {f'Fr_{w}_{i}': elem for i, elem in enumerate(myset)}
     return flip, myd
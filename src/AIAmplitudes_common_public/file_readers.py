@@ -3,19 +3,28 @@ from AIAmplitudes_common_public.download_data import _cache_path
 from fractions import Fraction
 relpath=_cache_path(None)
 
+compressed_prefixes = {"quad": [f'Br_4_{i}' for i in range(8)], "oct": [f'Br_8_{i}' for i in range(93)]}
+
+def compressed_groups(filename, loop, reptype):
+    #one [coef, word, coef, word, ...] list per basis element Br_4_i / Br_8_i, in order
+    if reptype== "oct":
+        base = readSymb(filename, 'Esymboct', loop)[:-2]
+    elif reptype == "quad":
+        base = readSymb(filename, 'Esymbquad', loop)[:-2]
+    base = re.sub(' ', '', base)
+    t = re.split(":=\[|\),|\)\]", base)[1:]
+    if len(t[-1]) == 0: t = t[:-1]
+    return [re.split(":=|SB\(|\)", re.sub('[, *]', '', tt)) for tt in t]
+
+def parse_coef(t):
+    #'-' -> -1, '+' -> 1, '-12' -> -12
+    return int(re.sub('[+-]$', t[0] + '1', t))
+
 def convert(filename, loop=None, reptype=None):
     #reptype: quad, oct, ae, aef, None
     if reptype in {"oct","quad"}:
-        if reptype== "oct":
-            base = readSymb(filename, 'Esymboct', loop)[:-2]
-            prefix = [f'Br_8_{i}' for i in range(93)]
-        elif reptype == "quad":
-            base = readSymb(filename, 'Esymbquad', loop)[:-2]
-            prefix = [f'Br_4_{i}' for i in range(8)]
-        base = re.sub(' ', '', base)
-        t = re.split(":=\[|\),|\)\]", base)[1:]
-        if len(t[-1]) == 0: t = t[:-1]
-        s = [re.split(":=|SB\(|\)", re.sub('[, *]', '', tt)) for tt in t]
+        prefix = compressed_prefixes[reptype]
+        s = compressed_groups(filename, loop, reptype)
         dev = []
         for i, ss in enumerate(s):
             for j, tt in enumerate(ss[1::2]):
@@ -27,11 +36,50 @@ def convert(filename, loop=None, reptype=None):
                                             readSymb(filename, 'Esymb', loop)))[1:-1]
 
     keys = dev[1::2]
-    values = [int(re.sub('[+-]$', t[0] + '1', t)) for t in dev[0::2]]
+    values = [parse_coef(t) for t in dev[0::2]]
     out_dict = {k:v for k, v in zip(keys, values)}
 
     return out_dict
 
+symb_term_re = re.compile(r'(,?)([+-]?)(\d*)\*?SB\(([a-f,]*)\)')
+
+def iter_symb_terms(filename, loop=None, reptype=None):
+    #streaming version of convert: yields (key, coeff) one term at a time, reading the file line by line,
+    #so the whole expression is never held in memory. reptype: quad, oct or None (full)
+    if reptype in {"oct", "quad"}:
+        mypref, prefix = f'Esymb{reptype}[{loop}]', compressed_prefixes[reptype]
+    else:
+        mypref, prefix = f'Esymb[{loop}]', None
+    assert os.path.isfile(filename)
+    group, buf, started = 0, '', False
+    with open(filename, 'rt') as f:
+        for line in _iter_form_lines(f, mypref):
+            buf += line
+            if not started:
+                if ':=' not in buf: continue
+                buf, started = buf[buf.index(':=') + 2:], True
+            end = 0
+            for m in symb_term_re.finditer(buf):
+                sep, sign, digits, word = m.groups()
+                # a comma between two terms starts the next basis element (quad / oct)
+                if sep and prefix is not None: group += 1
+                word = word.replace(',', '')
+                yield (prefix[group] + word if prefix else word), int(sign + (digits or '1'))
+                end = m.end()
+            buf = buf[end:]
+
+def _iter_form_lines(f, prefix):
+    #the lines of one form, as readFile, with the line continuations removed
+    reading_form = False
+    for line in f:
+        if not reading_form:
+            if not line.startswith(prefix): continue
+            reading_form = True
+        if line.isspace(): break
+        yield line[:-2] if line[-2] == '\\' else line[:-1]
+        if line[-2] in [":", ";"]:
+            break
+
 def readSymb(filename, prefix, loop=None):
     #read a symbol, given a filename and prefix
     assert os.path.isfile(filename)
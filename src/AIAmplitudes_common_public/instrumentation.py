@@ -0,0 +1,236 @@
+import collections
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+# Structured timing and counters for the preprocessing / data paths.
+# span(name, **fields) times a block (wall and cpu) and records the counters incremented inside it;
+# count(name, n) bumps a named counter; event(name, **fields) is a one-off message.
+# Records go to every configured sink: LoggingSink (default, logger "AIAmplitudes_common_public" at INFO),
+# JsonLinesSink (one json record per line, for aggregating many jobs) and WandbSink (an existing wandb run).
+# Sampling profilers can be attached to spans with add_profiler_hook.
+#
+#   configure(sinks=[JsonLinesSink("gen.jsonl"), LoggingSink()], tags={"job": 17})
+#   with span("opsymb_generator", loop=6): ...
+#   flush()   # emits the counter totals
+#   configure(enabled=False)   # everything becomes a no-op
+
+logger = logging.getLogger("AIAmplitudes_common_public")
+hostname = socket.gethostname()
+
+class _State(object):
+    def __init__(self):
+        self.enabled = True
+        self.sinks = [LoggingSink()]
+        self.tags = {}
+        self.hooks = []
+        self.counters = collections.Counter()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'): self.local.stack = []
+        return self.local.stack
+
+########################################################################################################################
+# sinks
+########################################################################################################################
+
+class LoggingSink(object):
+    def __init__(self, level=logging.INFO, mylogger=None):
+        self.level = level
+        self.logger = mylogger if mylogger is not None else logger
+
+    def emit(self, record):
+        if not self.logger.isEnabledFor(max(self.level, record.get('level', self.level))): return
+        fields = ' '.join(f'{k}={v}' for k, v in record.get('fields', {}).items())
+        if record['kind'] == 'span':
+            counts = ' '.join(f'{k}={v}' for k, v in record['counters'].items())
+            self.logger.log(self.level, f"{record['name']}: {record['wall_s']:.3f}s {fields} {counts}".rstrip())
+        elif record['kind'] == 'counters':
+            self.logger.log(self.level, ' '.join(f'{k}={v}' for k, v in record['counters'].items()))
+        elif record['kind'] == 'profile':
+            self.logger.log(self.level, f"{record['name']}: {record['n_samples']} samples")
+        else:
+            self.logger.log(max(self.level, record.get('level', self.level)), f"{record['name']} {fields}".rstrip())
+
+    def close(self):
+        pass
+
+class JsonLinesSink(object):
+    # appends one json object per record; safe to share a path between processes (one write per line)
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'a', buffering=1)
+
+    def emit(self, record):
+        self.f.write(json.dumps(record, default=str) + '\n')
+
+    def close(self):
+        self.f.close()
+
+class WandbSink(object):
+    # logs span timings as time/<name> and counters as count/<name> to a wandb run (the current one by default)
+    def __init__(self, run=None):
+        if run is None:
+            import wandb
+            run = wandb.run
+            if run is None:
+                print("no active wandb run! call wandb.init() first")
+                raise ValueError
+        self.run = run
+
+    def emit(self, record):
+        if record['kind'] == 'span':
+            self.run.log({f"time/{record['name']}": record['wall_s'],
+                          **{f"count/{k}": v for k, v in record['counters'].items()}})
+        elif record['kind'] == 'counters':
+            self.run.log({f"total/{k}": v for k, v in record['counters'].items()})
+
+    def close(self):
+        pass
+
+########################################################################################################################
+# spans, counters, events
+########################################################################################################################
+
+_state = _State()
+
+def configure(sinks=None, enabled=None, tags=None):
+    # sinks replace the current ones; tags (e.g. a job id) are added to every record
+    if sinks is not None:
+        for s in _state.sinks:
+            if s not in sinks: s.close()
+        _state.sinks = list(sinks)
+    if enabled is not None: _state.enabled = enabled
+    if tags is not None: _state.tags = dict(tags)
+
+def _emit(record):
+    record.update({'time': time.time(), 'pid': os.getpid(), 'host': hostname, **_state.tags})
+    for s in _state.sinks: s.emit(record)
+
+def count(name, n=1):
+    if not _state.enabled: return
+    with _state.lock:
+        _state.counters[name] += n
+
+def counters():
+    with _state.lock:
+        return dict(_state.counters)
+
+def event(name, level=logging.INFO, **fields):
+    if not _state.enabled: return
+    _emit({'kind': 'event', 'name': name, 'level': level, 'fields': fields})
+
+def flush(reset=True):
+    # emit the counter totals since the last flush
+    if not _state.enabled: return
+    with _state.lock:
+        totals = dict(_state.counters)
+        if reset: _state.counters.clear()
+    _emit({'kind': 'counters', 'name': 'counters', 'counters': totals})
+
+class span(object):
+    # times a block; nested spans get names like "outer/inner"
+    def __init__(self, name, **fields):
+        self.name, self.fields = name, fields
+
+    def __enter__(self):
+        if not _state.enabled: return self
+        stack = _state.stack()
+        self.path = '/'.join([s.name for s in stack] + [self.name])
+        stack.append(self)
+        self.counts = counters()
+        for hook in _state.hooks: hook.start(self)
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        if not _state.enabled or not hasattr(self, 'path'): return False
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        for hook in _state.hooks: hook.stop(self)
+        _state.stack().pop()
+        now = counters()
+        delta = {k: v - self.counts.get(k, 0) for k, v in now.items() if v != self.counts.get(k, 0)}
+        record = {'kind': 'span', 'name': self.path, 'wall_s': wall, 'cpu_s': cpu, 'fields': self.fields,
+                  'counters': delta}
+        if exc[0] is not None: record['error'] = repr(exc[1])
+        _emit(record)
+        return False
+
+def timed(name=None):
+    # decorator form of span
+    def wrap(f):
+        def inner(*args, **kwargs):
+            with span(name or f.__name__):
+                return f(*args, **kwargs)
+        inner.__name__, inner.__doc__ = f.__name__, f.__doc__
+        return inner
+    return wrap
+
+########################################################################################################################
+# profiler hooks
+########################################################################################################################
+
+def add_profiler_hook(hook):
+    # hook: object with start(span) and stop(span), called on entering/leaving every span
+    _state.hooks.append(hook)
+
+def remove_profiler_hook(hook):
+    _state.hooks.remove(hook)
+
+class SamplingProfiler(object):
+    '''
+    Stack-sampling profiler for selected spans, stdlib only.
+    ---------
+    INPUTS:
+    spans: set or None; span names (last path component) to profile, None for top-level spans only.
+    interval: float; seconds between samples.
+    depth: int; max number of frames kept per sample.
+    outdir: str or None; if given, collapsed stacks (flamegraph.pl / speedscope format) are written there.
+
+    Each profiled span emits a 'profile' record with its most frequent stacks.
+    '''
+    def __init__(self, spans=None, interval=0.005, depth=40, outdir=None, top=20):
+        self.spans, self.interval, self.depth, self.outdir, self.top = spans, interval, depth, outdir, top
+        self.active = {}
+
+    def wanted(self, sp):
+        if self.spans is None: return '/' not in sp.path
+        return sp.name in self.spans
+
+    def start(self, sp):
+        if not self.wanted(sp) or id(sp) in self.active: return
+        samples, done = collections.Counter(), threading.Event()
+        ident = threading.get_ident()
+
+        def sample():
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(ident)
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}'
+                                 f':{frame.f_lineno})')
+                    frame = frame.f_back
+                samples[';'.join(reversed(stack))] += 1
+
+        thread = threading.Thread(target=sample, daemon=True)
+        self.active[id(sp)] = (samples, done, thread)
+        thread.start()
+
+    def stop(self, sp):
+        if id(sp) not in self.active: return
+        samples, done, thread = self.active.pop(id(sp))
+        done.set()
+        thread.join()
+        if self.outdir is not None:
+            os.makedirs(self.outdir, exist_ok=True)
+            fname = os.path.join(self.outdir, f"{sp.path.replace('/', '.')}.{os.getpid()}.{int(time.time())}.collapsed")
+            with open(fname, 'w') as f:
+                for stack, n in samples.items(): f.write(f'{stack} {n}\n')
+        _emit({'kind': 'profile', 'name': sp.path, 'n_samples': sum(samples.values()),
+               'stacks': samples.most_common(self.top)})
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import math
+import re
+import sys
+import threading
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+# Membership tests for symbols and bad-target sets, without python sets of strings.
+# Every key is packed into one int64 (member_code):
+#   a word of up to 23 letters is the base-6 number '1' + letters, i.e. 6**len + code, unique across lengths;
+#   a compressed key 'Br_4_i'/'Br_8_i' + word is a negative number built from the basis id and the packed word;
+#   anything else falls back to a 62-bit blake2b hash.
+# PackedSet keeps the sorted codes (8 bytes per key, exact); BloomFilter keeps k hash bits per key
+# (about 10 bits per key for a 1% false-positive rate), so "not in" is always right and "in" may be wrong.
+# Both live in one flat array that can be saved and memory-mapped, or put in shared memory:
+# pickling one (e.g. to send it to a multiprocessing worker) sends only the file path or shared memory name,
+# and the worker maps the same pages, so nothing is copied.
+#
+#   bad = PackedSet.from_keys(badsymb)             # or BloomFilter.from_keys(badsymb, fp_rate=1e-3)
+#   bad.save("bad.mset"); bad = load_membership("bad.mset")
+#   bad = bad.to_shared_memory()                   # then pass it to Pool workers
+#   prune_opsymb(opsymb, bad_sources, bad)         # the prune functions only use `in`
+
+_to_digits = str.maketrans('abcdef', '012345')
+_keyre = re.compile(r'^Br_(\d+)_(\d+)([a-f]*)$')
+max_plain_len = 23
+max_compressed_len = 20
+_compressed_span = 2 * 6 ** max_compressed_len
+_hash_bit = 1 << 62
+
+def member_code(key):
+    # str key -> int, see the comments above
+    if len(key) <= max_plain_len and not key.strip('abcdef'):
+        return int('1' + key.translate(_to_digits), 6)
+    m = _keyre.match(key)
+    if m is not None and len(m.group(3)) <= max_compressed_len and int(m.group(2)) < 128:
+        word = int('1' + m.group(3).translate(_to_digits), 6)
+        return -(((int(m.group(1)) << 7) + int(m.group(2)) + 1) * _compressed_span + word)
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') >> 2 | _hash_bit
+
+def _iter_keys(keys):
+    return keys.keys() if hasattr(keys, 'keys') else keys
+
+def member_codes(keys):
+    keys = list(keys)
+    return np.fromiter((member_code(k) for k in keys), dtype=np.int64, count=len(keys))
+
+def _mix(x):
+    # splitmix64 finalizer, vectorized on uint64
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+_mask64 = (1 << 64) - 1
+
+def _mix_int(x):
+    # same as _mix, on one python int, for scalar lookups
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _mask64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _mask64
+    return x ^ (x >> 31)
+
+class _Membership(object):
+    # shared storage: one flat array (self.data) plus a small json header
+    kind = None
+
+    def __init__(self, data, meta, path=None, shm=None):
+        self.data, self.meta, self.path, self.shm = data, meta, path, shm
+
+    def save(self, path):
+        head = json.dumps({'kind': self.kind, **self.meta}).encode('ascii')
+        with open(path, 'wb') as f:
+            f.write(len(head).to_bytes(8, 'little') + head + b'\0' * (-(8 + len(head)) % 8))
+            f.write(np.ascontiguousarray(self.data).tobytes())
+        return load_membership(path)
+
+    def to_shared_memory(self, name=None):
+        # copy once into a shared memory block; the result pickles by name
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(self.data.nbytes, 1))
+        data = np.ndarray(self.data.shape, dtype=self.data.dtype, buffer=shm.buf)
+        data[:] = self.data
+        # the block may be rounded up to whole pages (macOS), so its size does not give the number of entries
+        return type(self)(data, {**self.meta, 'length': len(self.data)}, shm=shm)
+
+    def close(self, unlink=False):
+        # release a shared memory block (unlink=True in the process that created it, once workers are done)
+        if self.shm is not None:
+            self.data = None
+            self.shm.close()
+            if unlink: self.shm.unlink()
+
+    def __reduce__(self):
+        if self.path is not None: return load_membership, (self.path,)
+        if self.shm is not None: return _attach_shared, (self.kind, self.shm.name, self.meta)
+        return type(self), (self.data, self.meta)
+
+    def __contains__(self, key):
+        return bool(self.contains_codes(np.array([member_code(key)], dtype=np.int64))[0])
+
+    def contains_many(self, keys):
+        return self.contains_codes(member_codes(keys))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def nbytes(self):
+        return self.data.nbytes
+
+class PackedSet(_Membership):
+    # exact: sorted unique member codes, binary search
+    kind = 'packedset'
+
+    @classmethod
+    def from_keys(cls, keys):
+        '''
+        Build the exact set in bulk.
+        ---------
+        INPUTS:
+        keys: iterable of str, or a symbol (dict or CompactSymb), whose keys are used.
+
+        OUTPUTS:
+        packed: PackedSet; 8 bytes per distinct key.
+        '''
+        return cls(np.unique(member_codes(_iter_keys(keys))), {})
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f'PackedSet({len(self)} keys, {self.nbytes()} bytes)'
+
+    def contains_codes(self, codes):
+        if len(self.data) == 0: return np.zeros(len(codes), dtype=bool)
+        pos = np.searchsorted(self.data, codes)
+        pos[pos == len(self.data)] = 0
+        return self.data[pos] == codes
+
+class BloomFilter(_Membership):
+    # approximate: k bits per key out of m, false positives at about fp_rate, never false negatives
+    kind = 'bloom'
+
+    @classmethod
+    def from_keys(cls, keys, fp_rate=0.01, chunksize=2**20):
+        '''
+        Build the filter in bulk, sized for the number of keys and the false-positive rate.
+        ---------
+        INPUTS:
+        keys: iterable of str, or a symbol (dict or CompactSymb), whose keys are used.
+        fp_rate: float; target probability that a key that was not added tests as present.
+        chunksize: int; keys hashed per vectorized step.
+
+        OUTPUTS:
+        bloom: BloomFilter; -log2(fp_rate) / ln 2 bits per key (9.6 at 1%).
+        '''
+        keys = list(_iter_keys(keys))
+        n = max(len(keys), 1)
+        m = max(64, int(math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2)))
+        m = -(-m // 64) * 64
+        k = max(1, int(round(m / n * math.log(2))))
+        bf = cls(np.zeros(m // 8, dtype=np.uint8), {'m': m, 'k': k, 'n': len(keys), 'fp_rate': fp_rate})
+        for start in range(0, len(keys), chunksize):
+            bits = bf.bit_positions(member_codes(keys[start:start + chunksize])).ravel()
+            np.bitwise_or.at(bf.data, bits >> np.uint64(3), (np.uint8(1) << (bits & np.uint64(7)).astype(np.uint8)))
+        return bf
+
+    def __len__(self):
+        return self.meta['n']
+
+    def __repr__(self):
+        return (f"BloomFilter({self.meta['n']} keys, {self.meta['m']} bits, k={self.meta['k']}, "
+                f"fp_rate~{self.meta['fp_rate']})")
+
+    def bit_positions(self, codes):
+        # double hashing: h1 + i * h2, for i < k
+        with np.errstate(over='ignore'):
+            x = np.asarray(codes, dtype=np.int64).view(np.uint64)
+            h1, h2 = _mix(x), _mix(x ^ np.uint64(0x9e3779b97f4a7c15)) | np.uint64(1)
+            i = np.arange(self.meta['k'], dtype=np.uint64)
+            return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.meta['m'])
+
+    def __contains__(self, key):
+        x = member_code(key) & _mask64
+        h1, h2 = _mix_int(x), _mix_int(x ^ 0x9e3779b97f4a7c15) | 1
+        m, data = self.meta['m'], self.data
+        for i in range(self.meta['k']):
+            bit = ((h1 + i * h2) & _mask64) % m
+            if not (data[bit >> 3] >> (bit & 7)) & 1: return False
+        return True
+
+    def contains_codes(self, codes):
+        bits = self.bit_positions(codes)
+        return ((self.data[bits >> np.uint64(3)] >> (bits & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+_kinds = {'packedset': PackedSet, 'bloom': BloomFilter}
+
+def load_membership(path, mmap=True):
+    # open a saved PackedSet / BloomFilter; with mmap, the pages are shared by every process that opens it
+    with open(path, 'rb') as f:
+        hlen = int.from_bytes(f.read(8), 'little')
+        meta = json.loads(f.read(hlen).decode('ascii'))
+    kind = meta.pop('kind')
+    cls = _kinds[kind]
+    offset = 8 + hlen + (-(8 + hlen) % 8)
+    dtype = np.int64 if kind == 'packedset' else np.uint8
+    count = (_file_size(path) - offset) // np.dtype(dtype).itemsize
+    if mmap and count:
+        data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+    else:
+        data = np.fromfile(path, dtype=dtype, offset=offset)
+    return cls(data, meta, path=path)
+
+def _file_size(path):
+    with open(path, 'rb') as f:
+        return f.seek(0, 2)
+
+_attach_lock = threading.Lock()
+
+def attach_shared_memory(name):
+    # attach to a shared memory block created elsewhere, without handing it to this process's resource_tracker:
+    # before python 3.13 every SharedMemory(name=...) registers the block, and the tracker of an unrelated process
+    # unlinks it when that process exits. Only the creator unlinks (close(unlink=True)).
+    if sys.version_info >= (3, 13): return shared_memory.SharedMemory(name=name, track=False)
+    target = name.lstrip('/')
+    with _attach_lock:
+        register = resource_tracker.register
+        def register_others(rname, rtype):
+            if rtype != 'shared_memory' or rname.lstrip('/') != target: register(rname, rtype)
+        resource_tracker.register = register_others
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def _attach_shared(kind, name, meta):
+    shm = attach_shared_memory(name)
+    cls = _kinds[kind]
+    dtype = np.int64 if kind == 'packedset' else np.uint8
+    n = meta['length']
+    data = np.ndarray((n,), dtype=dtype, buffer=shm.buf)
+    return cls(data, meta, shm=shm)
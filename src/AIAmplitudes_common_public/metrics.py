@@ -0,0 +1,193 @@
+import math
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import alphabet, dihedral_table
+from AIAmplitudes_common_public.compact_symb import encode_keys, compressed_prefixes
+from AIAmplitudes_common_public.word_utils import (codes_to_array, array_to_codes, pow6, valid_first, valid_last,
+                                                   valid_next)
+
+# Accuracy of a predicted symbol against the truth, as array operations on a shared word index.
+# Both symbols are encoded to the int64 sort keys of CompactSymb and joined on the union of their keys;
+# each metric is then a boolean array over that union, and every breakdown (by prefix, trivial-zero status,
+# dihedral orbit, ...) is a bincount over an integer label per word.
+#
+#   al = align_symbs(predicted, truth)
+#   al.summary()                       # exact / magnitude / sign accuracy, missing and extra words
+#   al.breakdown(al.prefix_labels(2))  # per first-two-letters accuracy
+#   al.by_orbit()                      # accuracy per dihedral orbit
+
+# dihedral_table as letter index permutations
+_dihedral_perms = np.array([[alphabet.index(l) for l in row] for row in dihedral_table], dtype=np.uint8)
+
+def symb_arrays(symb, reptype=None, length=None):
+    # {key: coeff} -> (sort keys, coeffs, valid, reptype, length); coeffs that are None count as invalid.
+    # Coeffs must be integers (float predictions such as 15.0 are fine): a non-integral one raises, rather than
+    # being truncated into an exact hit.
+    keys = list(symb.keys())
+    if reptype is None:
+        reptype = "full"
+        if keys and keys[0].startswith('Br_4_'): reptype = "quad"
+        elif keys and keys[0].startswith('Br_8_'): reptype = "oct"
+    if length is None:
+        length = len(keys[0]) if keys else 0
+        if reptype != "full" and keys: length = len(keys[0].lstrip('Br_0123456789'))
+    values = list(symb.values())
+    raw = np.array(values)
+    if raw.dtype.kind in 'iub':
+        coeffs, valid = raw.astype(np.int64), np.ones(len(keys), dtype=bool)
+    else:
+        valid = np.array([v is not None for v in values], dtype=bool)
+        raw = [v if v is not None else 0 for v in values]
+        bad = [v for v in raw if not (math.isfinite(v) and v == int(v))]
+        if bad:
+            print(f"{len(bad)} coeffs are not integers (e.g. {bad[0]}): round the predictions first!")
+            raise ValueError
+        coeffs = np.array([int(v) for v in raw], dtype=np.int64)
+    return encode_keys(keys, reptype, length), coeffs, valid, reptype, length
+
+def align_symbs(pred, truth, reptype=None):
+    '''
+    Join a predicted symbol and the true symbol on the union of their words.
+    ---------
+    INPUTS:
+    pred: dict; {word: predicted coeff}, coeffs may be None for invalid predictions.
+    truth: dict; {word: true coeff}.
+    reptype: str or None; "full", "quad" or "oct", guessed from the keys if None.
+
+    OUTPUTS:
+    aligned: AlignedSymbs.
+    '''
+    tkeys, tcoeffs, _, reptype, length = symb_arrays(truth, reptype)
+    pkeys, pcoeffs, pvalid, _, _ = symb_arrays(pred, reptype, length)
+    n_malformed = int((pkeys < 0).sum())
+    keep = pkeys >= 0
+    pkeys, pcoeffs, pvalid = pkeys[keep], pcoeffs[keep], pvalid[keep]
+
+    keys = np.union1d(tkeys, pkeys)
+    truth_c, pred_c = np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=np.int64)
+    in_truth, in_pred = np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=bool)
+    valid = np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(keys, tkeys)
+    truth_c[pos], in_truth[pos] = tcoeffs, True
+    pos = np.searchsorted(keys, pkeys)
+    pred_c[pos], in_pred[pos], valid[pos] = pcoeffs, True, pvalid
+    return AlignedSymbs(keys, truth_c, pred_c, in_truth, in_pred, valid, reptype, length, n_malformed)
+
+class AlignedSymbs(object):
+    def __init__(self, keys, truth, pred, in_truth, in_pred, valid, reptype, length, n_malformed=0):
+        self.keys, self.truth, self.pred = keys, truth, pred
+        self.in_truth, self.in_pred, self.valid = in_truth, in_pred, valid
+        self.reptype, self.length, self.n_malformed = reptype, length, n_malformed
+        self.shared = in_truth & in_pred
+        scored = self.shared & valid
+        self.exact = scored & (pred == truth)
+        self.magnitude = scored & (np.abs(pred) == np.abs(truth))
+        self.sign = scored & (np.sign(pred) == np.sign(truth))
+        self.missing = in_truth & ~in_pred
+        self.extra = in_pred & ~in_truth
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return f'AlignedSymbs({self.reptype}, {int(self.in_truth.sum())} true, {int(self.in_pred.sum())} predicted)'
+
+    def summary(self):
+        # accuracies are over the words in both symbols; invalid predictions count as wrong
+        n_shared = int(self.shared.sum())
+        out = {'n_truth': int(self.in_truth.sum()), 'n_pred': int(self.in_pred.sum()), 'n_shared': n_shared,
+               'n_missing': int(self.missing.sum()), 'n_extra': int(self.extra.sum()),
+               'n_invalid': int((self.in_pred & ~self.valid).sum()), 'n_malformed': self.n_malformed}
+        for name in ('exact', 'magnitude', 'sign'):
+            out[name] = int(getattr(self, name).sum()) / n_shared if n_shared else None
+        return out
+
+    ####################################################################################################################
+    # labels for breakdowns
+    ####################################################################################################################
+
+    def words(self):
+        # the word part of every key, as an (N, length) letter array
+        return codes_to_array(self.keys % pow6(self.length), self.length)
+
+    def basis_labels(self):
+        # basis element id of every key (0 for the full format)
+        return (self.keys // pow6(self.length)).astype(np.int64)
+
+    def prefix_labels(self, k=1):
+        # code of the first k letters of the word part (for quad/oct: together with the basis element)
+        return self.keys // pow6(self.length - k)
+
+    def trivial_zero_labels(self):
+        # 1 where the word is a trivial zero (bad first or last entry, or a forbidden adjacent pair), else 0.
+        # for quad/oct, the last letters are in the basis element, so only the front and adjacency rules apply.
+        letters = self.words()
+        bad = np.zeros(len(self.keys), dtype=bool)
+        if self.length == 0: return bad.astype(np.int64)
+        bad |= ~valid_first[letters[:, 0]]
+        if self.reptype == "full": bad |= ~valid_last[letters[:, -1]]
+        if self.length > 1:
+            bad |= (~valid_next[letters[:, :-1], letters[:, 1:]]).any(axis=1)
+        return bad.astype(np.int64)
+
+    def orbit_labels(self):
+        # smallest code among the six dihedral images of each word, i.e. one label per orbit
+        if self.reptype != "full":
+            print("dihedral orbits are only defined for full-format words!")
+            raise ValueError
+        letters = self.words()
+        return np.min([array_to_codes(perm[letters]) for perm in _dihedral_perms], axis=0)
+
+    ####################################################################################################################
+    # breakdowns
+    ####################################################################################################################
+
+    def breakdown(self, labels):
+        '''
+        Counts of every metric per label.
+        ---------
+        INPUTS:
+        labels: int array; one label per aligned word, e.g. from prefix_labels or trivial_zero_labels.
+
+        OUTPUTS:
+        groups: dict; 'labels' holds the distinct labels, every other entry an array of counts per label
+                (n_truth, n_pred, n_shared, exact, magnitude, sign, missing, extra).
+        '''
+        groups, inv = np.unique(labels, return_inverse=True)
+        inv = inv.ravel()
+        out = {'labels': groups}
+        for name, mask in (('n_truth', self.in_truth), ('n_pred', self.in_pred), ('n_shared', self.shared),
+                           ('exact', self.exact), ('magnitude', self.magnitude), ('sign', self.sign),
+                           ('missing', self.missing), ('extra', self.extra)):
+            out[name] = np.bincount(inv, weights=mask, minlength=len(groups)).astype(np.int64)
+        return out
+
+    def by_prefix(self, k=1):
+        out = self.breakdown(self.prefix_labels(k))
+        out['labels'] = self.label_names(out['labels'], k)
+        return out
+
+    def by_trivial_zero(self):
+        return self.breakdown(self.trivial_zero_labels())
+
+    def by_orbit(self):
+        # per-orbit counts, plus the fraction of orbits whose shared words are all exactly right
+        out = self.breakdown(self.orbit_labels())
+        has = out['n_shared'] > 0
+        out['orbits_all_exact'] = float((out['exact'][has] == out['n_shared'][has]).mean()) if has.any() else None
+        return out
+
+    def label_names(self, prefixes, k):
+        # prefix codes -> strings such as 'ab' or 'Br_8_57ab'
+        basis, words = np.divmod(np.asarray(prefixes, dtype=np.int64), pow6(k))
+        names = [''.join(alphabet[i] for i in row) for row in codes_to_array(words, k)]
+        if self.reptype == "full": return names
+        return [compressed_prefixes[self.reptype][b] + w for b, w in zip(basis.tolist(), names)]
+
+def compare_symbs(pred, truth, prefix_len=1, reptype=None):
+    # summary plus the prefix and trivial-zero breakdowns (and dihedral orbits for the full format)
+    al = align_symbs(pred, truth, reptype)
+    out = al.summary()
+    out['by_prefix'] = al.by_prefix(prefix_len)
+    out['by_trivial_zero'] = al.by_trivial_zero()
+    if al.reptype == "full": out['orbits_all_exact'] = al.by_orbit()['orbits_all_exact']
+    return out
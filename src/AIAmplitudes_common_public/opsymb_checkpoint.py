@@ -0,0 +1,351 @@
+import array
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import alphabet
+from AIAmplitudes_common_public.commonclasses import fastRandomSampler, OpSymb
+from AIAmplitudes_common_public.instrumentation import span, count, event
+
+# Columnar checkpoints of operator symbols {source: {target: {argtups}}} (opsymb_generator / get_mapdict),
+# written as a directory of .npy files that are memory-mapped on load:
+#   sources, targets: fixed-width byte strings; every target is stored once and referenced by id,
+#   edge_offsets: the targets of source i are edges edge_offsets[i]:edge_offsets[i+1], edge_target: their target ids,
+#   arg_offsets: the argtups of edge j are arg_offsets[j]:arg_offsets[j+1], arg_id: their ids in the arg vocabulary,
+#   args_<n>: the distinct argtups with the n-th shape (meta 'templates', e.g. '((i,i),(l,l))', l for a letter),
+#             flattened to one int64 row each; ids are contiguous per shape.
+#   index_targets, index_offsets, index_sources: for an OpSymb, its target -> sources index (ids into the tables).
+# Every level is stored in its sampler's keylist order, and the top-level countdict is kept, so a restored
+# symbol is in the same sampling state as the saved one: what has been popped stays popped.
+#
+#   save_opsymb(opsymb, "ckpt/strike6")
+#   ck = load_opsymb("ckpt/strike6")          # memory-mapped columns; ck.entry(i) reads one source
+#   opsymb = ck.to_opsymb()                   # the OpSymb again, without calling any operator
+#   opsymb = resumable_opsymb_generator("ckpt/strike6_parts", sourcesymb, ...)  # restart-safe generation
+
+format_version = 1
+_columns = ('sources', 'targets', 'edge_offsets', 'edge_target', 'arg_offsets', 'arg_id')
+_index_columns = ('index_targets', 'index_offsets', 'index_sources')
+
+########################################################################################################################
+# argtups <-> (shape template, int row)
+########################################################################################################################
+
+def _flatten_arg(arg, vals):
+    if isinstance(arg, tuple):
+        return '(' + ','.join(_flatten_arg(a, vals) for a in arg) + ')'
+    if isinstance(arg, (int, np.integer)) and not isinstance(arg, bool):
+        vals.append(int(arg))
+        return 'i'
+    if isinstance(arg, str) and len(arg) == 1 and arg in alphabet:
+        vals.append(alphabet.index(arg))
+        return 'l'
+    print(f"cannot checkpoint op arg {arg!r}: only nested tuples of ints and letters are supported!")
+    raise ValueError
+
+def _build_arg(template, vals):
+    # inverse of _flatten_arg; vals is an iterator over the row
+    def parse(i):
+        c = template[i]
+        if c == 'i': return next(vals), i + 1
+        if c == 'l': return alphabet[next(vals)], i + 1
+        items, i = [], i + 1
+        while template[i] != ')':
+            item, i = parse(i)
+            items.append(item)
+            if template[i] == ',': i += 1
+        return tuple(items), i + 1
+    return parse(0)[0]
+
+def _keyorder(x):
+    # keys in sampling order: the keylist of a sampler, else the iteration order
+    if isinstance(x, fastRandomSampler): return x.keylist
+    return list(x.keys()) if isinstance(x, dict) else list(x)
+
+def _leaf(x):
+    return x.mystruct if isinstance(x, fastRandomSampler) else x
+
+def _strings(words):
+    width = max((len(w) for w in words), default=1)
+    return np.array(words, dtype=f'S{max(width, 1)}')
+
+########################################################################################################################
+# save
+########################################################################################################################
+
+def save_opsymb(opsymb, path, extra=None):
+    '''
+    Write an operator symbol to a columnar checkpoint directory.
+    ---------
+    INPUTS:
+    opsymb: OpSymb, fastRandomSampler or dict; {source: {target: {argtups}}}, inner levels samplers or plain dicts/sets.
+    path: str; output directory, replaced atomically (written to path + '.tmp', then renamed).
+    extra: dict or None; json-serializable info stored in the metadata (e.g. op name, loop, progress).
+
+    OUTPUTS:
+    path: str.
+    '''
+    with span("save_opsymb"):
+        sources, targets, target_id = [], [], {}
+        edge_offsets, edge_target = array.array('q', [0]), array.array('q')
+        arg_offsets, raw_arg_id = array.array('q', [0]), array.array('q')
+        vocab, templates, template_id, vocab_template, vocab_vals = {}, [], {}, array.array('q'), []
+        top = opsymb.mystruct if isinstance(opsymb, fastRandomSampler) else opsymb
+        for source in _keyorder(opsymb):
+            sources.append(source)
+            tgts = top[source]
+            tgt_struct = _leaf(tgts)
+            for target in _keyorder(tgts):
+                if target not in target_id:
+                    target_id[target] = len(targets)
+                    targets.append(target)
+                edge_target.append(target_id[target])
+                argset = tgt_struct[target]
+                for arg in _keyorder(argset):
+                    if arg not in vocab:
+                        vals = []
+                        template = _flatten_arg(arg, vals)
+                        if template not in template_id:
+                            template_id[template] = len(templates)
+                            templates.append(template)
+                        vocab[arg] = len(vocab)
+                        vocab_template.append(template_id[template])
+                        vocab_vals.append(vals)
+                    raw_arg_id.append(vocab[arg])
+                arg_offsets.append(len(raw_arg_id))
+            edge_offsets.append(len(edge_target))
+
+        # renumber the vocabulary so that the ids of every shape are contiguous
+        vocab_template = np.frombuffer(vocab_template, dtype=np.int64) if len(vocab_template) else \
+            np.zeros(0, dtype=np.int64)
+        order = np.argsort(vocab_template, kind='stable')
+        renumber = np.empty(len(order), dtype=np.int64)
+        renumber[order] = np.arange(len(order))
+        arg_id = renumber[np.frombuffer(raw_arg_id, dtype=np.int64)] if len(raw_arg_id) else np.zeros(0, np.int64)
+        template_offsets = np.searchsorted(vocab_template[order], np.arange(len(templates) + 1)).tolist()
+
+        index = {}
+        if isinstance(opsymb, OpSymb):
+            source_id = {source: i for i, source in enumerate(sources)}
+            index_offsets, index_sources = array.array('q', [0]), array.array('q')
+            for target in opsymb.targets.keylist:
+                index_sources.extend(source_id[source] for source in opsymb.targets.mystruct[target].keylist)
+                index_offsets.append(len(index_sources))
+            index = {'index_targets': np.array([target_id[t] for t in opsymb.targets.keylist], dtype=np.int64),
+                     'index_offsets': np.frombuffer(index_offsets, dtype=np.int64),
+                     'index_sources': np.array(index_sources, dtype=np.int64)}
+
+        countdict = getattr(opsymb, 'countdict', None) or {}
+        meta = {'format_version': format_version, 'type': type(opsymb).__name__,
+                'n_sources': len(sources), 'n_targets': len(targets), 'n_edges': len(edge_target),
+                'n_argrefs': len(raw_arg_id), 'has_index': bool(index),
+                'templates': templates, 'template_offsets': template_offsets,
+                'countdict': {k: int(v) for k, v in countdict.items()}, 'extra': extra or {}}
+
+        tmp = path + '.tmp'
+        if os.path.exists(tmp): shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        columns = {'sources': _strings(sources), 'targets': _strings(targets),
+                   'edge_offsets': np.frombuffer(edge_offsets, dtype=np.int64),
+                   'edge_target': np.frombuffer(edge_target, dtype=np.int64) if len(edge_target) else
+                   np.zeros(0, np.int64),
+                   'arg_offsets': np.frombuffer(arg_offsets, dtype=np.int64), 'arg_id': arg_id, **index}
+        for j, template in enumerate(templates):
+            rows = [vocab_vals[i] for i in order[template_offsets[j]:template_offsets[j + 1]].tolist()]
+            columns[f'args_{j}'] = np.array(rows, dtype=np.int64).reshape(len(rows), -1)
+        for name, col in columns.items():
+            np.save(os.path.join(tmp, name + '.npy'), col)
+        # the metadata goes last: a directory without it is an incomplete write
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if os.path.exists(path): shutil.rmtree(path)
+        os.replace(tmp, path)
+        count("checkpoint.sources_saved", len(sources))
+    return path
+
+########################################################################################################################
+# load
+########################################################################################################################
+
+def is_complete(path):
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+def load_opsymb(path, mmap=True):
+    # open a checkpoint; the columns are memory-mapped (or read, if mmap=False)
+    if not is_complete(path):
+        print(f"{path} is not a complete opsymb checkpoint!")
+        raise ValueError
+    return OpSymbCheckpoint(path, mmap)
+
+class OpSymbCheckpoint(object):
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['format_version'] != format_version:
+            print(f"unknown checkpoint format {self.meta['format_version']}!")
+            raise ValueError
+        mode = 'r' if mmap else None
+        for name in _columns + (_index_columns if self.meta['has_index'] else ()):
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mode))
+        self.arg_tables = [np.load(os.path.join(path, f'args_{j}.npy'), mmap_mode=mode)
+                           for j in range(len(self.meta['templates']))]
+        self._args = None
+
+    def __len__(self):
+        return self.meta['n_sources']
+
+    def __repr__(self):
+        return (f"OpSymbCheckpoint({self.path}, {self.meta['n_sources']} sources, {self.meta['n_targets']} targets, "
+                f"{self.meta['n_edges']} edges)")
+
+    def arg_vocab(self):
+        # every distinct argtup, by id (small: at most the size of op_args)
+        if self._args is None:
+            self._args = [_build_arg(template, iter(row)) for template, table in
+                          zip(self.meta['templates'], self.arg_tables) for row in table.tolist()]
+        return self._args
+
+    def source(self, i):
+        return self.sources[i].decode()
+
+    def entry(self, i):
+        # {target: [argtups]} of the i-th source, reading only its rows
+        args = self.arg_vocab()
+        e0, e1 = int(self.edge_offsets[i]), int(self.edge_offsets[i + 1])
+        a = self.arg_offsets[e0:e1 + 1].tolist()
+        ids = self.arg_id[a[0]:a[-1]].tolist()
+        return {self.targets[t].decode(): [args[k] for k in ids[a[j] - a[0]:a[j + 1] - a[0]]]
+                for j, t in enumerate(self.edge_target[e0:e1].tolist())}
+
+    def to_opsymb(self, start=0, stop=None):
+        '''
+        Rebuild the sampler structure, in the saved sampling state.
+        ---------
+        INPUTS:
+        start, stop: int; range of sources to rebuild (default: all), e.g. to split a restore across workers.
+
+        OUTPUTS:
+        opsymb: OpSymb (or fastRandomSampler, as saved).
+        '''
+        stop = len(self) if stop is None else min(stop, len(self))
+        args = self.arg_vocab()
+        targets = [t.decode() for t in self.targets.tolist()]
+        e_off = self.edge_offsets[start:stop + 1].tolist()
+        a_off = self.arg_offsets[e_off[0]:e_off[-1] + 1].tolist()
+        edge_target = self.edge_target[e_off[0]:e_off[-1]].tolist()
+        arg_id = self.arg_id[a_off[0]:a_off[-1]].tolist()
+        sources = [s.decode() for s in self.sources[start:stop].tolist()]
+        outdict = {}
+        for i, source in enumerate(sources):
+            tgts = [targets[t] for t in edge_target[e_off[i] - e_off[0]:e_off[i + 1] - e_off[0]]]
+            leaves = []
+            for e in range(e_off[i] - e_off[0], e_off[i + 1] - e_off[0]):
+                argtups = [args[k] for k in arg_id[a_off[e] - a_off[0]:a_off[e + 1] - a_off[0]]]
+                leaves.append(_sampler(set(argtups), argtups))
+            outdict[source] = _sampler(dict(zip(tgts, leaves)), tgts)
+
+        if self.meta['type'] != 'OpSymb':
+            opsymb = _sampler(outdict, sources)
+        elif not self.meta['has_index'] or start > 0 or stop < len(self):
+            opsymb = OpSymb(outdict, inplace=True)
+        else:
+            # the saved index, in its saved order, instead of rebuilding it
+            opsymb = _sampler(outdict, sources, OpSymb)
+            opsymb.n_edges = self.meta['n_edges']
+            i_off = self.index_offsets.tolist()
+            index_sources = self.index_sources.tolist()
+            index_targets = [targets[t] for t in self.index_targets.tolist()]
+            srcs = [sources[k] for k in index_sources]
+            opsymb.targets = _sampler({t: _sampler(set(srcs[i_off[j]:i_off[j + 1]]), srcs[i_off[j]:i_off[j + 1]])
+                                       for j, t in enumerate(index_targets)}, index_targets)
+        if self.meta['countdict']:
+            opsymb.countdict = {k: v for k, v in self.meta['countdict'].items() if k in outdict}
+        return opsymb
+
+def _sampler(struct, keys, cls=fastRandomSampler):
+    # a sampler over struct whose keylist is keys, in that order (the constructor would take the iteration order)
+    sampler = cls.__new__(cls)
+    sampler.is_dict = isinstance(struct, dict)
+    sampler.mystruct, sampler.countdict = struct, {}
+    sampler.keylist = keys
+    sampler.key_to_int = dict(zip(keys, range(len(keys))))
+    return sampler
+
+########################################################################################################################
+# restart-safe generation
+########################################################################################################################
+
+def _digest(items):
+    # stable hash of a sequence of reprs (str hashes change with PYTHONHASHSEED, so no hash())
+    h = hashlib.blake2b(digest_size=16)
+    for item in items: h.update(repr(item).encode() + b'\n')
+    return h.hexdigest()
+
+def _keys_digest(x):
+    # digest of the sorted keys of a symbol or set; a PackedSet / BloomFilter by its stored array
+    if x is None: return None
+    if hasattr(x, 'contains_codes'):
+        h = hashlib.blake2b(x.kind.encode() + json.dumps(x.meta, sort_keys=True).encode(), digest_size=16)
+        h.update(np.ascontiguousarray(x.data).tobytes())
+        return h.hexdigest()
+    return _digest(sorted(_keyorder(x)))
+
+def _op_name(operator):
+    # a WordOp's name, else the function's module and qualified name
+    if hasattr(operator, 'name'): return operator.name
+    return f"{getattr(operator, '__module__', '')}.{getattr(operator, '__qualname__', type(operator).__name__)}"
+
+def resumable_opsymb_generator(path, sourcesymb, targetsymbs, target_badsymb, operator, op_args,
+                               opt='drop_bad_targets', no_zero_targets=False, chunksize=10000):
+    '''
+    opsymb_generator, checkpointed every chunksize sources, so that a preempted job restarts where it stopped.
+    ---------
+    INPUTS:
+    path: str; directory for the parts (part_00000, ...), created if needed.
+    sourcesymb, targetsymbs, target_badsymb, operator, op_args, opt, no_zero_targets: as opsymb_generator.
+    chunksize: int; sources per part.
+
+    OUTPUTS:
+    opsymb: OpSymb; the union of all the parts.
+    '''
+    from AIAmplitudes_common_public.preprocessing import get_mapdict
+    keys = list(sourcesymb)
+    os.makedirs(path, exist_ok=True)
+    # everything that decides the content of the parts, so that a changed run cannot reuse stale parts
+    # (op_args are hashed as a set: their order does not change the maps; targets by their sorted keys per loop)
+    loops = sorted(targetsymbs.items()) if hasattr(targetsymbs, 'items') else enumerate(targetsymbs)
+    plan = {'n_sources': len(keys), 'chunksize': chunksize, 'operator': _op_name(operator),
+            'op_args': _digest(sorted(repr(a) for a in op_args)), 'opt': opt, 'no_zero_targets': no_zero_targets,
+            'source_order': _digest(keys), 'targets': _digest((loop, _keys_digest(symb)) for loop, symb in loops),
+            'bad_targets': _keys_digest(target_badsymb)}
+    plan_file = os.path.join(path, 'plan.json')
+    if os.path.exists(plan_file):
+        with open(plan_file) as f:
+            old = json.load(f)
+        if old != plan:
+            changed = sorted(k for k in set(old) | set(plan) if old.get(k) != plan.get(k))
+            print(f"{path} holds parts of a different run (changed: {', '.join(changed)})!")
+            raise ValueError
+    else:
+        with open(plan_file, 'w') as f: json.dump(plan, f)
+
+    parts = [os.path.join(path, f'part_{c:05d}') for c in range(-(-len(keys) // chunksize))]
+    done = sum(is_complete(p) for p in parts)
+    if done: event("resuming opsymb generation", path=path, parts_done=done, parts=len(parts))
+    with span("resumable_opsymb_generator", n_args=len(op_args)):
+        for c, part in enumerate(parts):
+            if is_complete(part): continue
+            outdict = {key: get_mapdict(key, op_args, operator, targetsymbs, target_badsymb,
+                                        no_zero_targets=no_zero_targets, opt=opt)
+                       for key in keys[c * chunksize:(c + 1) * chunksize]}
+            save_opsymb(fastRandomSampler(outdict, inplace=True), part, extra={'part': c})
+            count("checkpoint.parts_written")
+        outdict = {}
+        for part in parts:
+            outdict.update(load_opsymb(part).to_opsymb().mystruct)
+        opsymb = OpSymb(outdict, inplace=True)
+        count("opsymb.source_keys", len(opsymb))
+        count("opsymb.unique_targets", opsymb.n_targets())
+    return opsymb
@@ -1,10 +1,17 @@
 import itertools
-import datetime
+import numpy as np
 
 from scipy.special import binom
-import random
 from AIAmplitudes_common_public.rels_utils import get_coeff_from_word,check_slot,find_all,alphabet,count_appearances
-from AIAmplitudes_common_public.commonclasses import fastRandomSampler
+from AIAmplitudes_common_public.commonclasses import fastRandomSampler, OpSymb
+from AIAmplitudes_common_public.instrumentation import span, count, event
+from AIAmplitudes_common_public.random_streams import resolve_rng
+from AIAmplitudes_common_public.compact_symb import CompactSymb
+from AIAmplitudes_common_public.symb_index import SymbIndex
+from AIAmplitudes_common_public.membership import PackedSet, BloomFilter
+from AIAmplitudes_common_public.word_ops import WordOp, member_id
+from AIAmplitudes_common_public.word_utils import encode_words, decode_words
+from AIAmplitudes_common_public.rel_registry import compiled
 
 ##########################
 # generators for op_args
@@ -110,7 +117,7 @@ def gen_op_args(op_argdict):
         op_args.append(this_argset)
 
     if len(op_args) > 1:
-        print("Getting combined args!")
+        event("combining op args", n_argtypes=len(op_args))
         op_args = set(itertools.product(*op_args))
     else:
         op_args= set((elem,) for elem in op_args[0])
@@ -132,57 +139,68 @@ def gen_argset_size(op_argdict):
     return argsize
 ########################
 # get random op_arg value
+# rng: a random.Random (see random_streams), an int seed, or None for the global random module
 ########################
-def gen_random_slotcombo(keylen, k, nslots, exact=False):
+def gen_random_slotcombo(keylen, k, nslots, exact=False, rng=None):
     # k=1 is adjacent. if exact, max - min <= k. else, max-min == k
     if k < 1 or nslots > k: raise ValueError
+    rng = resolve_rng(rng)
     def random_slotcombo_gen():
         # generate one slot at a time
         if exact:
-            this_slot = random.randrange(0, keylen - max(nslots, k))
+            this_slot = rng.randrange(0, keylen - max(nslots, k))
             kbound = this_slot + k
         else:
-            this_slot = random.randrange(0, keylen - nslots)
+            this_slot = rng.randrange(0, keylen - nslots)
             kbound = min(this_slot + k, keylen)
         i = 1;yield this_slot
         while i < nslots - 1:
             # get the next slot.
             lastslot = this_slot
             thisbound = kbound - nslots + i + 1
-            this_slot = random.randrange(lastslot + 1, thisbound + 1)
+            this_slot = rng.randrange(lastslot + 1, thisbound + 1)
             i += 1;yield this_slot
         if exact or (this_slot + 1 == kbound):
             yield kbound
         else:
-            yield random.randrange(this_slot + 1, kbound)
+            yield rng.randrange(this_slot + 1, kbound)
     return tuple(slot for slot in random_slotcombo_gen())
 
-def gen_random_letterset(nletts):
-    return tuple(alphabet[int(len(alphabet) * random.random())] for _ in range(nletts))
+def gen_random_letterset(nletts, rng=None):
+    rng = resolve_rng(rng)
+    return tuple(alphabet[int(len(alphabet) * rng.random())] for _ in range(nletts))
 
-def gen_random_sumtuple(n_elems, target_sum):
+def gen_random_sumtuple(n_elems, target_sum, rng=None):
     if n_elems > target_sum:
         print(f"cannot generate {n_elems} that sum to {target_sum}!")
+    rng = resolve_rng(rng)
     def gen_next(elems,target):
         if elems == 0: return
-        elem=1+random.randrange(0,target-elems+1)
+        elem=1+rng.randrange(0,target-elems+1)
         yield elem
         yield from gen_next(elems-1,target-elem)
     return tuple(elem for elem in gen_next(n_elems, target_sum))
 
-def get_random_argset(op_argdict):
+def get_random_argset(op_argdict, rng=None):
+    rng = resolve_rng(rng)
     op_args=[]
     if "slots" in op_argdict:
         op_args.append(gen_random_slotcombo(2 * op_argdict["slots"]["loop"],
-                                    op_argdict["slots"]["k"], op_argdict["slots"]["numslots"]))
+                                    op_argdict["slots"]["k"], op_argdict["slots"]["numslots"], rng=rng))
     if "letters" in op_argdict:
-        op_args.append(gen_random_letterset(op_argdict["letters"]["numslots"]))
+        op_args.append(gen_random_letterset(op_argdict["letters"]["numslots"], rng=rng))
     if "sumtups" in op_argdict:
-        op_args.append(gen_random_sumtuple(op_argdict["sumtups"]["numslots"],op_argdict["sumtups"]["totalmult"]))
+        op_args.append(gen_random_sumtuple(op_argdict["sumtups"]["numslots"],op_argdict["sumtups"]["totalmult"],
+                                           rng=rng))
     if "rot_ind" in op_argdict:
-        op_args.append(int(6*random.random()))
+        op_args.append(int(6*rng.random()))
     return tuple(op_args)
 
+def get_random_argsets(op_argdict, n, rng=None):
+    # n random argsets from one stream
+    rng = resolve_rng(rng)
+    return [get_random_argset(op_argdict, rng) for _ in range(n)]
+
 ################################
 def get_mapdict(key,op_args,operation,targetsymbs={},bad_targets=None,opt='drop_bad_targets',
                 argsfirst=False,no_zero_targets=False, valset=None):
@@ -200,21 +218,23 @@ def get_mapdict(key,op_args,operation,targetsymbs={},bad_targets=None,opt='drop_
                                                                                targetsymbs[int(len(target)/2)]) == 0)}
 
         if (opt == 'drop_source_if_bad_targets'):
-            if len(set(fulldict.values()) & set(bad_targets)) != 0: return {}
+            if bad_targets and any(target in bad_targets for target in fulldict.values()): return {}
         if valset is not None:
             valset.add(target for target in fulldict.values())
     else:
         #takes form: {src: {tgt: [slot0,slot1,...slotN] etc.}
         fulldict= {}
+        n_dropped = 0
         for argtup in op_args:
             target = operation(key, *argtup)
             if no_zero_targets:
-                if (len(target) % 2 != 0): continue
-                if get_coeff_from_word(target,targetsymbs[int(len(target)/2)]) == 0: continue
+                if (len(target) % 2 != 0): n_dropped += 1; continue
+                if get_coeff_from_word(target,targetsymbs[int(len(target)/2)]) == 0: n_dropped += 1; continue
             if (opt == 'drop_bad_targets') and (bad_targets):
-                if target in bad_targets: continue
+                if target in bad_targets: n_dropped += 1; continue
             if (opt == 'drop_source_if_bad_targets') and (bad_targets):
                 if target in bad_targets:
+                    count("opsymb.sources_dropped")
                     return {}
 
             if target in fulldict:
@@ -224,33 +244,122 @@ def get_mapdict(key,op_args,operation,targetsymbs={},bad_targets=None,opt='drop_
 
             if valset is not None:
                 valset.add(target)
+        if n_dropped: count("opsymb.targets_dropped", n_dropped)
     return fastRandomSampler(fulldict,inplace=True)
 
 def opsymb_generator(sourcesymb, targetsymbs, target_badsymb, operator, op_args, opt='drop_bad_targets', no_zero_targets=False):
     #assume we've already pruned the source symb
-    valset=set()
-    outdict={key:get_mapdict(key,op_args,operator,targetsymbs,target_badsymb,no_zero_targets=no_zero_targets, opt=opt, valset=valset) for key in sourcesymb}
-    #print(outdict)
-    print(f"Preprocessed {len(outdict)} keys in input symbol. Got {len(set(valset))} unique target keys")
-    return fastRandomSampler(outdict)
+    #the OpSymb keeps the target -> sources index, for sampling by target and incremental pruning
+    #a word_ops.WordOp operator (strike, substitute, insert_runs, rotate, swap) is applied to the whole
+    #symbol x op_args grid at once, with the same result as get_mapdict
+    with span("opsymb_generator", n_args=len(op_args)):
+        if isinstance(operator, WordOp):
+            outdict = word_op_mapdicts(sourcesymb, targetsymbs, target_badsymb, operator, op_args, opt, no_zero_targets)
+        else:
+            outdict={key:get_mapdict(key,op_args,operator,targetsymbs,target_badsymb,no_zero_targets=no_zero_targets, opt=opt) for key in sourcesymb}
+        opsymb = OpSymb(outdict, inplace=True)
+        count("opsymb.source_keys", len(opsymb))
+        count("opsymb.unique_targets", opsymb.n_targets())
+    return opsymb
+
+def _code_lookup(symb, cache):
+    # int64 word codes -> coeffs (0 if absent), for a full-format dict, CompactSymb or SymbIndex
+    if isinstance(symb, SymbIndex): return lambda codes: symb.lookup_keys(codes)[0]
+    if not isinstance(symb, CompactSymb):
+        if id(symb) not in cache: cache[id(symb)] = CompactSymb.from_dict(symb, "full")
+        symb = cache[id(symb)]
+    def lookup(codes):
+        pos = symb.find(np.zeros(len(codes), dtype=np.int64), codes)
+        return np.where(pos >= 0, symb.coeffs[pos], 0)
+    return lookup
+
+def word_op_mapdicts(sourcesymb, targetsymbs, bad_targets, operator, op_args, opt='drop_bad_targets',
+                     no_zero_targets=False, chunk_pairs=2**22):
+    '''
+    get_mapdict for every key of a full-format symbol, with a word_ops.WordOp operator.
+    ---------
+    INPUTS:
+    sourcesymb: iterable of str; the source words (e.g. a symbol).
+    targetsymbs: dict; {loop: symbol} (dict, CompactSymb or SymbIndex), for no_zero_targets.
+    bad_targets: container or None; a membership.PackedSet / BloomFilter is used as is, anything else is packed
+                 once into a PackedSet.
+    operator: WordOp.
+    op_args: iterable of argument tuples; the order of iteration is kept, as in get_mapdict.
+    opt, no_zero_targets: as get_mapdict.
+    chunk_pairs: int; (source, argtup) pairs computed at once, which bounds the memory use.
+
+    OUTPUTS:
+    outdict: dict; {key: get_mapdict(key, ...)}, in the order of sourcesymb.
+    '''
+    argtups = list(op_args)
+    keys = list(sourcesymb)
+    outdict = {key: None for key in keys}
+    if bad_targets and not isinstance(bad_targets, (PackedSet, BloomFilter)):
+        bad_targets = PackedSet.from_keys(bad_targets)
+    cache, by_length = {}, {}
+    for key in keys: by_length.setdefault(len(key), []).append(key)
+    n_dropped = 0
+    for length, words in by_length.items():
+        tables = operator.compile(argtups, length)
+        out_len = tables[2]
+        chunk = max(1, chunk_pairs // max(len(argtups), 1))
+        for start in range(0, len(words), chunk):
+            src = words[start:start + chunk]
+            targets, _ = operator.apply(encode_words(src, length), length, compiled=tables)
+            keep = np.ones(targets.shape, dtype=bool)
+            if no_zero_targets:
+                if out_len % 2: keep[:] = False
+                else: keep &= _code_lookup(targetsymbs[out_len // 2], cache)(targets.ravel()).reshape(targets.shape) != 0
+            bad = np.zeros(targets.shape, dtype=bool)
+            if bad_targets and opt in {'drop_bad_targets', 'drop_source_if_bad_targets'}:
+                bad = bad_targets.contains_codes(member_id(targets.ravel(), out_len)).reshape(targets.shape) & keep
+            dropped_source = bad.any(axis=1) if opt == 'drop_source_if_bad_targets' else np.zeros(len(src), dtype=bool)
+            n_dropped += int((~keep).sum() + (bad.sum() if opt == 'drop_bad_targets' else 0))
+            keep &= ~bad
+            names = decode_words(targets[keep], out_len)
+            rows, cols = np.nonzero(keep)
+            bounds = np.searchsorted(rows, np.arange(len(src) + 1))
+            for i, key in enumerate(src):
+                if dropped_source[i]:
+                    count("opsymb.sources_dropped")
+                    outdict[key] = {}
+                    continue
+                fulldict = {}
+                for j in range(bounds[i], bounds[i + 1]):
+                    target, argtup = names[j], argtups[cols[j]]
+                    if target in fulldict: fulldict[target].add(argtup)
+                    else: fulldict[target] = fastRandomSampler({argtup}, inplace=True)
+                outdict[key] = fastRandomSampler(fulldict, inplace=True)
+    if n_dropped: count("opsymb.targets_dropped", n_dropped)
+    return outdict
 
 def prune_opsymb(opsymb, bad_source_symb, bad_tgt_symb, drop_source_if_bad_targets=False):
-    print(f"pruning: starting with {len(opsymb.keys())} source keys and {len(opsymb.values())} target keys")
-    for k,v in list(opsymb.items()):
-        if k in bad_source_symb: opsymb.popitem(k)
-        else:
-            for tgt in (v.keys() & bad_tgt_symb.keys()):
-                #if tgt in opsymb[k]:
-                if drop_source_if_bad_targets: opsymb.popitem(k)
-                else:
-                    opsymb[k].popitem(tgt)
-                    if len(opsymb[k]) == 0: opsymb.popitem(k)
-
-    print(f"After pruning, there are {len(opsymb.keys())} source keys and {len(set(opsymb.values()))} target keys")
+    with span("prune_opsymb"):
+        if isinstance(opsymb, OpSymb):
+            #incremental: only the bad entries present in the target -> sources index are touched
+            n_sources, n_targets = len(opsymb), opsymb.n_edges
+            opsymb.prune(bad_source_symb, bad_tgt_symb, drop_source_if_bad_targets)
+            count("prune.sources_dropped", n_sources - len(opsymb))
+            count("prune.targets_dropped", n_targets - opsymb.n_edges)
+            return opsymb
+        n_sources, n_targets = len(opsymb), sum(len(v) for v in opsymb.values())
+        for k,v in list(opsymb.items()):
+            if k in bad_source_symb: opsymb.popitem(k)
+            else:
+                # only `in` on bad_tgt_symb, so it can be a dict, a set or a membership.PackedSet / BloomFilter
+                for tgt in [t for t in v.keys() if t in bad_tgt_symb]:
+                    #if tgt in opsymb[k]:
+                    if drop_source_if_bad_targets: opsymb.popitem(k); break
+                    else:
+                        opsymb[k].popitem(tgt)
+                        if len(opsymb[k]) == 0: opsymb.popitem(k)
+        count("prune.sources_dropped", n_sources - len(opsymb))
+        count("prune.targets_dropped", n_targets - sum(len(v) for v in opsymb.values()))
     return opsymb
 
 def check_key_and_get_slots(symb, loop, rel, rel_slot, format):
     #for all keys in the symb, check whether they contain the desired substring in a valid slot. If so, store the slot.
+    terms = compiled(rel).termset
     nletter=len(list(rel.keys())[0])
     my_slot= None
     if format == "full":
@@ -269,7 +378,7 @@ def check_key_and_get_slots(symb, loop, rel, rel_slot, format):
     for symbkey in symb:
         slots = None
         if (rel_slot is not None):
-            if any(check_slot(symbkey, substr, my_slot) for substr in rel):
+            if symbkey[my_slot:my_slot + nletter] in terms:
                 slots = {my_slot}
         elif format == "full":
             slots = {slot for key in rel for slot in find_all(symbkey,key)}
@@ -282,20 +391,21 @@ def check_key_and_get_slots(symb, loop, rel, rel_slot, format):
 
 def relsymb_generator(relnames, rels, overlaps, rel_slots, trimsymb, loop, format):
     for name, rel, rel_slot, overlap in zip(relnames, rels, rel_slots, overlaps):
-        print(f'generating relsymb {name}:{datetime.datetime.now()}')
-        if overlap == 0:
-            yield {}
-        else:
-            if rel is None:
-                yield trimsymb
+        with span("relsymb", rel=name):
+            if overlap == 0:
+                relsymb = {}
+            elif rel is None:
+                relsymb = trimsymb
             else:
-                yield {symbkey: slots for symbkey, slots in
-                       check_key_and_get_slots(trimsymb, loop, rel, rel_slot, format)}
+                relsymb = {symbkey: slots for symbkey, slots in
+                           check_key_and_get_slots(trimsymb, loop, rel, rel_slot, format)}
+            count("relsymb.keys", len(relsymb))
+        yield relsymb
 
 def prune_relsymbs(relsymbs, badsymb=None):
     if badsymb is None:
         badsymb = {}
-    newsymbs = [{k: relsymb[k] for k in {*relsymb} - {*badsymb}} for relsymb in relsymbs]
+    newsymbs = [{k: v for k, v in relsymb.items() if k not in badsymb} for relsymb in relsymbs]
     return newsymbs
 
 
@@ -336,12 +446,12 @@ def tag_opinstance(instance, op_meta_args, op_tags, argslist, tagmode, is_pseudo
             if tagmode == 'letter_appearances_left':
                 # i.e. STRIKE_a APP_1 means strike the first 'a' from the left
                 my_tags= op_tags + [f for slot in slotslist for f in (
-                                    f'LETTER_{my_key[slot]}', f'APP_{count_appearances(my_key[slot], slot)}')]
+                                    f'LETTER_{my_key[slot]}', f'APP_{count_appearances(my_key, slot)}')]
             elif tagmode == 'letter_appearances_right':
-                # i.e. STRIKE_a APP_1 means strike the first 'a' from the left
+                # i.e. STRIKE_a RAPP_1 means strike the first 'a' from the right
                 my_tags= op_tags + [f for slot in slotslist
-                                                        for f in (f'LETTER_{my_key[slot]}',
-                                                                  f'RAPP_{count_appearances(my_key[::-1][slot], slot)}')]
+                                                        for f in (f'LETTER_{my_key[slot]}', 'RAPP_'
+                                                                  f'{count_appearances(my_key[::-1], len(my_key) - 1 - slot)}')]
             elif tagmode == 'letters_and_slots_left':
                 my_tags= op_tags + [f for slot in slotslist
                                                         for f in (f'LETTER_{my_key[slot]}', f'SLOT_{slot}')]
@@ -368,6 +478,7 @@ def tag_opinstance(instance, op_meta_args, op_tags, argslist, tagmode, is_pseudo
     else:
         rel_instance = {'instance': instance,
                     'tags': {'operator': my_tags}}
+    count("instances.tagged")
     return rel_instance
 
 def tag_rel_instance(instance,rel_tags,my_slot, is_pseudodata):
@@ -376,5 +487,6 @@ def tag_rel_instance(instance,rel_tags,my_slot, is_pseudodata):
     if is_pseudodata: mytags += ['PSEUDO']
     rel_instance = {'instance':{'source':instance},
                             'tags':{'label':mytags}}
+    count("instances.tagged")
 
     return rel_instance
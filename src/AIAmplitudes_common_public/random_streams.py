@@ -0,0 +1,57 @@
+import random
+import zlib
+import numpy as np
+
+# Independent, reproducible random streams for parallel generation.
+# Every sampling function (fastRandomSampler.random_key / pop_random, gen_random_*, get_random_argset,
+# get_dihedral_pair, gen_let, gen_valid_substr, generate_random_word, get_rel_terms_in_symb) takes an optional rng:
+# None keeps the old behaviour (the global random module), otherwise draws come from the given random.Random.
+# Streams are derived from one root seed and a path of names / ints with numpy's SeedSequence, so
+# stream(seed, 'worker', 3, 'rel', 'triple0') is the same in every process and independent of every other path:
+# results depend only on the seed and on how the work is split, never on scheduling or on other workers.
+# (A fastRandomSampler built from a set of strings takes the set's iteration order, which depends on
+# PYTHONHASHSEED: fix it too, or restore samplers from an opsymb_checkpoint, for bit-for-bit reruns.)
+#
+#   rng = stream(1234, 'shard', shard_id)                     # random.Random
+#   rngs = spawn_streams(1234, n_workers)                     # one per worker
+#   np_rng = stream(1234, 'shard', shard_id, kind='numpy')    # np.random.Generator, for WordSampler / ValidWords
+#   opsymb.random_keys(10**5, rng=np_rng)                     # batched draws
+
+def _path_key(part):
+    # path element -> non-negative int, stable across processes (str hashes are salted, crc32 is not)
+    if isinstance(part, (int, np.integer)) and part >= 0: return int(part)
+    return zlib.crc32(str(part).encode()) | (1 << 32)
+
+def seed_sequence(seed, *path):
+    # the SeedSequence of a path under a root seed
+    return np.random.SeedSequence(seed, spawn_key=tuple(_path_key(p) for p in path))
+
+def _from_sequence(ss, kind):
+    if kind == 'python': return random.Random(int.from_bytes(ss.generate_state(4, np.uint64).tobytes(), 'little'))
+    if kind == 'numpy': return np.random.Generator(np.random.PCG64(ss))
+    print(f"unknown rng kind {kind}!")
+    raise ValueError
+
+def stream(seed, *path, kind='python'):
+    '''
+    One independent random stream.
+    ---------
+    INPUTS:
+    seed: int; root seed of the whole run.
+    path: str or int; names of the stream, e.g. 'worker', 3, 'rel', 'triple0'.
+    kind: str; "python" for a random.Random, "numpy" for an np.random.Generator.
+
+    OUTPUTS:
+    rng: random.Random or np.random.Generator.
+    '''
+    return _from_sequence(seed_sequence(seed, *path), kind)
+
+def spawn_streams(seed, n, *path, kind='python'):
+    # n independent streams, e.g. one per worker: the same as stream(seed, *path, i) for i < n
+    return [stream(seed, *path, i, kind=kind) for i in range(n)]
+
+def resolve_rng(rng):
+    # None -> the global random module (old behaviour), int -> a random.Random seeded with it, else rng itself
+    if rng is None: return random
+    if isinstance(rng, (int, np.integer)) and not isinstance(rng, bool): return random.Random(int(rng))
+    return rng
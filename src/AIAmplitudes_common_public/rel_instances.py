@@ -0,0 +1,202 @@
+import math
+import numpy as np
+from fractions import Fraction
+from AIAmplitudes_common_public.rels_utils import is_trivial0
+
+# Relation instances compiled once, scored against any number of symbols.
+# A list of instances [{word: [symb_coeff, rel_coeff]}, ...] (get_rel_terms_in_symb) becomes flat arrays:
+#   words: every distinct word once, term_word: word id of every term, term_coef: rel coeff of every term,
+#   offsets: instance i is terms offsets[i]:offsets[i+1],
+#   scale: per instance, the lcm of the denominators of its rel coeffs (the 1/2 of the fractional rels);
+#          term_coef holds the coeffs times the scale of their instance, so relsums stay exact integers.
+# Scoring a symbol is then one dict lookup per distinct word, a gather over the terms and a segmented sum
+# (np.add.reduceat) per instance. After evaluate(), update() applies changed coefficients as deltas,
+# touching only the instances that contain the changed words.
+#
+#   inst = CompiledRelInstances(rel_instance_list)
+#   inst.evaluate(predicted_symb).percent()        # as check_rel(update_rel_instances_in_symb(...))
+#   inst.update({'aabbee': 12}).percent()
+
+int64_max = np.iinfo(np.int64).max
+
+class RelScores(object):
+    # rel sums per instance, and whether any of its words had an invalid (None) coeff
+    def __init__(self, compiled, relsums, n_invalid):
+        self.compiled = compiled
+        self.relsums = relsums
+        self.n_invalid = n_invalid
+
+    @property
+    def invalid(self):
+        return self.n_invalid > 0
+
+    def __len__(self):
+        return len(self.relsums)
+
+    def satisfied(self):
+        return (self.relsums == 0) & ~self.invalid
+
+    def percent(self, p_norm=None):
+        # fraction of satisfied instances, as check_rel (optionally normalized by p_norm ** nterm)
+        if len(self) == 0: return None
+        percent = int(self.satisfied().sum()) / len(self)
+        if p_norm: percent /= p_norm ** self.compiled.nterms[0]
+        return percent
+
+    def relsum_list(self):
+        # as check_rel's relsum_list: -1 for instances with an invalid coeff, sums of fractional rels unscaled
+        return [-1 if bad else (s if sc == 1 else s / sc)
+                for s, bad, sc in zip(self.relsums.tolist(), self.invalid.tolist(), self.compiled.scale.tolist())]
+
+class CompiledRelInstances(object):
+    def __init__(self, rel_instance_list):
+        # instances are {word: rel_coeff}, or {word: [symb_coeff, rel_coeff]} as from get_rel_instances_in_symb
+        word_index, term_word, term_coef, offsets, scale = {}, [], [], [0], []
+        for rel_instance in rel_instance_list:
+            coefs = []
+            for word, coef in rel_instance.items():
+                if isinstance(coef, (list, tuple)): coef = coef[1]
+                term_word.append(word_index.setdefault(word, len(word_index)))
+                coefs.append(Fraction(coef))
+            scale.append(math.lcm(1, *(c.denominator for c in coefs)))
+            term_coef += [int(c * scale[-1]) for c in coefs]
+            offsets.append(len(term_word))
+        self.words = list(word_index.keys())
+        self.word_index = word_index
+        self.term_word = np.array(term_word, dtype=np.int64)
+        self.term_coef = np.array(term_coef, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.scale = np.array(scale, dtype=np.int64)
+        self.nterms = np.diff(self.offsets)
+        self.term_instance = np.repeat(np.arange(len(self.nterms)), self.nterms)
+        # word -> terms, for delta updates
+        self.word_terms = np.argsort(self.term_word, kind='stable')
+        self.word_offsets = np.searchsorted(self.term_word[self.word_terms], np.arange(len(self.words) + 1))
+        self.max_abs_rowsum = int(np.add.reduceat(np.abs(self.term_coef), self.offsets[:-1]).max()) \
+            if len(self.term_coef) else 0
+        self.vals, self.valid, self.scores, self.maxval = None, None, None, 0
+        self._nontrivial0 = None
+
+    def __len__(self):
+        return len(self.nterms)
+
+    def __repr__(self):
+        return f'CompiledRelInstances({len(self)} instances, {len(self.term_word)} terms, {len(self.words)} words)'
+
+    def nontrivial0_counts(self):
+        # number of non-trivial-zero words per instance, as check_rel's relnontrivial0_list
+        if self._nontrivial0 is None:
+            nontriv = np.array([not is_trivial0(w) for w in self.words], dtype=np.int64)
+            self._nontrivial0 = self.segment_sum(nontriv[self.term_word])
+        return self._nontrivial0
+
+    def segment_sum(self, per_term):
+        # sum of a per-term array over every instance; empty instances get 0
+        if len(per_term) == 0: return np.zeros(len(self), dtype=per_term.dtype)
+        out = np.add.reduceat(per_term, np.minimum(self.offsets[:-1], len(per_term) - 1))
+        out[self.nterms == 0] = 0
+        return out
+
+    def gather(self, symb):
+        # coeff of every distinct word in symb (0 if absent), and whether it is valid (not None)
+        values = [symb.get(w, 0) if hasattr(symb, 'get') else (symb[w] if w in symb else 0) for w in self.words]
+        valid = np.array([v is not None for v in values], dtype=bool)
+        vals = np.array([v if v is not None else 0 for v in values], dtype=object)
+        maxval = int(np.abs(vals).max()) if len(vals) else 0
+        if maxval * max(self.max_abs_rowsum, 1) <= int64_max: vals = vals.astype(np.int64)
+        return vals, valid, maxval
+
+    def score_values(self, vals, valid):
+        coef = self.term_coef if vals.dtype != object else self.term_coef.astype(object)
+        relsums = self.segment_sum(vals[self.term_word] * coef)
+        n_invalid = self.segment_sum((~valid[self.term_word]).astype(np.int64))
+        return RelScores(self, relsums, n_invalid)
+
+    def evaluate(self, symb):
+        '''
+        Score every instance against a symbol, and keep the state for later update() calls.
+        ---------
+        INPUTS:
+        symb: dict; {word: coeff}, coeffs may be None for invalid predictions.
+
+        OUTPUTS:
+        scores: RelScores.
+        '''
+        self.vals, self.valid, self.maxval = self.gather(symb)
+        self.scores = self.score_values(self.vals, self.valid)
+        return self.scores
+
+    def update(self, changes):
+        '''
+        Apply changed coefficients to the last evaluated symbol, touching only the affected instances.
+        ---------
+        INPUTS:
+        changes: dict; {word: new coeff}; words not in any instance are ignored.
+
+        OUTPUTS:
+        scores: RelScores; updated in place.
+        '''
+        if self.scores is None:
+            print("evaluate a symbol before updating it!")
+            raise ValueError
+        ids = [self.word_index[w] for w in changes if w in self.word_index]
+        if not ids: return self.scores
+        ids = np.array(ids, dtype=np.int64)
+        new = [changes[self.words[i]] for i in ids.tolist()]
+        new_valid = np.array([v is not None for v in new], dtype=bool)
+        new_vals = np.array([v if v is not None else 0 for v in new], dtype=object)
+        # maxval only ever grows, so it stays a valid bound for the int64 overflow check
+        self.maxval = max(self.maxval, int(np.abs(new_vals).max()))
+        if self.vals.dtype != object and self.maxval * max(self.max_abs_rowsum, 1) > int64_max:
+            self.vals, self.scores.relsums = self.vals.astype(object), self.scores.relsums.astype(object)
+        new_vals = new_vals.astype(self.vals.dtype)
+
+        # terms of the changed words
+        starts, ends = self.word_offsets[ids], self.word_offsets[ids + 1]
+        counts = ends - starts
+        terms = self.word_terms[np.repeat(starts, counts) + np.arange(counts.sum())
+                                - np.repeat(np.cumsum(counts) - counts, counts)]
+        delta_val = np.repeat(new_vals - self.vals[ids], counts)
+        delta_invalid = np.repeat((~new_valid).astype(np.int64) - (~self.valid[ids]).astype(np.int64), counts)
+        coef = self.term_coef[terms] if self.vals.dtype != object else self.term_coef[terms].astype(object)
+        np.add.at(self.scores.relsums, self.term_instance[terms], delta_val * coef)
+        np.add.at(self.scores.n_invalid, self.term_instance[terms], delta_invalid)
+        self.vals[ids], self.valid[ids] = new_vals, new_valid
+        return self.scores
+
+    def coeff_accuracy(self, truth, require_satisfied=True):
+        '''
+        Vectorized check_coeffs_in_rel: fraction of instances whose words all have the right coeff
+        (exactly, in magnitude, in sign) in the last evaluated symbol, compared with the truth.
+        ---------
+        INPUTS:
+        truth: dict; the true symbol.
+        require_satisfied: bool; also require the instance to be satisfied in the evaluated symbol.
+
+        OUTPUTS:
+        percent_allcorrect, percent_magcorrect, percent_signcorrect: floats (None if there are no instances).
+        counts: (n, 4) array; per instance [satisfied, n exact, n magnitude, n sign], as return_counts.
+        '''
+        if self.scores is None:
+            print("evaluate a symbol before comparing it!")
+            raise ValueError
+        if len(self) == 0: return None, None, None, np.zeros((0, 4), dtype=np.int64)
+        tvals, _, _ = self.gather(truth)
+        pred, ok = self.vals[self.term_word], self.valid[self.term_word]
+        tv = tvals[self.term_word]
+        n_exact = self.segment_sum((ok & (pred == tv)).astype(np.int64))
+        n_mag = self.segment_sum((ok & (np.abs(pred) == np.abs(tv))).astype(np.int64))
+        n_sign = self.segment_sum((ok & (np.sign(pred) == np.sign(tv))).astype(np.int64))
+        sat = self.scores.satisfied()
+        gate = sat if require_satisfied else np.ones(len(self), dtype=bool)
+        percents = [float((gate & (n == self.nterms)).mean()) for n in (n_exact, n_mag, n_sign)]
+        return (*percents, np.stack([sat.astype(np.int64), n_exact, n_mag, n_sign], axis=1))
+
+    def to_dicts(self):
+        # the {word: [symb_coeff, rel_coeff]} list of the last evaluated symbol, as get_rel_instances_in_symb
+        vals = self.vals.tolist() if self.vals is not None else [0] * len(self.words)
+        valid = self.valid.tolist() if self.valid is not None else [True] * len(self.words)
+        coefs, words, scale = self.term_coef.tolist(), self.term_word.tolist(), self.scale.tolist()
+        return [{self.words[words[t]]: [vals[words[t]] if valid[words[t]] else None,
+                                        coefs[t] if scale[i] == 1 else coefs[t] / scale[i]]
+                 for t in range(self.offsets[i], self.offsets[i + 1])} for i in range(len(self))]
@@ -0,0 +1,195 @@
+import math
+from fractions import Fraction
+import numpy as np
+from scipy import sparse
+from AIAmplitudes_common_public.file_readers import relpath, get_relpermdict
+from AIAmplitudes_common_public.fbspaces import get_brels, get_frels
+from AIAmplitudes_common_public.word_utils import symb_to_arrays, split_codes, encode_words, decode_word
+
+# Relation families compiled to exact integer sparse matrices.
+# The F/B space rels are read as nested dicts of Fractions, {dependent: {independent: coeff}},
+# and the permissive sewing rels as lists of {term: coeff} dicts.
+# Here every relation becomes one row of an int64 csr matrix over the terms (columns) of the family.
+# The whole family is multiplied by the LCM of its denominators, which is kept in RelMatrix.scale,
+# so every row still sums to zero exactly and checks can be done in integer arithmetic.
+
+int64_max = np.iinfo(np.int64).max
+
+class RelMatrix(object):
+    def __init__(self, mat, scale, rownames, colnames):
+        self.mat = mat
+        self.scale = scale
+        self.rownames = rownames
+        self.colnames = colnames
+        self.col_index = {name: i for i, name in enumerate(colnames)}
+
+    def __len__(self):
+        return self.mat.shape[0]
+
+    def __repr__(self):
+        return f'RelMatrix({self.mat.shape[0]} rels, {self.mat.shape[1]} terms, scale {self.scale})'
+
+    def row(self, i):
+        # relation i as a {term: Fraction} dict
+        start, end = self.mat.indptr[i], self.mat.indptr[i + 1]
+        return {self.colnames[j]: Fraction(int(v), self.scale)
+                for j, v in zip(self.mat.indices[start:end], self.mat.data[start:end])}
+
+    def to_dicts(self):
+        return [self.row(i) for i in range(len(self))]
+
+    def max_abs_rowsum(self):
+        # largest sum of |scaled coeffs| in a row, i.e. the largest factor a residual can grow by
+        if self.mat.nnz == 0: return 0
+        return int(abs(self.mat).sum(axis=1).max())
+
+def rel_as_terms(dep, rhs):
+    # {dep: {indep: c}} means E(dep) - sum(c*E(indep)) = 0. {dep: {None: 0}} means E(dep) = 0
+    terms = {dep: Fraction(1)}
+    for k, v in rhs.items():
+        if k is None: continue
+        terms[k] = terms.get(k, 0) - Fraction(v)
+    return terms
+
+def compile_rels(rels, rownames=None, colnames=None):
+    # rels: either a {dependent: {independent: coeff}} dict (get_brels/get_frels),
+    # or a list of {term: coeff} dicts (get_relpermdict).
+    if isinstance(rels, dict):
+        if rownames is None: rownames = list(rels.keys())
+        rows = [rel_as_terms(dep, rhs) for dep, rhs in rels.items()]
+    else:
+        if rownames is None: rownames = list(range(len(rels)))
+        rows = [{k: Fraction(v) for k, v in rel.items()} for rel in rels]
+
+    if colnames is None: colnames = sorted({term for row in rows for term in row})
+    col_index = {name: i for i, name in enumerate(colnames)}
+    scale = math.lcm(1, *(v.denominator for row in rows for v in row.values()))
+
+    indptr, indices, data = [0], [], []
+    for row in rows:
+        for term, v in row.items():
+            if v == 0: continue
+            indices.append(col_index[term])
+            data.append(int(v * scale))
+        indptr.append(len(indices))
+    if data and max(abs(v) for v in data) > int64_max:
+        raise OverflowError("scaled relation coefficients do not fit in int64!")
+    mat = sparse.csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64),
+                             np.array(indptr, dtype=np.int64)), shape=(len(rows), len(colnames)))
+    mat.sort_indices()
+    return RelMatrix(mat, scale, rownames, colnames)
+
+def brel_matrix(w, mydir=relpath):
+    return compile_rels(get_brels(w, mydir))
+
+def frel_matrix(w, mydir=relpath):
+    return compile_rels(get_frels(w, mydir))
+
+def relperm_matrix(mydir, w, seam, reltype):
+    return compile_rels(get_relpermdict(mydir, w, seam, reltype))
+
+########################################################################################################################
+# Exact checks of space rels against a symbol
+########################################################################################################################
+
+class RelResiduals(object):
+    # nonzero residuals of a RelMatrix against a symbol, in scaled units (divide by scale for the true value).
+    # contexts are the letters of the word outside the relation, rows index into relmat.rownames.
+    def __init__(self, relmat, contexts, rows, cols, values):
+        self.relmat = relmat
+        self.contexts = contexts
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def n_violated(self):
+        # number of contexts in which each rel fails
+        counts = np.bincount(np.asarray(self.cols, dtype=np.int64), minlength=len(self.relmat))
+        return {name: int(c) for name, c in zip(self.relmat.rownames, counts)}
+
+    def to_dict(self):
+        return {(self.contexts[r], self.relmat.rownames[c]): Fraction(int(v), self.relmat.scale)
+                for r, c, v in zip(self.rows, self.cols, self.values)}
+
+def symb_slice_matrix(symb, relmat, w, seam="back"):
+    # rows: the letters of each word outside the seam, columns: the w-letter word at the seam (a relmat term).
+    # words whose seam does not appear in any relation cannot contribute and are dropped.
+    codes, coeffs, length = symb_to_arrays(symb)
+    if w > length:
+        print(f"cannot check weight {w} rels against words of length {length}!")
+        raise ValueError
+    if seam == "back":
+        ctx, seamcodes = split_codes(codes, length, w)
+    elif seam == "front":
+        seamcodes, ctx = split_codes(codes, length, length - w)
+    else:
+        print("bad seam type!")
+        raise ValueError
+
+    termcodes = encode_words(relmat.colnames, w)
+    order = np.argsort(termcodes)
+    pos = np.searchsorted(termcodes[order], seamcodes)
+    pos[pos == len(order)] = 0
+    found = termcodes[order][pos] == seamcodes if len(order) else np.zeros(len(codes), dtype=bool)
+    cols = order[pos[found]]
+    contexts, rows = np.unique(ctx[found], return_inverse=True)
+    mat = sparse.csr_matrix((coeffs[found], (rows.ravel(), cols)), shape=(len(contexts), len(relmat.colnames)))
+    return mat, contexts, length - w
+
+def check_rels_in_symb(relmat, symb, w, seam="back"):
+    '''
+    Check every relation of a compiled F/B space family against every slice of a full-format symbol.
+    ---------
+    INPUTS:
+    relmat: RelMatrix; e.g. brel_matrix(w) (seam "back") or frel_matrix(w) (seam "front").
+    symb: dict; {word: int coeff}.
+    w: int; weight of the space, i.e. number of letters at the seam.
+    seam: str; "back" for rels on the last w letters, "front" for rels on the first w letters.
+
+    OUTPUTS:
+    residuals: RelResiduals; the nonzero residuals, exact.
+    Residuals are computed in int64 when the coefficients provably cannot overflow, otherwise with python ints.
+    '''
+    S, contexts, ctxlen = symb_slice_matrix(symb, relmat, w, seam)
+    M = relmat.mat.T.tocsc()
+    maxcoeff = int(abs(S).max()) if S.nnz else 0
+    if maxcoeff * relmat.max_abs_rowsum() <= int64_max:
+        R = (S @ M).tocoo()
+        keep = R.data != 0
+        rows, cols, values = R.row[keep], R.col[keep], R.data[keep]
+    else:
+        rows, cols, values = exact_slice_product(S, relmat.mat)
+    return RelResiduals(relmat, ContextNames(contexts, ctxlen), rows, cols, values)
+
+def exact_slice_product(S, mat):
+    # python-int fallback for S @ mat.T, used only when int64 could overflow
+    S = S.tocsr()
+    matc = mat.tocsc()
+    out_rows, out_cols, out_vals = [], [], []
+    for r in range(S.shape[0]):
+        acc = {}
+        for j, v in zip(S.indices[S.indptr[r]:S.indptr[r + 1]], S.data[S.indptr[r]:S.indptr[r + 1]]):
+            for i, c in zip(matc.indices[matc.indptr[j]:matc.indptr[j + 1]],
+                            matc.data[matc.indptr[j]:matc.indptr[j + 1]]):
+                acc[i] = acc.get(i, 0) + int(v) * int(c)
+        for i, total in sorted(acc.items()):
+            if total == 0: continue
+            out_rows.append(r); out_cols.append(i); out_vals.append(total)
+    values = np.array(out_vals, dtype=object)
+    if all(abs(v) <= int64_max for v in out_vals): values = values.astype(np.int64)
+    return np.array(out_rows, dtype=np.int64), np.array(out_cols, dtype=np.int64), values
+
+class ContextNames(object):
+    # lazily decoded list of context words
+    def __init__(self, codes, length):
+        self.codes = codes
+        self.length = length
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return decode_word(self.codes[i], self.length)
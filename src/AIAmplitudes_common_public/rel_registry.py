@@ -0,0 +1,135 @@
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import (first_entry_rel_table, initial_entries_rel_table,
+                                                   double_adjacency_rel_table, triple_adjacency_rel_table,
+                                                   integral_rel_table, final_entries_rel_table, get_rel_table_dihedral)
+from AIAmplitudes_common_public.word_utils import encode_words, pow6
+
+# Registry of the compiled relation families: first, initial, double, triple, integral and final entries.
+# Each family is built once, on first use, and shared read-only by every caller (read_rel_info,
+# trivial_zero_rel_table, is_trivial0, relsymb_generator, the synthetic data generator):
+#   rels: get_rel_table_dihedral of the table, as plain {term: coeff} dicts - the same objects every time, do not
+#         modify them. Its positions are the relation ids of rels_to_generate (read_rel_info), so it keeps the
+#         legacy order, where a relation can appear more than once,
+#   closure: one CompiledRel per distinct relation of rels, in first-seen order; ids maps every position of rels
+#            to its CompiledRel in closure,
+#   slot: where the relation may sit in a word (0: first letters, -1: last letters, None: anywhere).
+# A CompiledRel keeps its terms as a frozenset and as sorted int64 word codes, so a word is matched with one
+# slice lookup (matches / positions) and a whole symbol of word codes with a few array ops (match_codes).
+#
+#   fam = rel_family('final')
+#   fam.rels[19], fam.slot, len(fam)                               # len: distinct relations
+#   fam.rel(19).matches('aabbcddfbd')                               # CompiledRel of relation id 19
+#   fam.match_codes(codes, 10)                                      # (n_words, len(fam)) bool, over closure
+#   compiled(rel)                                                   # CompiledRel of any rel dict
+
+rel_tables = {'first': (first_entry_rel_table, 0),
+              'initial': (initial_entries_rel_table, 0),
+              'double': (double_adjacency_rel_table, None),
+              'triple': (triple_adjacency_rel_table, None),
+              'integral': (integral_rel_table, None),
+              'final': (final_entries_rel_table, -1)}
+
+class CompiledRel(object):
+    def __init__(self, rel, slot=None):
+        # rel: {term: coeff}, all terms with the same number of letters
+        lens = {len(term) for term in rel}
+        if len(lens) != 1:
+            print(f"the terms of a relation must all have the same length, got {sorted(lens)}!")
+            raise ValueError
+        self.rel, self.slot, self.nletter = rel, slot, lens.pop()
+        self.termset = frozenset(rel)
+        self.codes = np.unique(encode_words(list(rel), self.nletter))
+
+    def __repr__(self):
+        return f'CompiledRel({self.rel}, slot={self.slot})'
+
+    def __len__(self):
+        return len(self.rel)
+
+    def starts(self, length):
+        # allowed start positions in a word of the given length
+        if self.slot is None: return range(length - self.nletter + 1)
+        start = self.slot if self.slot >= 0 else length - self.nletter
+        return range(start, start + 1) if 0 <= start <= length - self.nletter else range(0)
+
+    def positions(self, word):
+        # allowed positions of word where one of the terms starts (overlapping occurrences included)
+        n = self.nletter
+        return {i for i in self.starts(len(word)) if word[i:i + n] in self.termset}
+
+    def matches(self, word):
+        n = self.nletter
+        return any(word[i:i + n] in self.termset for i in self.starts(len(word)))
+
+    def match_codes(self, codes, length):
+        # word codes -> bool array, whether the word holds a term at an allowed position
+        codes = np.asarray(codes, dtype=np.int64)
+        out = np.zeros(len(codes), dtype=bool)
+        for i in self.starts(length):
+            window = (codes // pow6(length - i - self.nletter)) % pow6(self.nletter)
+            pos = np.searchsorted(self.codes, window)
+            pos[pos == len(self.codes)] = 0
+            out |= self.codes[pos] == window
+        return out
+
+class RelFamily(object):
+    def __init__(self, name, table, slot):
+        self.name, self.table, self.slot = name, tuple(table), slot
+        self.rels = get_rel_table_dihedral(table)
+        position, closure, ids = {}, [], []
+        for rel in self.rels:
+            key = tuple(sorted(rel.items()))
+            if key not in position:
+                position[key] = len(closure)
+                closure.append(CompiledRel(rel, slot))
+            ids.append(position[key])
+        self.closure, self.ids = tuple(closure), np.array(ids, dtype=np.int64)
+        self.terms = frozenset(term for rel in self.rels for term in rel)
+
+    def __repr__(self):
+        return (f'RelFamily({self.name}, {len(self.table)} rels, {len(self.rels)} relation ids, {len(self)} distinct '
+                f'dihedral images, slot={self.slot})')
+
+    def __len__(self):
+        return len(self.closure)
+
+    def __getitem__(self, i):
+        return self.closure[i]
+
+    def rel(self, i):
+        # the CompiledRel of relation id i (a position of rels)
+        return self.closure[self.ids[i]]
+
+    def __iter__(self):
+        return iter(self.closure)
+
+    def match_codes(self, codes, length):
+        # (n_words, len(self)) bool: which relations of the closure each word holds at an allowed position
+        return np.stack([rel.match_codes(codes, length) for rel in self.closure], axis=1)
+
+_families = {}
+_compiled = {}
+
+def rel_family(name):
+    '''
+    The compiled family of one relation table, built on first use.
+    ---------
+    INPUTS:
+    name: str; one of 'first', 'initial', 'double', 'triple', 'integral', 'final'.
+
+    OUTPUTS:
+    family: RelFamily; shared, read-only.
+    '''
+    if name not in _families:
+        if name not in rel_tables:
+            print(f"unknown relation {name}, expected one of {list(rel_tables)}!")
+            raise ValueError
+        family = RelFamily(name, *rel_tables[name])
+        for rel, i in zip(family.rels, family.ids.tolist()): _compiled[id(rel)] = family.closure[i]
+        _families[name] = family
+    return _families[name]
+
+def compiled(rel, slot=None):
+    # the CompiledRel of a rel dict: the shared one for the dicts of rel_family(...).rels, else compiled now
+    if id(rel) in _compiled and _compiled[id(rel)].rel == rel: return _compiled[id(rel)]
+    return CompiledRel(rel, slot)
@@ -10,6 +10,8 @@ from itertools import permutations
 import random
 import json
 import copy
+from AIAmplitudes_common_public.commonclasses import Symb, coeff_index
+from AIAmplitudes_common_public.random_streams import resolve_rng
 
 alphabet = ['a', 'b', 'c', 'd', 'e', 'f']
 quad_prefix = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
@@ -102,14 +104,15 @@ initial_entries_rel_table = [{'ad': 1},
                               'afb': -1 / 2}]
 
 def trivial_zero_rel_table(format="full"):
-    myrel_table = first_entry_rel_table
+    # fresh lists on every call: the rel tables themselves are never extended
+    myrel_table = list(first_entry_rel_table)
     slots = [0] * len(first_entry_rel_table)
 
     if format == "full":
         myrel_table += final_entries_rel_table[:3]
         slots += [-1] * len(final_entries_rel_table[:3])
 
-    steinmanns = get_rel_table_dihedral(double_adjacency_rel_table)
+    steinmanns = rel_registry.rel_family('double').rels
 
     myrel_table += steinmanns
     slots += [None] * len(steinmanns)
@@ -123,9 +126,14 @@ def table_image(table):
     return [{get_image(k,ind):v for k,v in rel.items()} for ind in range(len(alphabet)) for rel in table]
 
 def table_to_rels(table):
-    tr=table_image(table)
-    return [i for n, i in enumerate(tr) if not
-               any(set(sorted(i.keys())) == set(sorted(k.keys())) for k in tr[n + 1:])]
+    # the images, keeping the last one of each set of terms, in order
+    tr, seen, keep = table_image(table), set(), []
+    for rel in reversed(tr):
+        terms = frozenset(rel)
+        if terms not in seen:
+            seen.add(terms)
+            keep.append(rel)
+    return keep[::-1]
 
 pair_rels=table_to_rels(pair_table)
 triple_rels=table_to_rels(triple_table)
@@ -173,6 +181,14 @@ def find_all(a_str, sub):
         yield start
         start += len(sub)
 
+def check_slot(a_str, sub, slot):
+    # does sub start exactly at the given slot of a_str?
+    return a_str[slot:slot + len(sub)] == sub
+
+def count_appearances(a_str, slot):
+    # how many times the letter at slot appears in a_str, up to and including slot
+    return a_str[:slot + 1].count(a_str[slot])
+
 
 
 
@@ -202,29 +218,12 @@ def read_rel_info(rels_to_generate, make_zero_rels=False):
     for rel_key, rel_info in rels_to_generate.items():
         for i in range(len(rel_info[0])):
             if not make_zero_rels and rel_info[1][i] == 0: continue
-            myrel_table = {}
-            myslot = None
-            if rel_key == 'first':
-                myrel_table = get_rel_table_dihedral(first_entry_rel_table)
-                myslot = 0
-            elif rel_key == 'initial':
-                myrel_table = get_rel_table_dihedral(initial_entries_rel_table)
-                myslot = 0
-            elif rel_key == 'double':
-                myrel_table = get_rel_table_dihedral(double_adjacency_rel_table)
-                myslot = None
-            elif rel_key == 'triple':
-                myrel_table = get_rel_table_dihedral(triple_adjacency_rel_table)
-                myslot = None
-            elif rel_key == 'integral':
-                myrel_table = get_rel_table_dihedral(integral_rel_table)
-                myslot = None
-            elif rel_key == 'final':
-                myrel_table = get_rel_table_dihedral(final_entries_rel_table)
-                myslot = -1
-            elif rel_key == 'dihedral':
+            if rel_key == 'dihedral':
                 myrel_table = [None] * len(rel_info[0])
                 myslot = None
+            elif rel_key in rel_registry.rel_tables:
+                family = rel_registry.rel_family(rel_key)
+                myrel_table, myslot = family.rels, family.slot
             else:
                 print("unknown relation!")
                 raise ValueError
@@ -260,11 +259,37 @@ def get_word_from_coeff(coeff, symb):
     OUTPUTS:
     word: set; a set of words (strings) with the given coeff;
           if coeff does not exist in symb, then return an empty string.
+    For a Symb, the lookup goes through its cached coefficient index.
     '''
-    if coeff in symb.values():
-        word = {i for i in symb if symb[i] == coeff}  # set
-        return word
+    if isinstance(symb, Symb):
+        word = symb.coeff_index().words_with(coeff)
+    else:
+        word = {i for i, c in symb.items() if c == coeff}  # set
+    if word: return word
     return str()
+def get_coeff_histogram(symb):
+    '''
+    Count how many words carry each coeff in a symbol.
+    ---------
+    INPUTS:
+    symb: dict; a dictionary with word as key, and coeff as value. Pass a Symb to reuse its cached index.
+
+    OUTPUTS:
+    histogram: dict; {coeff: number of words}.
+    '''
+    return coeff_index(symb).histogram()
+def get_top_coeffs(symb, k=10):
+    '''
+    Get the k most frequent coeffs in a symbol.
+    ---------
+    INPUTS:
+    symb: dict; a dictionary with word as key, and coeff as value. Pass a Symb to reuse its cached index.
+    k: int.
+
+    OUTPUTS:
+    top: list; (coeff, number of words) pairs, most frequent first.
+    '''
+    return coeff_index(symb).most_common(k)
 def get_dihedral_images(word):
     '''
     Get all the dihedral images of a given word.
@@ -292,7 +317,7 @@ def get_valid_dihedral_images(word, pruned_symb, badsymb):
     dihedral_images = {row: image for row in range(len(alphabet)) if (
         image := ''.join([dihedral_table[row][idx] for idx in word_idx])) in pruned_symb and image not in badsymb}
     return dihedral_images
-def get_dihedral_pair(key, goodkeys, symb, type="cycle"):
+def get_dihedral_pair(key, goodkeys, symb, type="cycle", rng=None):
     '''
     Given a key, the
     ---------
@@ -301,6 +326,7 @@ def get_dihedral_pair(key, goodkeys, symb, type="cycle"):
     key_images. list; the dihedral images of the key.
     goodkeys. set; the allowed keys.
     symb. dict; the symbol to lookup coeffs.
+    rng: random.Random or None; random stream (see random_streams); default the global random module.
     OUTPUTS:
     pair; dict. A two-term instance of type "cycle" or "flip".
     '''
@@ -314,16 +340,19 @@ def get_dihedral_pair(key, goodkeys, symb, type="cycle"):
     good_inds = list(indices.intersection(set(goodkeys.keys())))
     if len(good_inds) == 0: return None
     # get random key: ind from goodkeys
-    ind = random.choice(good_inds)
+    ind = resolve_rng(rng).choice(good_inds)
     pair = {key: [symb[key], 1], goodkeys[ind]: [symb[goodkeys[ind]], -1]}
     return pair
-def generate_random_word(word_length, format='full', seed=0):
+def generate_random_word(word_length, format='full', seed=0, rng=None):
     '''
     Generate a random word with a specific length.
     ---------
     INPUTS:
     word_length: int; number of letters in the generated word.
     seed: int; random number generating seed; default 0.
+    rng: random.Random, int or None; if given, letters are drawn from this stream (or one seeded with the int)
+         and seed is ignored
+         (without it, the global random module is reseeded for every letter).
 
     OUTPUTS:
     word: str; a word with letters in the alphabet and the specific length.
@@ -332,15 +361,15 @@ def generate_random_word(word_length, format='full', seed=0):
         print("Error, bad format!")
         raise ValueError
     word = ''
+    rand = resolve_rng(rng)  # once: an int seed gives one stream for the whole word
     for i in range(word_length):
-        random.seed(seed + i)
-        word += alphabet[int(len(alphabet) * random.random())]
+        if rng is None: random.seed(seed + i)
+        word += alphabet[int(len(alphabet) * rand.random())]
     if format == 'full':
         return word
     if format == 'quad':
-        print(word, quad_prefix)
-        random.seed((seed + 100) * 10)  # must generate another random number
-        prefix = quad_prefix[int(len(quad_prefix) * random.random())]
+        if rng is None: random.seed((seed + 100) * 10)  # must generate another random number
+        prefix = quad_prefix[int(len(quad_prefix) * rand.random())]
         return prefix + word
     if format == 'oct':  # not yet implemented
         # random.seed((seed+1000)*100) # must generate another random number
@@ -348,7 +377,7 @@ def generate_random_word(word_length, format='full', seed=0):
         # return prefix+word
         return None
 
-def get_rel_terms_in_symb(symb, fraction, rel, rel_slot='any', format='full', seed=0):
+def get_rel_terms_in_symb(symb, fraction, rel, rel_slot='any', format='full', seed=0, rng=None):
     '''
     Get the related term(s) in the given symbol according to the specified relation,
     for a fraction of words in the full symbol.
@@ -362,6 +391,8 @@ def get_rel_terms_in_symb(symb, fraction, rel, rel_slot='any', format='full', se
               if 'first' or 'final', the relation can only be at the first or final few slots of a word;
               if 'any', the relation can be at any slot of a word.
     seed: int; random number generating seed; default 0.
+    rng: random.Random, int or None; if given, the words are sampled from this stream (or one seeded with the int)
+         and seed is ignored.
 
     OUTPUTS:
     rel_terms_list: list of dicts; each item in the list is a dict in the format of
@@ -375,8 +406,8 @@ def get_rel_terms_in_symb(symb, fraction, rel, rel_slot='any', format='full', se
     if num_words_to_pick <= 0:
         return []
 
-    random.seed(seed)
-    random_words = random.sample(all_words, num_words_to_pick)
+    if rng is None: random.seed(seed)
+    random_words = resolve_rng(rng).sample(all_words, num_words_to_pick)
 
     for word in random_words:
         rel_terms_list = get_rel_terms_in_symb_per_word(word, symb, rel, rel_slot=rel_slot, format=format)
@@ -643,10 +674,9 @@ def is_trivial0(word):
         if word[-1] in rel:
             return True
 
-    for rel in get_rel_table_dihedral(double_adjacency_rel_table):  # adjacency rule
-        for rel_key in rel:
-            if rel_key in word:
-                return True
+    steinmanns = rel_registry.rel_family('double').terms  # adjacency rule
+    if any(word[i:i + 2] in steinmanns for i in range(len(word) - 1)):
+        return True
 
     return False
 def get_rel_table_dihedral(rel_table):
@@ -830,7 +860,7 @@ def get_relsum_and_nzero(rel_terms_list, nterm, p_norm):
                 print("overflow error! setting rel sum to -1")
                 relsum = -1
         yield relsum, n_nontrivial0_term
-def gen_let(inletter,type="next"):
+def gen_let(inletter,type="next",rng=None):
     # hardcode adjacency rules to generate nontrivial zeroes
     assert type in {"next","last","first"}
     tmat={'a':{"first":['a', 'b', 'c'],
@@ -852,12 +882,13 @@ def gen_let(inletter,type="next"):
         "next":['a', 'b', 'f'],
         "last":['f']}
     }
-    letter = tmat[inletter][type][int(len(tmat[inletter][type]) * random.random())]
+    letter = tmat[inletter][type][int(len(tmat[inletter][type]) * resolve_rng(rng).random())]
     return letter
-def gen_valid_substr(to_gen, input=None, suffix=False):
+def gen_valid_substr(to_gen, input=None, suffix=False, rng=None):
     # generate a valid substring. If input is given, build a string that is compatible with it.
     # If 'suffix', gen a valid substring that can be reversed and prepended to input
     # otherwise, gen a valid substring that can be appended to input
+    rng = resolve_rng(rng)
     letter = ''
     if input:
         if suffix:
@@ -868,9 +899,13 @@ def gen_valid_substr(to_gen, input=None, suffix=False):
         if not suffix:
             if i == 0:
                 mylist = ['a', 'b', 'c']
-                letter = mylist[int(len(mylist) * random.random())]
+                letter = mylist[int(len(mylist) * rng.random())]
         if suffix and (i == to_gen - 1):
-            letter = gen_let(letter,"first")
+            letter = gen_let(letter,"first",rng)
         else:
-            letter = gen_let(letter,"next")
-        yield letter
\ No newline at end of file
+            letter = gen_let(letter,"next",rng)
+        yield letter
+
+# the compiled rel tables (read_rel_info, trivial_zero_rel_table, is_trivial0); imported last, once the tables above
+# are defined, since rel_registry builds on them
+import AIAmplitudes_common_public.rel_registry as rel_registry
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+from scipy import sparse
+from AIAmplitudes_common_public.file_readers import relpath, get_relpermdict
+from AIAmplitudes_common_public.fbspaces import get_perm_fspace, get_perm_bspace
+from AIAmplitudes_common_public.rel_matrices import RelMatrix, ContextNames, compile_rels
+from AIAmplitudes_common_public.word_utils import symb_to_arrays, encode_words, encode_word, pow6
+
+# Batch checks of the permissive sewing rels (get_relpermdict) against a symbol.
+# A front rel is a linear relation among the coefficients c[i,x] of Fp_{w,i} (x) x,
+# where Fp_{w,i} is a permissive front space element on the first w letters and x the next letter(s).
+# For every assignment of the remaining letters (a context), the slice of the symbol on the first w letters
+# is decomposed over the front space, and every rel is evaluated on the resulting coefficients.
+# The back rels are the mirror image: x @ Bp_{w,i} on the last w letters.
+# The decomposition is a float projection (pinv of the space), so residuals are checked against a tolerance.
+
+termre = re.compile(r'([a-f]*)@?([FB]p_\d+_\d+)@?([a-f]*)')
+
+def parse_sewterm(term):
+    # 'Fp_2_3@ab' -> ('', 'Fp_2_3', 'ab'), 'ab@Bp_2_3' -> ('ab', 'Bp_2_3', '')
+    m = termre.fullmatch(term)
+    if m is None:
+        print(f"bad sewing term {term}!")
+        raise ValueError
+    return m.groups()
+
+class SewingResult(object):
+    def __init__(self, checker, residuals, contexts, tol, n_slices, n_out_of_space):
+        self.checker = checker
+        self.residuals = residuals  # csr, contexts x rels
+        self.contexts = contexts
+        self.tol = tol
+        self.n_slices = n_slices
+        self.n_out_of_space = n_out_of_space  # slices that are not in the span of the space at all
+
+    def violations(self):
+        return abs(self.residuals) > self.tol
+
+    def n_violated(self):
+        counts = np.asarray(self.violations().sum(axis=0)).ravel()
+        return {name: int(c) for name, c in zip(self.checker.relmat.rownames, counts)}
+
+    def max_residual(self):
+        if self.residuals.shape[0] == 0:
+            return {name: 0. for name in self.checker.relmat.rownames}
+        maxes = np.asarray(abs(self.residuals).max(axis=0).todense()).ravel()
+        return {name: float(m) for name, m in zip(self.checker.relmat.rownames, maxes)}
+
+    def failed_rels(self):
+        return [name for name, c in self.n_violated().items() if c > 0]
+
+    def percent_satisfied(self):
+        if len(self.checker.relmat) == 0: return None
+        return 1 - len(self.failed_rels()) / len(self.checker.relmat)
+
+class SewingChecker(object):
+    # compile once per (w, seam, reltype), then check as many symbols as needed
+    def __init__(self, rels, basis, w, seam="front"):
+        if seam not in {"front", "back"}:
+            print("bad seam type!")
+            raise ValueError
+        self.w, self.seam = w, seam
+        self.relmat = rels if isinstance(rels, RelMatrix) else compile_rels(rels)
+
+        # the space as a dense (elements x words) matrix, and its pseudo-inverse
+        self.elemnames = list(basis.keys())
+        elem_index = {name: i for i, name in enumerate(self.elemnames)}
+        self.words = sorted({word for elem in basis.values() for word in elem})
+        self.wordcodes = encode_words(self.words, w)
+        word_index = {word: i for i, word in enumerate(self.words)}
+        B = np.zeros((len(self.elemnames), len(self.words)))
+        for name, elem in basis.items():
+            for word, coef in elem.items(): B[elem_index[name], word_index[word]] = coef
+        self.G = np.linalg.pinv(B)
+        self.BBt = B @ B.T
+
+        # each rel term is (element, letters); in the slice matrix it sits at column letters*nb + element
+        lett, elem = [], []
+        for term in self.relmat.colnames:
+            pre, name, post = parse_sewterm(term)
+            if (seam == "front" and pre) or (seam == "back" and post):
+                print(f"term {term} does not match seam {seam}!")
+                raise ValueError
+            if name not in elem_index:
+                print(f"term {term} is not in the {seam} space at weight {w}!")
+                raise KeyError(name)
+            lett.append(post if seam == "front" else pre)
+            elem.append(elem_index[name])
+        self.nlett = len(lett[0]) if lett else 0
+        if any(len(l) != self.nlett for l in lett):
+            print("all terms in a family must have the same number of letters!")
+            raise ValueError
+        self.lettcodes = np.array([encode_word(l) for l in lett], dtype=np.int64)
+        nb = len(self.elemnames)
+        colpos = self.lettcodes * nb + np.array(elem, dtype=np.int64)
+        M = self.relmat.mat.tocoo()
+        self.RzT = sparse.csr_matrix((M.data / self.relmat.scale, (colpos[M.col], M.row)),
+                                     shape=(int(pow6(self.nlett)) * nb, len(self.relmat)))
+        self.used_letts = np.unique(self.lettcodes)
+
+    def __repr__(self):
+        return f'SewingChecker(w={self.w}, {self.seam}, {len(self.relmat)} rels over {len(self.elemnames)} elements)'
+
+    def split_symb(self, codes, length):
+        # -> (codes of the w seam letters, of the adjacent letters, of the remaining context)
+        rest = length - self.w - self.nlett
+        if rest < 0:
+            print(f"words of length {length} are too short for weight {self.w} sewing rels!")
+            raise ValueError
+        if self.seam == "front":
+            seamcodes = codes // pow6(length - self.w)
+            lett = (codes // pow6(rest)) % pow6(self.nlett)
+            ctx = codes % pow6(rest)
+        else:
+            seamcodes = codes % pow6(self.w)
+            lett = (codes // pow6(self.w)) % pow6(self.nlett)
+            ctx = codes // pow6(self.w + self.nlett)
+        return seamcodes, lett, ctx, rest
+
+    def check(self, symb, rtol=1e-9, chunksize=2**22):
+        '''
+        Evaluate every sewing rel in every context of a full-format symbol.
+        ---------
+        INPUTS:
+        symb: dict; {word: coeff}.
+        rtol: float; residuals below rtol * max|coeff| count as zero.
+        chunksize: int; max number of dense projection entries held at once.
+
+        OUTPUTS:
+        result: SewingResult; residuals per (context, rel), violation counts per rel.
+        '''
+        codes, coeffs, length = symb_to_arrays(symb)
+        seamcodes, lett, ctx, rest = self.split_symb(codes, length)
+        tol = rtol * max(1, int(np.abs(coeffs).max())) if len(coeffs) else rtol
+
+        keep = np.isin(lett, self.used_letts)
+        seamcodes, lett, ctx, coeffs = seamcodes[keep], lett[keep], ctx[keep], coeffs[keep].astype(np.float64)
+        pos = np.searchsorted(self.wordcodes, seamcodes)
+        pos[pos == len(self.wordcodes)] = 0
+        in_space = self.wordcodes[pos] == seamcodes if len(self.wordcodes) else np.zeros(len(pos), dtype=bool)
+
+        # one slice per (context, letters): the vector of coefficients over the words of the space
+        slicekeys, slice_id = np.unique(ctx * pow6(self.nlett) + lett, return_inverse=True)
+        slice_id = slice_id.ravel()
+        contexts, ctx_id = np.unique(slicekeys // pow6(self.nlett), return_inverse=True)
+        ctx_id, slice_lett = ctx_id.ravel(), slicekeys % pow6(self.nlett)
+        norm2 = np.bincount(slice_id, weights=coeffs ** 2, minlength=len(slicekeys))
+        V = sparse.csr_matrix((coeffs[in_space], (slice_id[in_space], pos[in_space])),
+                              shape=(len(slicekeys), len(self.words)))
+
+        nb = len(self.elemnames)
+        step = max(1, chunksize // max(nb, 1))
+        residuals = sparse.csr_matrix((len(contexts), len(self.relmat)))
+        n_out = 0
+        for start in range(0, len(slicekeys), step):
+            end = min(start + step, len(slicekeys))
+            X = np.asarray(V[start:end] @ self.G)
+            # squared distance of each slice from the space, including its weight on words outside the space
+            dist2 = norm2[start:end] - np.einsum('ij,jk,ik->i', X, self.BBt, X)
+            n_out += int((dist2 > np.maximum(tol ** 2, 1e-12 * norm2[start:end])).sum())
+            rows = np.repeat(ctx_id[start:end], nb)
+            cols = (slice_lett[start:end, None] * nb + np.arange(nb)[None, :]).ravel()
+            Z = sparse.csr_matrix((X.ravel(), (rows, cols)), shape=(len(contexts), self.RzT.shape[0]))
+            residuals = residuals + Z @ self.RzT
+        residuals = residuals.tocsr()
+        residuals.data[np.abs(residuals.data) <= tol] = 0
+        residuals.eliminate_zeros()
+        return SewingResult(self, residuals, ContextNames(contexts, rest), tol, len(slicekeys), n_out)
+
+def sewing_checker(w, seam="front", reltype="oneletter", mydir=relpath):
+    basis = get_perm_fspace(w, mydir)[0] if seam == "front" else get_perm_bspace(w, mydir)[0]
+    return SewingChecker(get_relpermdict(mydir, w, seam, reltype), basis, w, seam)
+
+def check_sewing_rels(symb, w, seam="front", reltype="oneletter", mydir=relpath, rtol=1e-9):
+    return sewing_checker(w, seam, reltype, mydir).check(symb, rtol)
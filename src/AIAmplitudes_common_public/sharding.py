@@ -0,0 +1,200 @@
+import collections
+import json
+import multiprocessing
+import os
+import re
+from AIAmplitudes_common_public.file_readers import iter_symb_terms
+from AIAmplitudes_common_public.instrumentation import span, count, event
+
+# Out-of-core processing of symbols that do not fit in memory (L=7 quad, L=8 oct).
+# shard_symbol streams a symbol file term by term (iter_symb_terms) into one text shard per word prefix or
+# per basis element; ShardedSymb then behaves like a read-only symbol dict (`in`, [], get) that holds only a few
+# shards in memory (LRU), so cross-shard lookups - a relation that changes letters away from the shard key,
+# a target in another shard - just load the owning shard. map_shards runs a per-word pipeline stage
+# (relsymb_generator, opsymb_generator, relation checks, ...) shard by shard, optionally in a process pool,
+# each worker with its own LRU of shards.
+#
+#   sh = shard_symbol(Phi2File(8, "oct"), "oct8_shards", loop=8, reptype="oct", by="basis")
+#   sh = ShardedSymb("oct8_shards")
+#   sh['Br_8_57abcdefab'], sh.get_many(words)
+#   counts = map_shards(sh, count_relsymb_keys, processes=8)   # {label: result}
+
+_keyre = re.compile(r'^(Br_\d+_\d+)?([a-f]*)$')
+shard_suffix = '.tsv'
+
+def split_key(key):
+    # (basis prefix or '', word part)
+    m = _keyre.match(key)
+    if m is None:
+        print(f"bad symbol key {key}!")
+        raise ValueError
+    return m.group(1) or '', m.group(2)
+
+def key_reptype(key):
+    # "quad" / "oct" for compressed 'Br_4_' / 'Br_8_' keys, else "full" (as metrics.symb_arrays)
+    if key.startswith('Br_4_'): return "quad"
+    if key.startswith('Br_8_'): return "oct"
+    return "full"
+
+def shard_label(key, by='prefix', prefix_len=2):
+    # 'prefix': basis prefix + first prefix_len letters of the word part; 'basis': the basis prefix alone
+    basis, word = split_key(key)
+    if by == 'basis': return basis or 'full'
+    if by == 'prefix': return basis + word[:prefix_len]
+    print(f"unknown shard type {by}!")
+    raise ValueError
+
+def shard_symbol(source, outdir, loop=None, reptype=None, by='prefix', prefix_len=2, buffer_terms=100000):
+    '''
+    Partition a symbol on disk by word prefix or basis element.
+    ---------
+    INPUTS:
+    source: str or dict; a symbol file (streamed, never loaded whole) or an in-memory symbol / iterable of items.
+    outdir: str; output directory, one <label>.tsv file per shard plus meta.json.
+    loop, reptype: as convert (to read a file); reptype is recorded in meta.json, and found from the 'Br_4_'/'Br_8_'
+                   prefix of the first key when it is not given.
+    by: str; "prefix" or "basis".
+    prefix_len: int; letters of the word part in the label, for by="prefix".
+    buffer_terms: int; terms buffered in memory before being appended to their shard files.
+
+    OUTPUTS:
+    sharded: ShardedSymb.
+    '''
+    if isinstance(source, str): items = iter_symb_terms(source, loop, reptype)
+    elif hasattr(source, 'items'): items = source.items()
+    else: items = source
+    os.makedirs(outdir, exist_ok=True)
+    for name in os.listdir(outdir):
+        if name.endswith(shard_suffix): os.remove(os.path.join(outdir, name))
+    sizes, buffers, nbuf = collections.Counter(), collections.defaultdict(list), 0
+    first = None
+
+    def flush():
+        for label, lines in buffers.items():
+            with open(os.path.join(outdir, label + shard_suffix), 'a') as f: f.writelines(lines)
+        buffers.clear()
+
+    with span("shard_symbol", by=by):
+        for key, coeff in items:
+            if first is None: first = key
+            label = shard_label(key, by, prefix_len)
+            buffers[label].append(f'{key}\t{coeff}\n')
+            sizes[label] += 1
+            nbuf += 1
+            if nbuf >= buffer_terms:
+                flush()
+                nbuf = 0
+        flush()
+        count("shard.terms", sum(sizes.values()))
+    if reptype is None and first is not None: reptype = key_reptype(first)
+    meta = {'by': by, 'prefix_len': prefix_len, 'loop': loop, 'reptype': reptype,
+            'source': source if isinstance(source, str) else None, 'shards': dict(sorted(sizes.items()))}
+    with open(os.path.join(outdir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    event("sharded symbol", outdir=outdir, n_shards=len(sizes), n_terms=sum(sizes.values()))
+    return ShardedSymb(outdir)
+
+def read_shard(path):
+    out = {}
+    with open(path) as f:
+        for line in f:
+            key, coeff = line.split('\t')
+            out[key] = int(coeff)
+    return out
+
+class ShardedSymb(object):
+    # read-only symbol over the shards of shard_symbol; at most cache_shards shards are in memory at once
+    def __init__(self, outdir, cache_shards=4):
+        self.outdir, self.cache_shards = outdir, cache_shards
+        with open(os.path.join(outdir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.sizes = self.meta['shards']
+        self.cache = collections.OrderedDict()
+
+    def __reduce__(self):
+        # workers re-open the directory, with an empty cache
+        return ShardedSymb, (self.outdir, self.cache_shards)
+
+    def __repr__(self):
+        return f"ShardedSymb({self.outdir}, {len(self.sizes)} shards by {self.meta['by']}, {len(self)} terms)"
+
+    def __len__(self):
+        return sum(self.sizes.values())
+
+    def labels(self):
+        return list(self.sizes)
+
+    def label_of(self, key):
+        return shard_label(key, self.meta['by'], self.meta['prefix_len'])
+
+    def shard(self, label):
+        # {key: coeff} of one shard ({} if there is no such shard), through the LRU cache
+        if label in self.cache:
+            self.cache.move_to_end(label)
+            return self.cache[label]
+        if label not in self.sizes: return {}
+        count("shard.loads")
+        out = self.cache[label] = read_shard(os.path.join(self.outdir, label + shard_suffix))
+        if len(self.cache) > self.cache_shards: self.cache.popitem(last=False)
+        return out
+
+    def __contains__(self, key):
+        try: return key in self.shard(self.label_of(key))
+        except ValueError: return False
+
+    def __getitem__(self, key):
+        return self.shard(self.label_of(key))[key]
+
+    def get(self, key, default=0):
+        try: return self.shard(self.label_of(key)).get(key, default)
+        except ValueError: return default
+
+    def get_many(self, keys, default=0):
+        # coeffs of many keys, loading every shard they touch once (grouped by shard, not in key order)
+        keys = list(keys)
+        by_label = collections.defaultdict(list)
+        for i, key in enumerate(keys): by_label[self.label_of(key)].append(i)
+        out = [default] * len(keys)
+        for label, idx in by_label.items():
+            shard = self.shard(label)
+            for i in idx: out[i] = shard.get(keys[i], default)
+        return out
+
+    def items(self):
+        # every (key, coeff), shard by shard
+        for label in self.sizes:
+            yield from self.shard(label).items()
+
+    def keys(self):
+        for key, _ in self.items(): yield key
+
+    def __iter__(self):
+        return self.keys()
+
+def _run_shard(args):
+    fn, sharded, label, kwargs = args
+    with span("shard", label=label):
+        return label, fn(sharded.shard(label), label, sharded, **kwargs)
+
+def map_shards(sharded, fn, labels=None, processes=1, **kwargs):
+    '''
+    Run a per-word pipeline stage shard by shard.
+    ---------
+    INPUTS:
+    sharded: ShardedSymb.
+    fn: callable fn(shard, label, sharded, **kwargs); shard is the {key: coeff} dict of one shard, and
+        sharded serves cross-shard lookups. Must be picklable (module level) when processes > 1.
+    labels: list or None; shards to run (default: all), e.g. to resume or to split across nodes.
+    processes: int; size of the process pool (1: run in this process).
+
+    OUTPUTS:
+    results: dict; {label: fn output}, in shard order.
+    '''
+    labels = sharded.labels() if labels is None else list(labels)
+    jobs = [(fn, sharded, label, kwargs) for label in labels]
+    if processes <= 1:
+        results = dict(_run_shard(job) for job in jobs)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = dict(pool.imap_unordered(_run_shard, jobs))
+    return {label: results[label] for label in labels}
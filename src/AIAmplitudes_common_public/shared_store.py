@@ -0,0 +1,214 @@
+import json
+import os
+import numpy as np
+from multiprocessing import shared_memory
+from scipy import sparse
+from AIAmplitudes_common_public.compact_symb import CompactSymb
+from AIAmplitudes_common_public.file_readers import compressed_prefixes
+from AIAmplitudes_common_public.membership import attach_shared_memory
+from AIAmplitudes_common_public.rel_matrices import RelMatrix
+from AIAmplitudes_common_public.space_reduction import SpaceReducer
+
+# Publish a loaded symbol or F/B space matrix once, and attach to it read-only from any process by name.
+# A store is one block - a multiprocessing.shared_memory segment or a file - laid out as
+#   8-byte header length | json header (kind, meta, {array: (dtype, shape, offset)}) | arrays, 64-byte aligned,
+# so attaching needs only the name (or path): the header says how to view the pages, and no array is copied.
+# SharedSymb is a CompactSymb over such a block, with the lookups of Symb ([] is 0 for a missing key, `in`, get);
+# SharedRelMatrix / SharedSpaceReducer are RelMatrix / SpaceReducer whose arrays live in the block.
+# All of them pickle as their name or path, so Pool and DataLoader workers receive a few bytes and map the same
+# pages: a 32-worker job holds one copy. (Bad-symbol sets: PackedSet / BloomFilter .to_shared_memory(), membership.)
+#
+#   symb = share_symb(Phi2CompactSymb(8, "oct"), name="oct8")      # in the parent; keep it alive
+#   with multiprocessing.Pool(32) as pool: pool.map(work, [(symb, chunk) for chunk in chunks])
+#   symb = attach("oct8")                                          # or, by name, from an unrelated process
+#   symb['Br_8_57abcdefab'], 'Br_8_57abcdefab' in symb
+#   symb.close(unlink=True)                                        # in the parent, once every worker is done
+#   mat = share_relmatrix(brel_matrix(4), path="brel4.store")      # file-backed: attach("brel4.store")
+
+align = 64
+
+def _layout(arrays):
+    # {name: (dtype, shape, offset)} relative to the start of the data, and the data size
+    layout, offset = {}, 0
+    for name, arr in arrays.items():
+        layout[name] = (arr.dtype.str, list(arr.shape), offset)
+        offset += -(-arr.nbytes // align) * align
+    return layout, offset
+
+def _header(kind, meta, layout):
+    head = json.dumps({'kind': kind, 'meta': meta, 'arrays': layout}).encode('utf-8')
+    return len(head).to_bytes(8, 'little') + head + b'\0' * (-(8 + len(head)) % align)
+
+class SharedStore(object):
+    # named read-only arrays plus a json meta, in one shared memory segment (shm) or memory-mapped file (path)
+    def __init__(self, kind, meta, arrays, shm=None, path=None):
+        self.kind, self.meta, self.arrays, self.shm, self.path = kind, meta, arrays, shm, path
+
+    @classmethod
+    def create(cls, kind, meta, arrays, name=None, path=None):
+        '''
+        Copy arrays once into a new store.
+        ---------
+        INPUTS:
+        kind: str; what the store holds, for attach.
+        meta: dict; json-serializable metadata.
+        arrays: dict; {name: numpy array}.
+        name: str or None; shared memory name (None: a random one), used when path is None.
+        path: str or None; write a file instead of a shared memory segment.
+
+        OUTPUTS:
+        store: SharedStore; attached to the new block.
+        '''
+        arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+        layout, size = _layout(arrays)
+        head = _header(kind, meta, layout)
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(head)
+                for k, arr in arrays.items():
+                    f.seek(len(head) + layout[k][2])
+                    f.write(arr.tobytes())
+                f.truncate(len(head) + size)
+            return cls.open(path)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=len(head) + size)
+        shm.buf[:len(head)] = head
+        for k, arr in arrays.items():
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=len(head) + layout[k][2])[...] = arr
+        return cls._from_buffer(shm.buf, shm=shm)
+
+    @classmethod
+    def attach(cls, name):
+        # not registered with this process's resource_tracker, so only the creator unlinks the block
+        return cls._from_buffer(None, shm=attach_shared_memory(name))
+
+    @classmethod
+    def open(cls, path):
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+        return cls._from_buffer(buf, path=path)
+
+    @classmethod
+    def _from_buffer(cls, buf, shm=None, path=None):
+        if buf is None: buf = shm.buf
+        hlen = int.from_bytes(bytes(buf[:8]), 'little')
+        head = json.loads(bytes(buf[8:8 + hlen]).decode('utf-8'))
+        start = 8 + hlen + (-(8 + hlen) % align)
+        arrays = {}
+        for k, (dtype, shape, offset) in head['arrays'].items():
+            arr = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=buf, offset=start + offset)
+            arr.flags.writeable = False
+            arrays[k] = arr
+        return cls(head['kind'], head['meta'], arrays, shm=shm, path=path)
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+    def close(self, unlink=False):
+        # detach; unlink=True (in the creating process, once every worker is done) frees the segment
+        self.arrays = {}
+        if self.shm is not None:
+            self.shm.close()
+            if unlink: self.shm.unlink()
+
+def _open_store(source):
+    # a store from its shared memory name or file path
+    if isinstance(source, SharedStore): return source
+    if os.path.isfile(source): return SharedStore.open(source)
+    return SharedStore.attach(source)
+
+def attach(source):
+    # the SharedSymb / SharedRelMatrix / SharedSpaceReducer published under a name or path
+    store = _open_store(source)
+    if store.kind not in _kinds:
+        print(f"unknown store kind {store.kind}!")
+        raise ValueError
+    return _kinds[store.kind](store)
+
+class _Shared(object):
+    # pickles as the name or path of its store
+    def __reduce__(self):
+        return attach, (self.store.path if self.store.path is not None else self.store.name,)
+
+    def close(self, unlink=False):
+        # drop every view of the block before releasing it; the object is unusable afterwards
+        store = self.store
+        self.__dict__.clear()
+        self.store = store
+        store.close(unlink)
+
+########################################################################################################################
+# symbols
+########################################################################################################################
+
+class SharedSymb(_Shared, CompactSymb):
+    # read-only CompactSymb over a store; [] returns 0 for a missing key, as Symb
+    def __init__(self, store):
+        self.store = store
+        self.reptype, self.length = store.meta['reptype'], store.meta['length']
+        self.prefixes = compressed_prefixes[self.reptype] if self.reptype != "full" else ['']
+        self.basis, self.codes = store.arrays['basis'], store.arrays['codes']
+        self.coeffs, self.starts = store.arrays['coeffs'], store.arrays['starts']
+
+    def __repr__(self):
+        where = self.store.path if self.store.path is not None else f'shm {self.store.name}'
+        return f'SharedSymb({self.reptype}, {len(self)} terms, {self.length} letters per word, {where})'
+
+    def __getitem__(self, key):
+        return self.get(key, 0)
+
+def share_symb(symb, name=None, path=None):
+    '''
+    Publish a symbol once, for read-only use from other processes.
+    ---------
+    INPUTS:
+    symb: dict, Symb or CompactSymb; full, quad or oct format.
+    name: str or None; shared memory name (None: a random one, see .store.name).
+    path: str or None; publish to a memory-mapped file instead.
+
+    OUTPUTS:
+    shared: SharedSymb; pass it to workers (it pickles as its name), close(unlink=True) when done.
+    '''
+    if not isinstance(symb, CompactSymb): symb = CompactSymb.from_dict(symb)
+    arrays = {'basis': symb.basis, 'codes': symb.codes, 'coeffs': symb.coeffs, 'starts': symb.starts}
+    return SharedSymb(SharedStore.create('symb', {'reptype': symb.reptype, 'length': symb.length}, arrays,
+                                         name, path))
+
+########################################################################################################################
+# F/B space matrices
+########################################################################################################################
+
+class SharedRelMatrix(_Shared, RelMatrix):
+    # RelMatrix whose csr arrays live in a store
+    def __init__(self, store):
+        self.store = store
+        a = store.arrays
+        mat = sparse.csr_matrix((a['data'], a['indices'], a['indptr']), shape=tuple(store.meta['shape']), copy=False)
+        RelMatrix.__init__(self, mat, store.meta['scale'], store.meta['rownames'], store.meta['colnames'])
+
+def share_relmatrix(relmat, name=None, path=None):
+    # publish a RelMatrix (brel_matrix, frel_matrix, relperm_matrix); term and relation names go in the header
+    mat = relmat.mat
+    meta = {'shape': list(mat.shape), 'scale': relmat.scale, 'rownames': list(relmat.rownames),
+            'colnames': list(relmat.colnames)}
+    arrays = {'data': mat.data, 'indices': mat.indices, 'indptr': mat.indptr}
+    return SharedRelMatrix(SharedStore.create('relmatrix', meta, arrays, name, path))
+
+class SharedSpaceReducer(_Shared, SpaceReducer):
+    # SpaceReducer whose reduction matrix (row_of_code, indptr, indices, data) lives in a store
+    def __init__(self, store):
+        self.store = store
+        self.w, self.seam, self.scale = store.meta['w'], store.meta['seam'], store.meta['scale']
+        self.labelnames, self.max_colsum = store.meta['labelnames'], store.meta['max_colsum']
+        for k in ('row_of_code', 'indptr', 'indices', 'data'): setattr(self, k, store.arrays[k])
+
+def share_reducer(reducer, name=None, path=None):
+    # publish a SpaceReducer (breducer, freducer)
+    meta = {'w': reducer.w, 'seam': reducer.seam, 'scale': reducer.scale, 'labelnames': reducer.labelnames,
+            'max_colsum': reducer.max_colsum}
+    arrays = {k: getattr(reducer, k) for k in ('row_of_code', 'indptr', 'indices', 'data')}
+    return SharedSpaceReducer(SharedStore.create('reducer', meta, arrays, name, path))
+
+_kinds = {'symb': SharedSymb, 'relmatrix': SharedRelMatrix, 'reducer': SharedSpaceReducer}
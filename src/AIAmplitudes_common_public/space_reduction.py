@@ -0,0 +1,123 @@
+import math
+from fractions import Fraction
+import numpy as np
+from AIAmplitudes_common_public.file_readers import relpath
+from AIAmplitudes_common_public.fbspaces import get_brels, get_frels, get_rest_bspace, get_rest_fspace
+from AIAmplitudes_common_public.word_utils import symb_to_arrays, encode_words, decode_words, split_codes, pow6
+
+# Rewriting engine for the F/B space rels.
+# get_brels(w) maps every dependent w-letter word to a combination of independent words, and
+# get_rest_bspace(w) names the independent words Br_{w}_{i}.
+# Together they give a reduction matrix T (w-letter words x independent words), with T[indep, indep] = 1.
+# A symbol is reduced by replacing its last w letters (first w letters, for F) with their row of T:
+# one gather of the rows of T by word code, one scatter-add into (rest of word, independent word).
+# The result has keys like 'Br_4_3abcd', the same compressed form convert(..., "quad") produces.
+
+int64_max = np.iinfo(np.int64).max
+
+class SpaceReducer(object):
+    def __init__(self, rels, labels, w, seam="back"):
+        # rels: {dependent: {independent: coeff}}, labels: {independent: 'Br_w_i'}
+        if seam not in {"front", "back"}:
+            print("bad seam type!")
+            raise ValueError
+        self.w, self.seam = w, seam
+        self.labelnames = sorted(set(labels.values()), key=lambda l: int(l.split('_')[-1]))
+        label_index = {name: i for i, name in enumerate(self.labelnames)}
+
+        rows = {word: {label_index[label]: Fraction(1)} for word, label in labels.items()}
+        for dep, rhs in rels.items():
+            if dep in rows: continue
+            row = {}
+            for indep, c in rhs.items():
+                if indep is None: continue
+                if indep not in labels:
+                    print(f"{indep} is not an independent word at weight {w}!")
+                    raise KeyError(indep)
+                row[label_index[labels[indep]]] = row.get(label_index[labels[indep]], 0) + Fraction(c)
+            rows[dep] = {k: v for k, v in row.items() if v != 0}
+        self.scale = math.lcm(1, *(v.denominator for row in rows.values() for v in row.values()))
+
+        # T in csr form, rows addressed directly by word code
+        self.row_of_code = np.full(int(pow6(w)), -1, dtype=np.int64)
+        words = list(rows.keys())
+        self.row_of_code[encode_words(words, w)] = np.arange(len(words))
+        self.indptr = np.cumsum([0] + [len(rows[word]) for word in words]).astype(np.int64)
+        self.indices = np.array([k for word in words for k in rows[word]], dtype=np.int64)
+        self.data = np.array([int(v * self.scale) for word in words for v in rows[word].values()], dtype=np.int64)
+        # bound on how much a single output coefficient can grow, for the int64 overflow check
+        colsums = np.zeros(len(self.labelnames), dtype=np.int64)
+        np.add.at(colsums, self.indices, np.abs(self.data))
+        self.max_colsum = int(colsums.max()) if len(colsums) else 0
+
+    def __repr__(self):
+        return (f'SpaceReducer(w={self.w}, {self.seam}, {int((self.row_of_code >= 0).sum())} words'
+                f' onto {len(self.labelnames)} independent words)')
+
+    def reduce_arrays(self, codes, coeffs, length, strict=False):
+        '''
+        Reduce a symbol given as word codes to the independent basis.
+        ---------
+        INPUTS:
+        codes, coeffs: arrays; word codes (see word_utils) and integer coeffs.
+        length: int; number of letters per word.
+        strict: bool; if True, raise if a word's seam is neither dependent nor independent;
+                otherwise such words are dropped and counted.
+
+        OUTPUTS:
+        ctx: array; codes of the remaining length - w letters.
+        label: array; index into self.labelnames.
+        values: array; int64 if every coeff is an integer, otherwise object array of Fractions.
+        n_dropped: int; number of words whose seam is not in the space.
+        '''
+        if self.seam == "back":
+            ctx, seamcodes = split_codes(codes, length, self.w)
+        else:
+            seamcodes, ctx = split_codes(codes, length, length - self.w)
+        rows = self.row_of_code[seamcodes]
+        known = rows >= 0
+        if strict and not known.all():
+            print(f"{int((~known).sum())} words have a seam that is not in the space!")
+            raise KeyError
+        rows, ctx, coeffs = rows[known], ctx[known], np.asarray(coeffs, dtype=np.int64)[known]
+
+        # gather: one entry per (word, independent word in its row)
+        starts, counts = self.indptr[rows], self.indptr[rows + 1] - self.indptr[rows]
+        word_of_entry = np.repeat(np.arange(len(rows)), counts)
+        entry = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        label = self.indices[entry]
+        ctx_of_entry = ctx[word_of_entry]
+
+        # scatter-add on (ctx, label)
+        keys, inv = np.unique(ctx_of_entry * len(self.labelnames) + label, return_inverse=True)
+        inv = inv.ravel()
+        maxcoeff = int(np.abs(coeffs).max()) if len(coeffs) else 0
+        if maxcoeff * self.max_colsum <= int64_max:
+            scaled = np.zeros(len(keys), dtype=np.int64)
+            np.add.at(scaled, inv, coeffs[word_of_entry] * self.data[entry])
+        else:
+            scaled = np.zeros(len(keys), dtype=object)
+            np.add.at(scaled, inv, coeffs[word_of_entry].astype(object) * self.data[entry].astype(object))
+
+        nonzero = scaled != 0
+        keys, scaled = keys[nonzero], scaled[nonzero]
+        if self.scale == 1 or (scaled % self.scale == 0).all():
+            values = scaled // self.scale
+        else:
+            values = np.array([Fraction(int(v), self.scale) for v in scaled], dtype=object)
+        ctx, label = np.divmod(keys, len(self.labelnames))
+        return ctx, label, values, int((~known).sum())
+
+    def reduce_symb(self, symb, strict=False):
+        # {word: coeff} -> {'Br_w_i' + rest of word: coeff}
+        codes, coeffs, length = symb_to_arrays(symb)
+        ctx, label, values, _ = self.reduce_arrays(codes, coeffs, length, strict)
+        labels = np.array(self.labelnames, dtype=object)[label]
+        return {l + c: (v if isinstance(v, Fraction) and v.denominator != 1 else int(v))
+                for l, c, v in zip(labels, decode_words(ctx, length - self.w), values)}
+
+def breducer(w, mydir=relpath):
+    return SpaceReducer(get_brels(w, mydir), get_rest_bspace(w)[1], w, "back")
+
+def freducer(w, mydir=relpath):
+    return SpaceReducer(get_frels(w, mydir), get_rest_fspace(w)[1], w, "front")
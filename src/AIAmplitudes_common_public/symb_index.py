@@ -0,0 +1,177 @@
+import collections
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from AIAmplitudes_common_public.compact_symb import CompactSymb, encode_keys
+
+# On-disk, sorted word -> coefficient index, for coefficient lookups without loading the symbol.
+# Keys are the int64 (basis id, packed word) sort keys of CompactSymb, stored sorted, with int64 coefficients.
+# Layout of the file:
+#   a 4096-byte header: magic line + json (type, word length, number of entries, block size, offsets),
+#   the fences: the first key of every block of block_size entries, which is all that is held in memory,
+#   then either the raw keys and coefficients (memory-mapped), or one zlib blob per block
+#   (delta-encoded keys followed by coefficients), with the blob offsets.
+# A lookup is one binary search on the fences, then a search inside one block,
+# so it touches one block of the file whatever the size of the symbol.
+# A SymbIndex can be shared by threads (symb_server): blocks are read with os.pread, and the block cache is locked.
+#
+#   write_symb_index(Phi2Symb(8, "oct"), "oct8.idx", compress=True)
+#   idx = SymbIndex("oct8.idx")
+#   idx.lookup('Br_8_57abcdefab'), idx.lookup_many(words)
+
+magic = b'AIAMPLITUDES_SYMB_INDEX 1\n'
+header_size = 4096
+
+def write_symb_index(symb, path, block_size=4096, compress=False, level=6):
+    '''
+    Write a symbol to an on-disk index.
+    ---------
+    INPUTS:
+    symb: dict or CompactSymb; full, quad or oct format.
+    path: str; output file.
+    block_size: int; entries per block, i.e. per fence (and per zlib blob).
+    compress: bool; zlib-compress the blocks.
+    level: int; zlib level.
+
+    OUTPUTS:
+    path: str.
+    '''
+    if not isinstance(symb, CompactSymb): symb = CompactSymb.from_dict(symb)
+    keys, coeffs = symb.sortkeys(), symb.coeffs
+    n = len(keys)
+    starts = np.arange(0, n, block_size)
+    fences = keys[starts]
+    meta = {'reptype': symb.reptype, 'length': symb.length, 'n': n, 'block_size': block_size,
+            'compress': compress, 'fences': header_size}
+    with open(path, 'wb') as f:
+        f.write(b'\0' * header_size)
+        f.write(fences.tobytes())
+        if compress:
+            offsets = [0]
+            blobs = []
+            for s in starts:
+                k = keys[s:s + block_size]
+                blob = zlib.compress(np.concatenate([np.diff(k, prepend=k[0]), coeffs[s:s + block_size]]).tobytes(),
+                                     level)
+                blobs.append(blob)
+                offsets.append(offsets[-1] + len(blob))
+            meta['offsets'] = f.tell()
+            f.write(np.array(offsets, dtype=np.int64).tobytes())
+            meta['blocks'] = f.tell()
+            for blob in blobs: f.write(blob)
+        else:
+            meta['keys'] = f.tell()
+            f.write(keys.tobytes())
+            meta['coeffs'] = f.tell()
+            f.write(coeffs.tobytes())
+        head = magic + json.dumps(meta).encode('ascii')
+        if len(head) > header_size:
+            print("index header too long!")
+            raise ValueError
+        f.seek(0)
+        f.write(head)
+    return path
+
+class SymbIndex(object):
+    # read side of write_symb_index; only the fences (n / block_size keys) are read into memory
+    def __init__(self, path, cache_blocks=64):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(header_size)
+        if not head.startswith(magic):
+            print(f"{path} is not a symbol index!")
+            raise ValueError
+        self.meta = json.loads(head[len(magic):].rstrip(b'\0').decode('ascii'))
+        self.reptype, self.length, self.n = self.meta['reptype'], self.meta['length'], self.meta['n']
+        self.block_size = self.meta['block_size']
+        nblocks = -(-self.n // self.block_size)
+        self.fences = np.array(np.memmap(path, dtype=np.int64, mode='r', offset=self.meta['fences'], shape=(nblocks,)))
+        if self.meta['compress']:
+            self.offsets = np.array(np.memmap(path, dtype=np.int64, mode='r', offset=self.meta['offsets'],
+                                              shape=(nblocks + 1,)))
+            self.f = open(path, 'rb')
+            self.cache = collections.OrderedDict()
+            self.cache_blocks = cache_blocks
+            self.cache_lock = threading.Lock()
+        elif self.n:
+            self.keys = np.memmap(path, dtype=np.int64, mode='r', offset=self.meta['keys'], shape=(self.n,))
+            self.coeffs = np.memmap(path, dtype=np.int64, mode='r', offset=self.meta['coeffs'], shape=(self.n,))
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return (f"SymbIndex({self.path}, {self.reptype}, {self.n} terms"
+                f"{', compressed' if self.meta['compress'] else ''})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.meta['compress']: self.f.close()
+
+    def block(self, b):
+        # (keys, coeffs) of block b
+        if not self.meta['compress']:
+            s = b * self.block_size
+            return self.keys[s:s + self.block_size], self.coeffs[s:s + self.block_size]
+        with self.cache_lock:
+            if b in self.cache:
+                self.cache.move_to_end(b)
+                return self.cache[b]
+        # pread: no shared file position, so concurrent threads cannot interleave their reads
+        blob = os.pread(self.f.fileno(), int(self.offsets[b + 1] - self.offsets[b]),
+                        self.meta['blocks'] + int(self.offsets[b]))
+        arr = np.frombuffer(zlib.decompress(blob), dtype=np.int64)
+        half = len(arr) // 2
+        out = (self.fences[b] + np.cumsum(arr[:half]), arr[half:])
+        with self.cache_lock:
+            self.cache[b] = out
+            if len(self.cache) > self.cache_blocks: self.cache.popitem(last=False)
+        return out
+
+    def lookup_keys(self, sortkeys):
+        # int64 sort keys -> (coeffs, found); one pass over the blocks the keys fall in
+        sortkeys = np.asarray(sortkeys, dtype=np.int64)
+        values = np.zeros(len(sortkeys), dtype=np.int64)
+        found = np.zeros(len(sortkeys), dtype=bool)
+        if self.n == 0: return values, found
+        blocks = np.searchsorted(self.fences, sortkeys, side='right') - 1
+        valid = (blocks >= 0) & (sortkeys >= 0)
+        order = np.argsort(blocks, kind='stable')
+        order = order[valid[order]]
+        bounds = np.flatnonzero(np.diff(blocks[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group) == 0: continue
+            keys, coeffs = self.block(int(blocks[group[0]]))
+            pos = np.searchsorted(keys, sortkeys[group])
+            pos[pos == len(keys)] = 0
+            hit = keys[pos] == sortkeys[group]
+            values[group[hit]] = coeffs[pos[hit]]
+            found[group[hit]] = True
+        return values, found
+
+    def lookup_many(self, words, default=0):
+        # list of keys -> int64 array of coeffs; words not in the symbol get default (0, as get_coeff_from_word)
+        values, found = self.lookup_keys(encode_keys(list(words), self.reptype, self.length))
+        values[~found] = default
+        return values
+
+    def lookup(self, word, default=0):
+        return int(self.lookup_many([word], default)[0])
+
+    def __contains__(self, word):
+        return bool(self.lookup_keys(encode_keys([word], self.reptype, self.length))[1][0])
+
+    def __getitem__(self, word):
+        values, found = self.lookup_keys(encode_keys([word], self.reptype, self.length))
+        if not found[0]: raise KeyError(word)
+        return int(values[0])
+
+    def nblocks(self):
+        return len(self.fences)
@@ -0,0 +1,388 @@
+import argparse
+import json
+import os
+import select
+import socket
+import socketserver
+import struct
+import numpy as np
+from AIAmplitudes_common_public.compact_symb import CompactSymb, encode_keys
+from AIAmplitudes_common_public.file_readers import compressed_prefixes
+from AIAmplitudes_common_public.rel_matrices import RelResiduals, ContextNames, check_rels_in_symb
+from AIAmplitudes_common_public.symb_index import SymbIndex
+from AIAmplitudes_common_public.random_streams import stream
+from AIAmplitudes_common_public.word_utils import pow6, decode_words, symb_to_arrays
+
+# Local lookup daemon: one long-lived process holds the compiled symbols and F/B space rel matrices of a host,
+# and any number of jobs query it over a Unix socket instead of each loading Phi2Symb / Phi3Symb.
+# Every message is a frame
+#   <I payload length> <I request id> <B op> | <I json length> json {args, arrays: [[dtype, shape], ...]} | arrays
+# so bulk data (word codes, coeffs, residuals) travels as raw little-endian numpy buffers.
+# Ops: info (names, formats and sizes), lookup (int64 sort keys -> coeffs, found), residuals (check_rels_in_symb
+# of a rel matrix against a served symbol or a full-format symbol sent with the query), sample (random terms,
+# from a random_streams path, so a query is reproducible).
+# A connection serves requests in order; SymbClient keeps one connection open and can pipeline: submit sends
+# without waiting, result reads the replies (lookup_many keeps a window of batches in flight).
+#
+#   python -m AIAmplitudes_common_public.symb_server --socket /tmp/aiamp.sock --phi2 6 --phi2 8,oct --brel 3
+#   client = SymbClient("/tmp/aiamp.sock")
+#   symb = client.symb("phi2_8_oct")                           # RemoteSymb: symb[key], key in symb, get_many
+#   coeffs, found = client.lookup("phi2_8_oct", keys)
+#   res = client.residuals("brel_3", "phi2_6", w=3)            # RelResiduals, as check_rels_in_symb
+#   keys, coeffs = client.sample("phi2_8_oct", 1024, seed=0, path=("job", 3))
+
+ops = {'info': 1, 'lookup': 2, 'residuals': 3, 'sample': 4}
+status_ok, status_error = 0, 255
+_frame = struct.Struct('<IIB')
+_jsonlen = struct.Struct('<I')
+
+def pack_message(args, arrays=()):
+    # json args plus raw arrays -> bytes
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    head = json.dumps({'args': args, 'arrays': [[a.dtype.str, list(a.shape)] for a in arrays]}).encode('utf-8')
+    return b''.join([_jsonlen.pack(len(head)), head] + [a.tobytes() for a in arrays])
+
+def unpack_message(payload):
+    # bytes -> (args, [arrays]); the arrays are views of payload
+    n = _jsonlen.unpack_from(payload)[0]
+    head = json.loads(bytes(payload[4:4 + n]).decode('utf-8'))
+    arrays, offset = [], 4 + n
+    for dtype, shape in head['arrays']:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        arrays.append(np.frombuffer(payload, dtype=dtype, count=size // dtype.itemsize, offset=offset).reshape(shape))
+        offset += size
+    return head['args'], arrays
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view, got = memoryview(buf), 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if k == 0: raise ConnectionError("connection closed")
+        got += k
+    return buf
+
+def recv_frame(sock):
+    # (request id, op or status, payload)
+    n, rid, op = _frame.unpack(_recv_exact(sock, _frame.size))
+    return rid, op, _recv_exact(sock, n)
+
+def frame(rid, op, payload):
+    return _frame.pack(len(payload), rid, op) + payload
+
+########################################################################################################################
+# server
+########################################################################################################################
+
+class _ServedSymb(object):
+    # a served symbol: sorted int64 sort keys and coeffs, or an on-disk SymbIndex
+    def __init__(self, symb):
+        if isinstance(symb, str): symb = SymbIndex(symb)
+        if not isinstance(symb, (CompactSymb, SymbIndex)): symb = CompactSymb.from_dict(symb)
+        self.symb, self.reptype, self.length = symb, symb.reptype, symb.length
+        if isinstance(symb, CompactSymb): self.sortkeys = symb.sortkeys()
+
+    def __len__(self):
+        return len(self.symb)
+
+    def lookup(self, sortkeys):
+        if isinstance(self.symb, SymbIndex): return self.symb.lookup_keys(sortkeys)
+        keys = self.sortkeys
+        if len(keys) == 0: return np.zeros(len(sortkeys), dtype=np.int64), np.zeros(len(sortkeys), dtype=bool)
+        pos = np.searchsorted(keys, sortkeys)
+        pos[pos == len(keys)] = 0
+        found = keys[pos] == sortkeys
+        return np.where(found, self.symb.coeffs[pos], 0), found
+
+    def rows(self, idx):
+        # (sort keys, coeffs) of the terms at positions idx
+        if isinstance(self.symb, SymbIndex):
+            bs = self.symb.block_size
+            out_keys, out_coeffs = np.zeros(len(idx), dtype=np.int64), np.zeros(len(idx), dtype=np.int64)
+            for b in np.unique(idx // bs).tolist():
+                sel = np.flatnonzero(idx // bs == b)
+                keys, coeffs = self.symb.block(b)
+                out_keys[sel], out_coeffs[sel] = keys[idx[sel] - b * bs], coeffs[idx[sel] - b * bs]
+            return out_keys, out_coeffs
+        return self.sortkeys[idx], self.symb.coeffs[idx]
+
+class SymbServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Serve symbols and rel matrices on a Unix socket (see the comments at the top of the module).
+    ---------
+    INPUTS:
+    path: str; socket path (an existing socket file is replaced).
+    symbols: dict; {name: dict, CompactSymb, SharedSymb or symbol index path}.
+    relmats: dict; {name: RelMatrix}, e.g. brel_matrix(w).
+
+    OUTPUTS:
+    server: SymbServer; run with serve_forever(), stop with shutdown() and server_close().
+    '''
+    daemon_threads = True
+
+    def __init__(self, path, symbols=None, relmats=None):
+        self.symbols = {name: _ServedSymb(s) for name, s in (symbols or {}).items()}
+        self.relmats = dict(relmats or {})
+        if os.path.exists(path): os.remove(path)
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address): os.remove(self.server_address)
+
+    def symbol(self, name):
+        if name not in self.symbols:
+            print(f"unknown symbol {name}!")
+            raise KeyError(name)
+        return self.symbols[name]
+
+    def handle_info(self, args, arrays):
+        return {'symbols': {name: {'reptype': s.reptype, 'length': s.length, 'n': len(s)}
+                            for name, s in self.symbols.items()},
+                'relmats': {name: {'rownames': list(m.rownames), 'scale': m.scale, 'n': len(m)}
+                            for name, m in self.relmats.items()}}, []
+
+    def handle_lookup(self, args, arrays):
+        values, found = self.symbol(args['symb']).lookup(arrays[0].astype(np.int64))
+        return {}, [values, found]
+
+    def handle_residuals(self, args, arrays):
+        if args['relmat'] not in self.relmats:
+            print(f"unknown rel matrix {args['relmat']}!")
+            raise KeyError(args['relmat'])
+        if arrays:
+            codes, coeffs = arrays
+            symb = CompactSymb(np.zeros(len(codes), dtype=np.int16), codes, coeffs, args['length'])
+        else:
+            symb = self.symbol(args['symb']).symb
+            if isinstance(symb, SymbIndex) or symb.reptype != "full":
+                print("residuals need a full-format symbol held in memory!")
+                raise ValueError
+        res = check_rels_in_symb(self.relmats[args['relmat']], symb, args['w'], args.get('seam', "back"))
+        values = res.values
+        if values.dtype == object:
+            print("residuals overflow int64!")
+            raise OverflowError
+        return {'ctxlen': res.contexts.length}, [res.contexts.codes, res.rows, res.cols, values]
+
+    def handle_sample(self, args, arrays):
+        s = self.symbol(args['symb'])
+        rng = stream(args.get('seed', 0), *args.get('path', []), kind='numpy')
+        idx = rng.choice(len(s), size=min(args['n'], len(s)) if not args.get('replace') else args['n'],
+                         replace=bool(args.get('replace')))
+        return {}, list(s.rows(np.sort(idx) if args.get('sorted') else idx))
+
+_handlers = {ops['info']: SymbServer.handle_info, ops['lookup']: SymbServer.handle_lookup,
+             ops['residuals']: SymbServer.handle_residuals, ops['sample']: SymbServer.handle_sample}
+
+class _Handler(socketserver.BaseRequestHandler):
+    # one connection: requests are answered in order until the client closes it
+    def handle(self):
+        while True:
+            try: rid, op, payload = recv_frame(self.request)
+            except ConnectionError: return
+            try:
+                args, arrays = unpack_message(payload)
+                out = pack_message(*_handlers[op](self.server, args, arrays))
+                status = status_ok
+            except Exception as e:
+                out, status = pack_message({'error': f'{type(e).__name__}: {e}'}), status_error
+            self.request.sendall(frame(rid, status, out))
+
+def serve(path, symbols=None, relmats=None):
+    # blocking; for a background daemon run it in its own process (python -m ...symb_server)
+    with SymbServer(path, symbols, relmats) as server:
+        try: server.serve_forever()
+        finally:
+            if os.path.exists(path): os.remove(path)
+
+########################################################################################################################
+# client
+########################################################################################################################
+
+class SymbClient(object):
+    # one reusable connection; submit / result pipeline requests, the other methods wrap them
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.next_id, self.pending, self._info = 1, {}, None
+
+    def __reduce__(self):
+        # workers open their own connection
+        return SymbClient, (self.path,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def submit(self, op, args, arrays=()):
+        # send one request without waiting for the reply; returns its request id
+        rid = self.next_id
+        self.next_id = (self.next_id + 1) & 0xffffffff
+        self._send(frame(rid, ops[op], pack_message(args, arrays)))
+        return rid
+
+    def _send(self, data):
+        # write while draining replies: with large pipelined requests a plain sendall can deadlock, the server
+        # blocked writing a reply that nobody reads and the client blocked writing a request that nobody reads
+        view, sent = memoryview(data), 0
+        while sent < len(data):
+            readable, writable, _ = select.select([self.sock], [self.sock], [])
+            if readable:
+                r, status, payload = recv_frame(self.sock)
+                self.pending[r] = (status, payload)
+            if writable:
+                try: sent += self.sock.send(view[sent:], socket.MSG_DONTWAIT)
+                except BlockingIOError: pass
+
+    def result(self, rid):
+        # (args, arrays) of request rid; replies to other requests read meanwhile are kept for later
+        while rid not in self.pending:
+            r, status, payload = recv_frame(self.sock)
+            self.pending[r] = (status, payload)
+        status, payload = self.pending.pop(rid)
+        args, arrays = unpack_message(payload)
+        if status != status_ok:
+            print(f"symbol server error: {args['error']}")
+            raise ValueError(args['error'])
+        return args, arrays
+
+    def call(self, op, args, arrays=()):
+        return self.result(self.submit(op, args, arrays))
+
+    def info(self, refresh=False):
+        if self._info is None or refresh: self._info = self.call('info', {})[0]
+        return self._info
+
+    def sortkeys(self, name, keys):
+        # string keys -> the int64 sort keys of a served symbol (-1 for keys that cannot be in it)
+        meta = self.info()['symbols'][name]
+        return encode_keys(list(keys), meta['reptype'], meta['length'])
+
+    def lookup(self, name, keys):
+        # (int64 coeffs, found) of str keys, or of int64 sort keys
+        if not isinstance(keys, np.ndarray): keys = self.sortkeys(name, keys)
+        return tuple(self.call('lookup', {'symb': name}, [keys])[1])
+
+    def lookup_many(self, name, batches, window=32):
+        # pipelined: up to window batches are in flight, the replies of the others are read as they come
+        rids, out = [], []
+        for b in batches:
+            keys = b if isinstance(b, np.ndarray) else self.sortkeys(name, b)
+            rids.append(self.submit('lookup', {'symb': name}, [keys]))
+            if len(rids) - len(out) >= window: out.append(tuple(self.result(rids[len(out)])[1]))
+        out += [tuple(self.result(rid)[1]) for rid in rids[len(out):]]
+        return out
+
+    def residuals(self, relmat, symb, w, seam="back"):
+        '''
+        check_rels_in_symb on the server.
+        ---------
+        INPUTS:
+        relmat: str; name of a served RelMatrix.
+        symb: str or dict; name of a served full-format symbol, or a {word: coeff} symbol sent with the query.
+        w, seam: as check_rels_in_symb.
+
+        OUTPUTS:
+        residuals: RelResiduals; relmat is a stand-in with the rownames and scale of the served matrix.
+        '''
+        args = {'relmat': relmat, 'w': w, 'seam': seam}
+        if isinstance(symb, str):
+            args['symb'], arrays = symb, []
+        else:
+            codes, coeffs, args['length'] = symb_to_arrays(symb)
+            arrays = [codes, coeffs]
+        out, (contexts, rows, cols, values) = self.call('residuals', args, arrays)
+        return RelResiduals(_RelInfo(**self.info()['relmats'][relmat]), ContextNames(contexts, out['ctxlen']),
+                            rows, cols, values)
+
+    def sample(self, name, n, seed=0, path=(), replace=False, decode=True):
+        # n random terms (keys, coeffs) of a served symbol, drawn from stream(seed, *path)
+        _, (sortkeys, coeffs) = self.call('sample', {'symb': name, 'n': n, 'seed': seed, 'path': list(path),
+                                                     'replace': replace})
+        if not decode: return sortkeys, coeffs
+        return self.decode(name, sortkeys), coeffs
+
+    def decode(self, name, sortkeys):
+        meta = self.info()['symbols'][name]
+        basis, codes = np.divmod(sortkeys, pow6(meta['length']))
+        words = decode_words(codes, meta['length'])
+        if meta['reptype'] == "full": return words
+        return [compressed_prefixes[meta['reptype']][b] + w for b, w in zip(basis.tolist(), words)]
+
+    def symb(self, name):
+        return RemoteSymb(self, name)
+
+class _RelInfo(object):
+    # what RelResiduals needs of a RelMatrix
+    def __init__(self, rownames, scale, n):
+        self.rownames, self.scale, self.n = rownames, scale, n
+
+    def __len__(self):
+        return self.n
+
+class RemoteSymb(object):
+    # read-only view of a served symbol with the lookups of Symb ([] is 0 for a missing key, `in`, get)
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    def __reduce__(self):
+        return RemoteSymb, (self.client, self.name)
+
+    def __repr__(self):
+        return f"RemoteSymb({self.name} on {self.client.path})"
+
+    def __len__(self):
+        return self.client.info()['symbols'][self.name]['n']
+
+    def get_many(self, keys, default=0):
+        values, found = self.client.lookup(self.name, list(keys))
+        return np.where(found, values, default)
+
+    def get(self, key, default=None):
+        values, found = self.client.lookup(self.name, [key])
+        return int(values[0]) if found[0] else default
+
+    def __getitem__(self, key):
+        return self.get(key, 0)
+
+    def __contains__(self, key):
+        return bool(self.client.lookup(self.name, [key])[1][0])
+
+########################################################################################################################
+# daemon
+########################################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve symbols and rel matrices on a Unix socket.")
+    parser.add_argument('--socket', required=True)
+    parser.add_argument('--phi2', action='append', default=[], help="L or L,type (quad/oct); served as phi2_L[_type]")
+    parser.add_argument('--phi3', action='append', default=[], type=int, help="L; served as phi3_L")
+    parser.add_argument('--index', action='append', default=[], help="name=path of a symbol index file")
+    parser.add_argument('--brel', action='append', default=[], type=int, help="w; served as brel_w")
+    parser.add_argument('--frel', action='append', default=[], type=int, help="w; served as frel_w")
+    args = parser.parse_args(argv)
+    from AIAmplitudes_common_public import Phi2CompactSymb, Phi3Symb
+    from AIAmplitudes_common_public.rel_matrices import brel_matrix, frel_matrix
+    symbols, relmats = {}, {}
+    for spec in args.phi2:
+        L, _, type = spec.partition(',')
+        symbols[f"phi2_{L}" + (f"_{type}" if type else "")] = Phi2CompactSymb(int(L), type or None)
+    for L in args.phi3: symbols[f"phi3_{L}"] = Phi3Symb(L)
+    for spec in args.index:
+        name, _, path = spec.partition('=')
+        symbols[name] = path
+    for w in args.brel: relmats[f"brel_{w}"] = brel_matrix(w)
+    for w in args.frel: relmats[f"frel_{w}"] = frel_matrix(w)
+    serve(args.socket, symbols, relmats)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import os
+import random
+import tempfile
+from fractions import Fraction
+from pathlib import Path
+from AIAmplitudes_common_public.rels_utils import alphabet
+from AIAmplitudes_common_public.rel_registry import rel_family
+from AIAmplitudes_common_public.fbspaces import (B_number, F_number, bspacenames, brelnames,
+                                                 fspacenames, frelnames)
+
+# Offline generator of synthetic data files in the Maple format the loaders read.
+# The files have the same names, statement names and syntax as the real data in ~/.local/AIAmplitudesData
+# (Esymb[L]:=..., Esymbquad[L]:=[...], frontspace[w], multifinal_new_norm, sewrelsb[w], ...),
+# but the content is random: symbols are random coeffs on valid (non-trivial-zero) words,
+# spaces and relations are random sparse combinations. Only the parsing behaviour is realistic.
+# Point the loaders at the output by setting AIAMPLITUDES_DATA_DIR before importing the package,
+# or pass the directory explicitly where a loader takes one (convert, get_brels, get_relpermdict).
+
+forbidden_pairs = set(rel_family('double').terms)
+allowed_next = {l: [m for m in alphabet if l + m not in forbidden_pairs] for l in alphabet}
+first_letters = ['a', 'b', 'c']
+final_letters = ['d', 'e', 'f']
+
+symb_files = {"full": {'EZ_symb_new_norm': range(1, 6), 'EZ6_symb_new_norm': [6]},
+              "quad": {'EZ_symb_quad_new_norm': range(2, 7), 'EZ7_symb_quad_new_norm': [7]},
+              "oct": {'EZ_symb_oct_new_norm': range(5, 8), 'EZ8_symb_oct_new_norm': [8]},
+              "phi3": {'EE33_symb_new_norm': range(1, 6), 'EE33_6_symb_new_norm': [6]}}
+symb_prefixes = {"full": 'Esymb', "quad": 'Esymbquad', "oct": 'Esymboct', "phi3": 'Esymb'}
+n_compressed = {"quad": (4, 8), "oct": (8, 93)}  # letters absorbed by the prefix, number of prefixes
+
+########################################################################################################################
+# Maple syntax
+########################################################################################################################
+
+def maple_lines(statement, width=79):
+    # Maple's lprint: wrap long statements, every line but the last ending in a backslash
+    lines = [statement[i:i + width] for i in range(0, len(statement), width)]
+    return '\\\n'.join(lines) + '\n'
+
+def sb(word, sep=','):
+    return 'SB(' + sep.join(word) + ')'
+
+def term(coef, elem, first=False, mult='*'):
+    # Maple-style signed term: '16*SB(a,b)', '-SB(a,b)', '+2*SB(a,b)'
+    if coef == 1: prefix = '' if first else '+'
+    elif coef == -1: prefix = '-'
+    elif first or coef < 0: prefix = f'{coef}{mult}'
+    else: prefix = f'+{coef}{mult}'
+    return prefix + elem
+
+def linear_combination(terms, elem=sb):
+    # the first coefficient is always explicit, since convert cannot parse a bare leading 'SB('
+    out = []
+    for i, (word, coef) in enumerate(terms):
+        if i == 0 and coef == 1: out.append('1*' + elem(word))
+        else: out.append(term(coef, elem(word), first=(i == 0)))
+    return ''.join(out)
+
+########################################################################################################################
+# random content
+########################################################################################################################
+
+def random_valid_word(rng, length, final=True):
+    # random walk on the adjacency rules: no first entry in d,e,f, no final entry in a,b,c, no forbidden pair
+    if length == 0: return ''
+    word = [rng.choice(first_letters)]
+    for i in range(1, length):
+        choices = allowed_next[word[-1]]
+        if final and i == length - 1: choices = [l for l in choices if l in final_letters]
+        word.append(rng.choice(choices))
+    return ''.join(word)
+
+def random_valid_words(rng, length, n, final=True):
+    words = set()
+    for _ in range(20 * n + 100):
+        if len(words) >= n: break
+        words.add(random_valid_word(rng, length, final))
+    return sorted(words)
+
+def random_words(rng, length, n):
+    n = min(n, len(alphabet) ** length)
+    codes = rng.sample(range(len(alphabet) ** length), n)
+    out = []
+    for code in codes:
+        word = []
+        for _ in range(length):
+            code, i = divmod(code, len(alphabet))
+            word.append(alphabet[i])
+        out.append(''.join(word[::-1]))
+    return out
+
+rel_coefs = [1, -1, 2, -2, Fraction(1, 2), Fraction(-1, 2)]
+
+def random_coef(rng, cmax):
+    c = 0
+    while c == 0: c = rng.randint(-cmax, cmax)
+    return c
+
+########################################################################################################################
+# files
+########################################################################################################################
+
+def symb_statement(rng, reptype, loop, n_terms):
+    prefix = symb_prefixes[reptype]
+    cmax = 2 ** (loop + 3)
+    if reptype in n_compressed:
+        # one group of SB terms per prefix Br_4_i / Br_8_i, none of them empty
+        nlett, ngroups = n_compressed[reptype]
+        words = random_valid_words(rng, 2 * loop - nlett, max(n_terms, ngroups), final=False)
+        groups = [[words[g % len(words)]] for g in range(ngroups)]
+        for word in words[ngroups:]: groups[rng.randrange(ngroups)].append(word)
+        body = ','.join(linear_combination([(w, random_coef(rng, cmax)) for w in g]) for g in groups)
+        return f'{prefix}[{loop}]:=[{body}]:'
+    words = random_valid_words(rng, 2 * loop, n_terms)
+    return f'{prefix}[{loop}]:={linear_combination([(w, random_coef(rng, cmax)) for w in words])}:'
+
+def write_symb_files(relpath, rng, loops, reptype="full", n_terms=1000):
+    for filename, fileloops in symb_files[reptype].items():
+        todo = [L for L in fileloops if L in loops]
+        if not todo: continue
+        with open(f'{relpath}/{filename}', 'wt') as f:
+            for L in todo:
+                f.write(maple_lines(symb_statement(rng, reptype, L, n_terms)) + '\n')
+
+def perm_space_statement(rng, name, w, dim, maxterms=4):
+    elems = []
+    for _ in range(dim):
+        words = random_words(rng, w, rng.randint(1, maxterms))
+        elems.append(linear_combination([(word, random_coef(rng, 2)) for word in words]))
+    return f'{name}[{w}]:=[' + ','.join(elems) + ']:'
+
+def write_perm_spaces(relpath, rng, weights):
+    for name, dims in (('frontspace', F_number), ('backspace', B_number)):
+        with open(f'{relpath}/{name}', 'wt') as f:
+            for w in weights:
+                f.write(maple_lines(perm_space_statement(rng, name, w, dims[w])) + '\n')
+
+def space_rel_statements(rng, w, dim, indepname, relname, elem, maxterms=4):
+    # an independent set of dim words, and one relation per dependent word in terms of independent words
+    nrels = int(relname.split('rels')[-1])
+    words = random_words(rng, w, dim + nrels)
+    indep, dep = words[:dim], words[dim:]
+    rels = []
+    for word in dep:
+        if rng.random() < 0.2:
+            rels.append(f'{elem(word, ", ")} = 0')
+            continue
+        rhs = rng.sample(indep, min(len(indep), rng.randint(1, maxterms)))
+        rels.append(f'{elem(word, ", ")} = ' + ''.join(term(rng.choice(rel_coefs), elem(r, ", "), first=(i == 0))
+                                                        for i, r in enumerate(rhs)))
+    indepstatement = f'{indepname} := [' + ', '.join(elem(word, ", ") for word in indep) + '] :'
+    relstatement = f'{relname} := [' + ', '.join(rels) + '] :'
+    return indepstatement, relstatement
+
+def write_space_rels(relpath, rng, bweights, fweights):
+    def E(word, sep=','): return 'E(' + sep.join(word) + ')'
+    with open(f'{relpath}/multifinal_new_norm', 'wt') as f:
+        for w in bweights:
+            for statement in space_rel_statements(rng, w, min(B_number[w], 6 ** w // 2),
+                                                  bspacenames[w], brelnames[w], E):
+                f.write(maple_lines(statement) + '\n')
+    with open(f'{relpath}/ClipFrontTriple', 'wt') as f:
+        for w in fweights:
+            for statement in space_rel_statements(rng, w, min(F_number[w], 6 ** w // 2),
+                                                  fspacenames[w], frelnames[w], sb):
+                f.write(maple_lines(statement) + '\n')
+
+def sewrel_statement(rng, w, seam, nlett, n_rels, maxterms=5):
+    dim = (F_number if seam == "front" else B_number)[w]
+    prefix = "sewrelsf" if seam == "front" else "sewrelsb"
+    rels = []
+    for _ in range(n_rels):
+        terms = []
+        for i in range(rng.randint(2, maxterms)):
+            letters = [rng.choice(alphabet) for _ in range(nlett)]
+            idx = [str(rng.randrange(dim))]
+            cterm = ','.join(idx + letters if seam == "front" else letters + idx)
+            # readcrel needs an explicit sign or 'N*' before every term, including the first
+            c = rng.choice(rel_coefs)
+            if c == 1: terms.append('+')
+            elif c == -1: terms.append('-')
+            else: terms.append(f'{c}*' if (i == 0 or c < 0) else f'+{c}*')
+            terms.append(f'c[{cterm}]')
+        rels.append("'" + ''.join(terms) + "'")
+    return f'{prefix}[{w}] := [' + ', '.join(rels) + ']:'
+
+def write_sewrels(relpath, rng, weights, n_rels=20):
+    for seam, name in (("front", "Fspace"), ("back", "Bspace")):
+        for nlett, reltype in ((1, "oneletter"), (2, "twoletter")):
+            with open(f'{relpath}/{name}_rels_{reltype}', 'wt') as f:
+                for w in weights:
+                    f.write(maple_lines(sewrel_statement(rng, w, seam, nlett, n_rels)) + '\n')
+
+def poly_term(c, k, first=False):
+    if k == 0: return f'{c}' if first else f'{c:+d}'
+    return term(c, 'L' if k == 1 else f'L^{k}', first)
+
+def write_polynomials(relpath, rng, n_polys=200):
+    # {[run, lengths] = polynomial in L, ...}; as in the Maple output, there is no comma after the last entry
+    entries = []
+    for _ in range(n_polys):
+        key = ', '.join(str(rng.randint(0, 9)) for _ in range(rng.randint(2, 6)))
+        r = rng.random()
+        if r < 0.2: poly = '0'
+        elif r < 0.4: poly = f'{rng.randint(1, 9)}*(L-{rng.randint(1, 4)})*(L+{rng.randint(1, 4)})'
+        else:
+            deg = rng.randint(1, 3)
+            poly = ''.join(poly_term(random_coef(rng, 30), deg - i, i == 0) for i in range(deg + 1))
+        entries.append(f'[{key}] = {poly}')
+    with open(f'{relpath}/all7_new_common_factor', 'wt') as f:
+        f.write(maple_lines('all7_new_common_factor := {' + ', '.join(entries) + '}:') + '\n')
+
+def write_synthetic_data(relpath=None, loops=(1, 2, 3, 4), quad_loops=(3, 4), oct_loops=(5,),
+                         n_terms=1000, bspace_weights=tuple(range(1, 9)), fspace_weights=(1, 2, 3),
+                         perm_weights=(1, 2, 3, 4), n_sewrels=20, n_polys=200, phi3=True, seed=0):
+    '''
+    Write a complete synthetic data directory.
+    ---------
+    INPUTS:
+    relpath: str or None; output directory, a new temporary directory if None.
+    loops, quad_loops, oct_loops: loop orders of the full, quad and oct symbols.
+    n_terms: int; number of terms per symbol (capped by the number of valid words).
+    bspace_weights, fspace_weights: weights of the B/F spaces and rels (multifinal_new_norm, ClipFrontTriple).
+    perm_weights: weights of the permissive spaces (frontspace, backspace) and their sewing rels.
+    seed: int; everything is reproducible from the seed.
+
+    OUTPUTS:
+    relpath: Path; the directory written to.
+    '''
+    if relpath is None: relpath = tempfile.mkdtemp(prefix='AIAmplitudesData_')
+    relpath = Path(relpath)
+    os.makedirs(relpath, exist_ok=True)
+    rng = random.Random(seed)
+    write_symb_files(relpath, rng, loops, "full", n_terms)
+    write_symb_files(relpath, rng, quad_loops, "quad", n_terms)
+    write_symb_files(relpath, rng, oct_loops, "oct", n_terms)
+    if phi3: write_symb_files(relpath, rng, loops, "phi3", n_terms)
+    write_perm_spaces(relpath, rng, perm_weights)
+    write_space_rels(relpath, rng, bspace_weights, fspace_weights)
+    write_sewrels(relpath, rng, perm_weights, n_sewrels)
+    write_polynomials(relpath, rng, n_polys)
+    return relpath
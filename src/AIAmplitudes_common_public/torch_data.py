@@ -0,0 +1,190 @@
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from AIAmplitudes_common_public.compact_symb import CompactSymb, encode_keys
+from AIAmplitudes_common_public.file_readers import compressed_prefixes
+from AIAmplitudes_common_public.word_utils import codes_to_array, decode_words, pow6
+from AIAmplitudes_common_public.symb_index import SymbIndex
+from AIAmplitudes_common_public.sharding import ShardedSymb, key_reptype
+from AIAmplitudes_common_public.rels_utils import get_rel_terms_in_symb_per_word
+from AIAmplitudes_common_public.preprocessing import get_random_argsets
+from AIAmplitudes_common_public.random_streams import stream
+
+# Streaming torch dataset over a symbol, without a copy of the symbol per DataLoader worker.
+# The source is cut into units - blocks of a symbol index file (write_symb_index), shards of a ShardedSymb,
+# or row chunks of an in-memory CompactSymb or SharedSymb - and DataLoader worker w of rank r takes every G-th
+# unit (G = workers x world size). Index files and shards are opened lazily inside each worker, so a worker holds
+# one index block cache or a few shards whatever the number of workers (index pages are shared through the
+# OS page cache), and a CompactSymb is shared copy-on-write by forked workers (a SharedSymb by name, with any
+# start method).
+# Batches are encoded straight from the int64 word codes: letters (B, length) uint8, basis and coeff int64.
+# Optional hooks add relation instances (RelInstances) or operator instances (OpInstances) to every batch,
+# with per-worker random streams, so an epoch is reproducible for a given seed, epoch and number of workers.
+#
+#   ds = SymbStream("oct8.idx", batch_size=1024, shuffle=True, seed=0)
+#   loader = torch.utils.data.DataLoader(ds, batch_size=None, num_workers=8)
+#   for epoch in range(n): ds.set_epoch(epoch); for batch in loader: ...
+
+class _Source(object):
+    # units of rows: (int64 sort keys, int64 coeffs) per unit
+    def __init__(self, source, chunk_size):
+        self.chunk_size = chunk_size
+        if isinstance(source, SymbIndex): source = source.path
+        if isinstance(source, str):
+            try: source = SymbIndex(source)
+            except (ValueError, IsADirectoryError): source = ShardedSymb(source)
+        self.obj = source
+        if isinstance(source, SymbIndex):
+            self.reptype, self.length = source.reptype, source.length
+            self.n_units = source.nblocks()
+        elif isinstance(source, ShardedSymb):
+            self.labels = source.labels()
+            first = next(iter(source.shard(self.labels[0]))) if self.labels else ''
+            # meta has no reptype for shards written from an in-memory symbol before it was recorded: use the keys
+            self.reptype = source.meta['reptype'] if source.meta['reptype'] in {"quad", "oct", "full"} \
+                else key_reptype(first)
+            self.length = len(first) if self.reptype == "full" else len(first.lstrip('Br_0123456789'))
+            self.n_units = len(self.labels)
+        elif isinstance(source, CompactSymb):
+            self.reptype, self.length = source.reptype, source.length
+            self.n_units = -(-len(source) // chunk_size)
+        else:
+            print(f"cannot stream from {type(source).__name__}: use a symbol index, a ShardedSymb or a CompactSymb!")
+            raise ValueError
+        self.prefixes = compressed_prefixes[self.reptype] if self.reptype != "full" else ['']
+
+    def unit(self, u):
+        if isinstance(self.obj, SymbIndex):
+            keys, coeffs = self.obj.block(u)
+            return np.asarray(keys), np.asarray(coeffs)
+        if isinstance(self.obj, ShardedSymb):
+            shard = self.obj.shard(self.labels[u])
+            return (encode_keys(list(shard), self.reptype, self.length),
+                    np.fromiter(shard.values(), dtype=np.int64, count=len(shard)))
+        s = slice(u * self.chunk_size, (u + 1) * self.chunk_size)
+        return self.obj.basis[s].astype(np.int64) * pow6(self.length) + self.obj.codes[s], self.obj.coeffs[s]
+
+    def decode(self, sortkeys):
+        basis, codes = np.divmod(sortkeys, pow6(self.length))
+        words = decode_words(codes, self.length)
+        if self.reptype == "full": return words
+        return [self.prefixes[b] + w for b, w in zip(basis.tolist(), words)]
+
+class SymbStream(IterableDataset):
+    '''
+    Iterable dataset of batches of symbol terms, split across DataLoader workers (and ranks) without duplication.
+    ---------
+    INPUTS:
+    source: str, SymbIndex, ShardedSymb or CompactSymb; a path is opened as a symbol index file, else as a
+            shard directory.
+    batch_size: int; terms per batch (use DataLoader(..., batch_size=None)).
+    shuffle: bool; shuffle the units of every worker, and the rows within each unit.
+    seed: int; root seed of the shuffling and of the instance hooks.
+    drop_last: bool; drop the last incomplete batch of every worker.
+    with_keys: bool; add the string keys to every batch (they are built anyway when there is an instance hook).
+    instances: callable or None; instances(keys, lookup, rng) -> dict of extra batch fields, e.g. RelInstances
+               or OpInstances; lookup is the opened source (supports `in` and []), rng a random.Random.
+    rank, world_size: int; position of this process in a distributed job.
+    chunk_size: int; rows per unit for a CompactSymb.
+
+    OUTPUTS (per batch):
+    batch: dict; 'letters' (B, length) uint8 tensor of letter indices, 'basis' and 'coeff' int64 tensors,
+           plus 'keys' and the fields of the instance hook.
+    '''
+    def __init__(self, source, batch_size=1024, shuffle=False, seed=0, drop_last=False, with_keys=False,
+                 instances=None, rank=0, world_size=1, chunk_size=65536):
+        super().__init__()
+        self.source = source.path if isinstance(source, SymbIndex) else source
+        self.batch_size, self.shuffle, self.seed, self.drop_last = batch_size, shuffle, seed, drop_last
+        self.with_keys, self.instances = with_keys, instances
+        self.rank, self.world_size, self.chunk_size = rank, world_size, chunk_size
+        self.epoch = 0
+        self._opened = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def opened(self):
+        # the source, opened once per process
+        if self._opened is None: self._opened = _Source(self.source, self.chunk_size)
+        return self._opened
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_opened'] = None
+        return state
+
+    def worker_units(self):
+        # (global worker id, number of global workers, units of this worker)
+        info = get_worker_info()
+        wid, nw = (info.id, info.num_workers) if info is not None else (0, 1)
+        g, G = self.rank * nw + wid, self.world_size * nw
+        return g, G, np.arange(g, self.opened().n_units, G)
+
+    def __iter__(self):
+        src = self.opened()
+        g, G, units = self.worker_units()
+        rng = stream(self.seed, 'epoch', self.epoch, 'worker', g, 'of', G, kind='numpy')
+        py_rng = stream(self.seed, 'epoch', self.epoch, 'worker', g, 'of', G, 'instances')
+        if self.shuffle: units = rng.permutation(units)
+        keys_buf, coeffs_buf, n_buf = [], [], 0
+        for u in units.tolist():
+            keys, coeffs = src.unit(u)
+            if self.shuffle:
+                perm = rng.permutation(len(keys))
+                keys, coeffs = keys[perm], coeffs[perm]
+            keys_buf.append(keys); coeffs_buf.append(coeffs); n_buf += len(keys)
+            while n_buf >= self.batch_size:
+                keys, coeffs = np.concatenate(keys_buf), np.concatenate(coeffs_buf)
+                yield self.make_batch(src, keys[:self.batch_size], coeffs[:self.batch_size], py_rng)
+                keys_buf, coeffs_buf, n_buf = [keys[self.batch_size:]], [coeffs[self.batch_size:]], n_buf - self.batch_size
+        if n_buf and not self.drop_last:
+            yield self.make_batch(src, np.concatenate(keys_buf), np.concatenate(coeffs_buf), py_rng)
+
+    def make_batch(self, src, sortkeys, coeffs, py_rng):
+        basis, codes = np.divmod(sortkeys, pow6(src.length))
+        batch = {'letters': torch.from_numpy(codes_to_array(codes, src.length)),
+                 'basis': torch.from_numpy(basis.astype(np.int64)),
+                 'coeff': torch.from_numpy(np.ascontiguousarray(coeffs, dtype=np.int64))}
+        if self.with_keys or self.instances is not None:
+            keys = src.decode(sortkeys)
+            if self.with_keys: batch['keys'] = keys
+            if self.instances is not None: batch.update(self.instances(keys, src.obj, py_rng))
+        return batch
+
+########################################################################################################################
+# instance hooks
+########################################################################################################################
+
+class RelInstances(object):
+    # one relation per key, drawn among rels; the instances of that relation around the key, as
+    # get_rel_terms_in_symb_per_word ({word: [symb_coeff, rel_coeff]}, coeffs looked up in the streamed symbol)
+    def __init__(self, rels, rel_slot='final', format='full'):
+        self.rels, self.rel_slot, self.format = [r for r in rels if r is not None], rel_slot, format
+
+    def __call__(self, keys, lookup, rng):
+        rel_ids = [int(len(self.rels) * rng.random()) for _ in keys]
+        return {'rel_id': torch.tensor(rel_ids, dtype=torch.int64),
+                'rel_instances': [get_rel_terms_in_symb_per_word(k, lookup, self.rels[r], self.rel_slot, self.format)
+                                  for k, r in zip(keys, rel_ids)]}
+
+class OpInstances(object):
+    # one random argset per key (get_random_argsets), the target operator(key, *args) and its coeff in target
+    # (a symbol, symbol index path or ShardedSymb; default: the streamed symbol)
+    def __init__(self, operator, op_argdict, target=None):
+        self.operator, self.op_argdict, self.target = operator, op_argdict, target
+        self._target = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_target'] = None
+        return state
+
+    def __call__(self, keys, lookup, rng):
+        if self.target is not None and self._target is None:
+            self._target = _Source(self.target, 1).obj if isinstance(self.target, str) else self.target
+        target_symb = self._target if self.target is not None else lookup
+        args = get_random_argsets(self.op_argdict, len(keys), rng)
+        targets = [self.operator(k, *a) for k, a in zip(keys, args)]
+        coeffs = [target_symb[t] if t in target_symb else 0 for t in targets]
+        return {'op_args': args, 'targets': targets, 'target_coeff': torch.tensor(coeffs, dtype=torch.int64)}
@@ -0,0 +1,180 @@
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import alphabet, dihedral_table
+from AIAmplitudes_common_public.word_utils import nletters, max_word_len, pow6, codes_to_array, decode_words
+from AIAmplitudes_common_public.membership import max_plain_len, member_codes
+
+# Built-in word operators for opsymb_generator, applied to a whole symbol x argument grid as array operations.
+# Each operator is a WordOp: called as operation(word, *argtup) it is the plain string operator (so it can still be
+# given to get_mapdict), and for a list of argtups it compiles to a gather table
+#   idx  (n_args, out_len): for every output letter, the source letter it is taken from, or nletters + i for the
+#                           constant letter alphabet[i] (substitutions, inserted runs),
+#   perm (n_args, nletters): a letter map applied to every gathered letter (dihedral rotation), or None,
+# so that the target code of (word, argtup) is built by Horner's rule from columns of the source letter array:
+# out_len gathers of (n_words, n_args) uint8 arrays, with no per-pair python call.
+# Target codes feed the array lookups directly: CompactSymb.find / SymbIndex.lookup_keys (coeffs), and
+# member_id (= the membership.member_code of the word) for PackedSet / BloomFilter.contains_codes.
+# Argument tuples follow gen_op_args / get_random_argset: (slots, letters, sumtup, rot_ind), as used.
+#
+#   targets, out_len = strike.apply(encode_words(words), 12, args)      # (n_words, n_args) int64 codes
+#   bad = badset.contains_codes(member_id(targets, out_len))
+#   opsymb = opsymb_generator(symb, targetsymbs, bad_targets, substitute, gen_op_args(op_argdict))
+
+class WordOp(object):
+    # fn: the string operator; table: (argtup, word length) -> (idx list, perm tuple or None)
+    def __init__(self, name, fn, table):
+        self.name, self.fn, self.table = name, fn, table
+
+    def __repr__(self):
+        return f'WordOp({self.name})'
+
+    def __reduce__(self):
+        return _named_op, (self.name,)
+
+    def __call__(self, word, *args):
+        return self.fn(word, *args)
+
+    def compile(self, argtups, length):
+        '''
+        Gather tables of a list of argument tuples, for words of a given length.
+        ---------
+        INPUTS:
+        argtups: list of tuples; as the op_args of get_mapdict.
+        length: int; letters per source word.
+
+        OUTPUTS:
+        idx: (n_args, out_len) int64 array.
+        perm: (n_args, nletters) uint8 array or None.
+        out_len: int.
+        '''
+        tables = [self.table(args, length) for args in argtups]
+        lens = {len(idx) for idx, _ in tables}
+        if len(lens) > 1:
+            print(f"{self.name}: these arguments give targets of different lengths {sorted(lens)}, split them!")
+            raise ValueError
+        out_len = lens.pop() if lens else length
+        idx = np.array([idx for idx, _ in tables], dtype=np.int64).reshape(len(tables), out_len)
+        if all(p is None for _, p in tables): return idx, None, out_len
+        ident = tuple(range(nletters))
+        perm = np.array([ident if p is None else p for _, p in tables], dtype=np.uint8)
+        return idx, perm, out_len
+
+    def apply(self, codes, length, argtups=None, compiled=None):
+        '''
+        Apply the operator to every (word, argtup) pair.
+        ---------
+        INPUTS:
+        codes: int64 array; codes of the source words (word_utils), all of the same length.
+        length: int; letters per source word.
+        argtups: list of tuples, or compiled: the output of compile (to reuse it across chunks).
+
+        OUTPUTS:
+        targets: (n_words, n_args) int64 array of target codes.
+        out_len: int; letters per target word.
+        '''
+        idx, perm, out_len = self.compile(argtups, length) if compiled is None else compiled
+        if out_len > max_word_len:
+            print(f"cannot pack words longer than {max_word_len} letters!")
+            raise ValueError
+        letters = codes_to_array(codes, length)
+        ext = np.concatenate([letters, np.broadcast_to(np.arange(nletters, dtype=np.uint8),
+                                                       (len(letters), nletters))], axis=1)
+        rows = np.arange(len(idx))[None, :]
+        targets = np.zeros((len(letters), len(idx)), dtype=np.int64)
+        for j in range(out_len):
+            col = ext[:, idx[:, j]]
+            if perm is not None: col = perm[rows, col]
+            targets *= nletters
+            targets += col
+        return targets, out_len
+
+def member_id(codes, length):
+    # word codes -> membership.member_code of the words: '1' + letters in base 6 up to max_plain_len letters,
+    # beyond that member_code hashes the word (and 6**length + code would overflow int64)
+    if length > max_plain_len: return member_codes(decode_words(codes, length))
+    return np.asarray(codes, dtype=np.int64) + pow6(length)
+
+########################################################################################################################
+# the operators
+########################################################################################################################
+
+_letter_index = {l: i for i, l in enumerate(alphabet)}
+
+def _check_slots(slots, length):
+    if any(s < 0 or s >= length for s in slots) or len(set(slots)) != len(slots):
+        print(f"bad slots {slots} for a word of {length} letters!")
+        raise ValueError
+
+def strike_word(word, slots):
+    # delete the letters at slots
+    drop = set(slots)
+    return ''.join(l for i, l in enumerate(word) if i not in drop)
+
+def _strike_table(args, length):
+    slots = args[0]
+    _check_slots(slots, length)
+    drop = set(slots)
+    return [i for i in range(length) if i not in drop], None
+
+def substitute_word(word, slots, letters):
+    # replace the letter at slots[i] with letters[i]
+    out = list(word)
+    for s, l in zip(slots, letters): out[s] = l
+    return ''.join(out)
+
+def _substitute_table(args, length):
+    slots, letters = args[0], args[1]
+    _check_slots(slots, length)
+    idx = list(range(length))
+    for s, l in zip(slots, letters): idx[s] = length + _letter_index[l]
+    return idx, None
+
+def insert_runs_word(word, slots, letters, lengths):
+    # insert a run of lengths[i] letters letters[i] before position slots[i] of word (slots in the original word)
+    runs = {s: l * n for s, l, n in zip(slots, letters, lengths)}
+    return ''.join(runs.get(i, '') + l for i, l in enumerate(word)) + runs.get(len(word), '')
+
+def _insert_runs_table(args, length):
+    slots, letters, lengths = args[0], args[1], args[2]
+    if any(s < 0 or s > length for s in slots) or len(set(slots)) != len(slots):
+        print(f"bad insertion slots {slots} for a word of {length} letters!")
+        raise ValueError
+    runs = {s: [length + _letter_index[l]] * n for s, l, n in zip(slots, letters, lengths)}
+    idx = []
+    for i in range(length + 1):
+        idx += runs.get(i, [])
+        if i < length: idx.append(i)
+    return idx, None
+
+def rotate_word(word, rot_ind):
+    # dihedral image rot_ind of word (a row of dihedral_table, as get_dihedral_images)
+    return ''.join(dihedral_table[rot_ind][_letter_index[l]] for l in word)
+
+def _rotate_table(args, length):
+    return list(range(length)), tuple(_letter_index[l] for l in dihedral_table[args[0]])
+
+def swap_word(word, slots):
+    # exchange the letters at slots[0] and slots[1], slots[2] and slots[3], ...
+    out = list(word)
+    for a, b in zip(slots[0::2], slots[1::2]): out[a], out[b] = out[b], out[a]
+    return ''.join(out)
+
+def _swap_table(args, length):
+    slots = args[0]
+    _check_slots(slots, length)
+    if len(slots) % 2:
+        print(f"swap needs an even number of slots, got {slots}!")
+        raise ValueError
+    idx = list(range(length))
+    for a, b in zip(slots[0::2], slots[1::2]): idx[a], idx[b] = idx[b], idx[a]
+    return idx, None
+
+strike = WordOp('strike', strike_word, _strike_table)
+substitute = WordOp('substitute', substitute_word, _substitute_table)
+insert_runs = WordOp('insert_runs', insert_runs_word, _insert_runs_table)
+rotate = WordOp('rotate', rotate_word, _rotate_table)
+swap = WordOp('swap', swap_word, _swap_table)
+
+word_ops = {op.name: op for op in (strike, substitute, insert_runs, rotate, swap)}
+
+def _named_op(name):
+    return word_ops[name]
@@ -0,0 +1,199 @@
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import alphabet, quad_prefix
+from AIAmplitudes_common_public.word_utils import (nletters, max_word_len, valid_first, valid_last, valid_next,
+                                                   array_to_codes, array_to_words, words_to_array)
+
+# Batch generation of random non-trivial-zero words.
+# The adjacency rules are a 6x6 transition matrix (valid_next), plus masks for the first and last letters.
+# A word is a random walk on that matrix; at every step the next letter is drawn among the letters that
+# are allowed after the previous one AND from which the rest of the word can still be completed
+# (a backward reachability pass, so fixed suffixes and the last-letter rule never lead to a dead end).
+# All N words advance one letter per step, so drawing N words of length L costs L vectorized steps.
+# With the default weights every allowed letter is equally likely, as in gen_let / gen_valid_substr.
+#
+#   sampler = WordSampler(12, rng=np.random.default_rng(0))
+#   words = sampler.sample_words(10**6)
+#   WordSampler(12, prefix='ab', suffix='ff').sample_codes(1000)
+
+class WordSampler(object):
+    '''
+    Random walk sampler of valid words.
+    ---------
+    INPUTS:
+    length: int; number of letters per word, including prefix and suffix.
+    format: str; "full", or "quad" for a quad_prefix letter followed by the word (as generate_random_word).
+            quad words do not end the symbol, so the last-letter rule does not apply to them.
+    prefix, suffix: str or None; fixed first / last letters of every word.
+    weights: (6, 6) array or None; relative weight of each letter after each letter, applied on top of the rules.
+    first_weights: (6,) array or None; relative weight of each first letter.
+    final: bool or None; whether the last letter must be a valid final entry (default: True for "full").
+    rng: np.random.Generator, int seed or None.
+    '''
+    def __init__(self, length, format="full", prefix=None, suffix=None, weights=None, first_weights=None,
+                 final=None, rng=None):
+        if format not in {"full", "quad"}:
+            print("Error, bad format!")
+            raise ValueError
+        prefix, suffix = prefix or '', suffix or ''
+        if len(prefix) + len(suffix) > length:
+            print(f"prefix and suffix do not fit in {length} letters!")
+            raise ValueError
+        self.length, self.format, self.prefix, self.suffix = length, format, prefix, suffix
+        self.final = (format == "full") if final is None else final
+        self.rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+        # allowed letters at every position, and transition weights
+        allowed = np.ones((length, nletters), dtype=bool)
+        if length: allowed[0] &= valid_first
+        if self.final and length: allowed[-1] &= valid_last
+        for i, l in enumerate(prefix): allowed[i] &= np.arange(nletters) == alphabet.index(l)
+        for i, l in enumerate(suffix): allowed[length - len(suffix) + i] &= np.arange(nletters) == alphabet.index(l)
+        W = valid_next * (np.ones((nletters, nletters)) if weights is None else np.asarray(weights, dtype=float))
+        w0 = np.ones(nletters) if first_weights is None else np.asarray(first_weights, dtype=float)
+
+        # feasible[i, x]: letter x at position i can be completed to a full valid word
+        feasible = allowed.copy()
+        for i in range(length - 2, -1, -1):
+            feasible[i] &= (W[:, feasible[i + 1]] > 0).any(axis=1)
+        if length and not feasible[0].any():
+            print("no valid word satisfies these constraints!")
+            raise ValueError
+
+        # cumulative distributions: cdf0 for the first letter, cdfs[i][x] for position i after letter x
+        self.cdf0 = self.to_cdf(w0 * feasible[0]) if length else None
+        self.cdfs = [self.to_cdf(W * feasible[i][None, :]) for i in range(1, length)]
+
+    def __repr__(self):
+        return (f'WordSampler({self.length} letters, {self.format}, prefix={self.prefix!r}, '
+                f'suffix={self.suffix!r}, final={self.final})')
+
+    @staticmethod
+    def to_cdf(w):
+        w = np.atleast_2d(w).astype(float)
+        total = w.sum(axis=-1, keepdims=True)
+        cdf = np.cumsum(w, axis=-1) / np.where(total > 0, total, 1)
+        cdf[..., -1] = np.where(total[..., 0] > 0, 1., 0.)  # exact 1, so a uniform draw never falls off the end
+        return cdf
+
+    def sample_letters(self, n):
+        # (n, length) uint8 array of letter indices
+        letters = np.zeros((n, self.length), dtype=np.uint8)
+        if self.length == 0 or n == 0: return letters
+        u = self.rng.random((n, self.length))
+        letters[:, 0] = (u[:, :1] >= self.cdf0[0][None, :]).sum(axis=1)
+        for i in range(1, self.length):
+            letters[:, i] = (u[:, i:i + 1] >= self.cdfs[i - 1][letters[:, i - 1]]).sum(axis=1)
+        return letters
+
+    def sample_codes(self, n):
+        # word codes, see word_utils; the quad prefix letter is not part of the code
+        return array_to_codes(self.sample_letters(n))
+
+    def sample_words(self, n):
+        words = array_to_words(self.sample_letters(n))
+        if self.format == "quad":
+            pre = self.rng.integers(len(quad_prefix), size=n)
+            words = [quad_prefix[p] + w for p, w in zip(pre.tolist(), words)]
+        return words
+
+def is_valid_word(words, final=True):
+    # vectorized trivial-zero check on a list of words of equal length: True where the word is not a trivial zero
+    letters = words_to_array(words)
+    if letters.shape[1] == 0: return np.ones(len(words), dtype=bool)
+    ok = valid_first[letters[:, 0]]
+    if final: ok &= valid_last[letters[:, -1]]
+    return ok & valid_next[letters[:, :-1], letters[:, 1:]].all(axis=1)
+
+########################################################################################################################
+# exact counting, ranking and unranking
+########################################################################################################################
+
+class ValidWords(object):
+    '''
+    The valid (non-trivial-zero) words of a given length, in lexicographic order, counted by dynamic programming.
+    ---------
+    INPUTS:
+    length: int; number of letters, at most word_utils.max_word_len.
+    final: bool; whether the last letter must be a valid final entry (False for the word part of quad/oct keys).
+
+    ways[i, x] is the number of valid ways to finish a word that has letter x at position i,
+    so the number of valid words is the sum of ways[0] over the valid first letters,
+    and the word of a given rank is found by walking down the table, one letter per position.
+    '''
+    def __init__(self, length, final=True):
+        if length > max_word_len:
+            print(f"cannot count words longer than {max_word_len} letters!")
+            raise ValueError
+        self.length, self.final = length, final
+        nxt = valid_next.astype(np.int64)
+        ways = np.zeros((length, nletters), dtype=np.int64)
+        if length:
+            ways[-1] = valid_last if final else 1
+            for i in range(length - 2, -1, -1): ways[i] = nxt @ ways[i + 1]
+        self.ways = ways
+        # starts0[x]: rank of the first word starting with x; starts[i][p, x]: same, after letter p at position i-1
+        first = np.where(valid_first, ways[0], 0) if length else np.zeros(nletters, dtype=np.int64)
+        self.total = int(first.sum()) if length else 1
+        self.starts0 = np.cumsum(first) - first
+        self.starts = [np.cumsum(nxt * ways[i][None, :], axis=1) - nxt * ways[i][None, :] for i in range(1, length)]
+
+    def __len__(self):
+        return self.total
+
+    def __repr__(self):
+        return f'ValidWords({self.length} letters, final={self.final}, {self.total} words)'
+
+    def unrank_letters(self, ranks):
+        # ranks in [0, total) -> (n, length) letter arrays, in lexicographic order of the words
+        ranks = np.array(ranks, dtype=np.int64, ndmin=1)
+        if ((ranks < 0) | (ranks >= self.total)).any():
+            print(f"ranks must be in [0, {self.total})!")
+            raise ValueError
+        letters = np.zeros((len(ranks), self.length), dtype=np.uint8)
+        if self.length == 0: return letters
+        # the letter is the last one whose start is <= the remaining rank;
+        # letters with no completions share their start with the next letter, so they are never picked
+        rest = ranks.copy()
+        x = (rest[:, None] >= self.starts0[None, :]).sum(axis=1) - 1
+        rest -= self.starts0[x]
+        letters[:, 0] = x
+        for i in range(1, self.length):
+            st = self.starts[i - 1][x]
+            y = (rest[:, None] >= st).sum(axis=1) - 1
+            rest -= st[np.arange(len(y)), y]
+            letters[:, i] = x = y
+        return letters
+
+    def unrank(self, ranks):
+        return array_to_words(self.unrank_letters(ranks))
+
+    def rank(self, words):
+        # lexicographic rank of each valid word; -1 for words that are trivial zeros
+        letters = words_to_array(words, self.length).astype(np.int64)
+        ranks = np.zeros(len(letters), dtype=np.int64)
+        if self.length == 0: return ranks
+        ok = is_valid_word(words, self.final) if len(letters) else np.zeros(0, dtype=bool)
+        ranks += self.starts0[letters[:, 0]]
+        for i in range(1, self.length):
+            ranks += self.starts[i - 1][letters[:, i - 1], letters[:, i]]
+        return np.where(ok, ranks, -1)
+
+    def enumerate(self, start=0, stop=None):
+        # the valid words with ranks in [start, stop), e.g. one shard of the full enumeration
+        stop = self.total if stop is None else min(stop, self.total)
+        return self.unrank(np.arange(start, stop, dtype=np.int64))
+
+    def shard(self, i, nshards):
+        # rank range of shard i out of nshards, as equal as possible
+        return (self.total * i) // nshards, (self.total * (i + 1)) // nshards
+
+    def sample(self, n, rng=None):
+        # n words drawn uniformly (with replacement) among all the valid words
+        rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+        return self.unrank(rng.integers(0, self.total, size=n))
+
+    def coverage(self, symb):
+        # number of valid words of this length present in a full-format symbol, and the fraction of all valid words
+        words = [w for w in symb if len(w) == self.length]
+        n = int(is_valid_word(words, self.final).sum()) if words else 0
+        return n, n / self.total
@@ -0,0 +1,102 @@
+import numpy as np
+from AIAmplitudes_common_public.rels_utils import (alphabet, first_entry_rel_table, final_entries_rel_table,
+                                                   double_adjacency_rel_table, get_rel_table_dihedral)
+
+# Integer encodings of words, so that whole symbols can be handled as numpy arrays.
+# A word of n letters is read as a base-6 number with 'a'=0,...,'f'=5 (first letter most significant),
+# so codes of words with the same length sort in the same order as the strings,
+# and the first k letters of a word are simply code // 6**(n-k), the last k letters code % 6**k.
+# int64 holds words of up to 24 letters (6**24 < 2**63), i.e. up to loop 12 in the full format.
+
+nletters = len(alphabet)
+max_word_len = 24
+
+_letter_to_int = np.full(256, -1, dtype=np.int8)
+for _i, _l in enumerate(alphabet): _letter_to_int[ord(_l)] = _i
+_int_to_letter = np.frombuffer(''.join(alphabet).encode('ascii'), dtype=np.uint8)
+
+# the trivial zero rules as letter masks: allowed first letters, allowed last letters, allowed adjacent pairs
+valid_first = np.ones(nletters, dtype=bool)
+valid_first[[alphabet.index(next(iter(rel))) for rel in first_entry_rel_table[:3]]] = False
+valid_last = np.ones(nletters, dtype=bool)
+valid_last[[alphabet.index(next(iter(rel))) for rel in final_entries_rel_table[:3]]] = False
+valid_next = np.ones((nletters, nletters), dtype=bool)
+for _rel in get_rel_table_dihedral(double_adjacency_rel_table):
+    for _pair in _rel: valid_next[alphabet.index(_pair[0]), alphabet.index(_pair[1])] = False
+
+def pow6(k):
+    return np.int64(nletters) ** np.int64(k)
+
+def words_to_array(words, length=None):
+    # list of equal-length words -> (N, length) uint8 array of letter indices
+    words = list(words)
+    if len(words) == 0:
+        return np.zeros((0, 0 if length is None else length), dtype=np.uint8)
+    if length is None: length = len(words[0])
+    if any(len(word) != length for word in words):
+        raise ValueError(f"words must all have {length} letters!")
+    raw = np.frombuffer(''.join(words).encode('ascii'), dtype=np.uint8)
+    letters = _letter_to_int[raw]
+    if (letters < 0).any():
+        raise ValueError("words must only contain letters from the alphabet!")
+    return letters.astype(np.uint8).reshape(len(words), length)
+
+def array_to_words(letters):
+    # (N, length) array of letter indices -> list of words
+    letters = np.asarray(letters, dtype=np.uint8)
+    if letters.shape[0] == 0: return []
+    if letters.shape[1] == 0: return [''] * letters.shape[0]
+    raw = np.ascontiguousarray(_int_to_letter[letters])
+    return raw.view(f'S{letters.shape[1]}').ravel().astype(str).tolist()
+
+def array_to_codes(letters):
+    letters = np.asarray(letters)
+    if letters.shape[1] > max_word_len:
+        raise ValueError(f"cannot pack words longer than {max_word_len} letters!")
+    codes = np.zeros(letters.shape[0], dtype=np.int64)
+    for i in range(letters.shape[1]):
+        codes = codes * nletters + letters[:, i]
+    return codes
+
+def codes_to_array(codes, length):
+    codes = np.asarray(codes, dtype=np.int64)
+    letters = np.zeros((codes.shape[0], length), dtype=np.uint8)
+    rest = codes.copy()
+    for i in range(length - 1, -1, -1):
+        rest, letters[:, i] = np.divmod(rest, nletters)
+    return letters
+
+def encode_words(words, length=None):
+    # list of equal-length words -> int64 codes
+    return array_to_codes(words_to_array(words, length))
+
+def decode_words(codes, length):
+    # int64 codes -> list of words of the given length
+    return array_to_words(codes_to_array(codes, length))
+
+def encode_word(word):
+    code = 0
+    for l in word: code = code * nletters + alphabet.index(l)
+    return code
+
+def decode_word(code, length):
+    word = []
+    for _ in range(length):
+        code, i = divmod(int(code), nletters)
+        word.append(alphabet[i])
+    return ''.join(word[::-1])
+
+def split_codes(codes, length, k):
+    # split codes of words of the given length into (first length-k letters, last k letters)
+    return np.divmod(np.asarray(codes, dtype=np.int64), pow6(k))
+
+def symb_to_arrays(symb):
+    # full-format symbol -> (word codes, int64 coeffs, word length); a full CompactSymb is used as is
+    if getattr(symb, 'reptype', None) == "full" and hasattr(symb, 'codes'):
+        return symb.codes, symb.coeffs, symb.length
+    words = list(symb.keys())
+    if len(words) == 0: return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0
+    length = len(words[0])
+    codes = encode_words(words, length)
+    coeffs = np.fromiter(symb.values(), dtype=np.int64, count=len(words))
+    return codes, coeffs, length